@@ -0,0 +1,396 @@
+"""
+Agrégats précalculés sur les données d'incidents
+
+Les compteurs sont construits en une seule passe np.bincount sur les codes
+calculés à l'ingestion par DataManager. Les callbacks répondent ensuite aux
+filtres par découpage et sommation de tableaux, sans regrouper les lignes.
+
+Chaque dimension possède une case supplémentaire en fin d'axe pour les valeurs
+manquantes: elle est incluse dans les totaux « tous » mais jamais affichée.
+"""
+
+from typing import Any, Dict, List, Optional, Sequence, Union
+
+import numpy as np
+import pandas as pd
+
+CUBE_DIMS = ('pdq', 'year', 'month', 'category', 'shift', 'day_type')
+
+# Sélection sur un axe: un code, une liste de codes ou None (tous)
+CodeSelection = Union[int, Sequence[int], None]
+
+
+def _codes(values: np.ndarray, size: int) -> np.ndarray:
+    """Remplace les codes manquants (<0 ou >= size) par la case « manquant » (size)"""
+    values = np.asarray(values)
+    out = values.astype(np.int64, copy=True)
+    out[(values < 0) | (values >= size)] = size
+    return out
+
+
+def pdq_axis(df: pd.DataFrame) -> List[int]:
+    """Numéros de PDQ présents dans les données, triés"""
+    return sorted(int(p) for p in df['PDQ'].dropna().unique())
+
+
+def pdq_codes(df: pd.DataFrame, pdqs: Sequence[int]) -> np.ndarray:
+    """Code de PDQ par ligne (len(pdqs) pour un PDQ manquant)"""
+    pdq_values = np.asarray(pdqs, dtype=np.float64)
+    raw = df['PDQ'].to_numpy(dtype=np.float64, na_value=np.nan)
+    codes = np.searchsorted(pdq_values, raw)
+    codes = np.minimum(codes, len(pdq_values))
+    found = np.zeros(len(raw), dtype=bool)
+    valid = codes < len(pdq_values)
+    found[valid] = pdq_values[codes[valid]] == raw[valid]
+    codes[~found] = len(pdq_values)
+    return codes
+
+
+class CountCube:
+    """
+    Tableau de comptes multidimensionnel (une case de plus par axe pour « manquant »)
+
+    Attributes:
+        counts: ndarray de forme (len(labels[d]) + 1 for d in dims)
+        dims: Noms des axes
+        labels: Libellés affichables par axe (sans la case « manquant »)
+    """
+
+    def __init__(self, counts: np.ndarray, dims: Sequence[str], labels: Dict[str, List[Any]]):
+        self.counts = counts
+        self.dims = tuple(dims)
+        self.labels = labels
+
+    def axis(self, dim: str) -> int:
+        return self.dims.index(dim)
+
+    def index_of(self, dim: str, values) -> List[int]:
+        """Codes des libellés demandés sur un axe (les valeurs inconnues sont ignorées)"""
+        labels = self.labels[dim]
+        lookup = {label: i for i, label in enumerate(labels)}
+        return [lookup[v] for v in values if v in lookup]
+
+    def sum(self, keep: Sequence[str] = (), drop_missing: bool = True, **selections) -> np.ndarray:
+        """
+        Somme le cube sur tous les axes non conservés
+
+        Args:
+            keep: Axes conservés, dans l'ordre voulu pour le résultat
+            drop_missing: Retire la case « manquant » des axes conservés
+            **selections: Par axe, un code, une liste de codes ou une tranche
+
+        Returns:
+            ndarray dont les axes sont ceux de `keep`
+        """
+        cube = self.counts
+        for dim, selection in selections.items():
+            if selection is None:
+                continue
+            axis = self.axis(dim)
+            if isinstance(selection, slice):
+                index = [slice(None)] * cube.ndim
+                index[axis] = selection
+                cube = cube[tuple(index)]
+            else:
+                if np.isscalar(selection):
+                    selection = [selection]
+                cube = np.take(cube, np.asarray(selection, dtype=np.int64), axis=axis)
+
+        summed_axes = tuple(i for i, d in enumerate(self.dims) if d not in keep)
+        result = cube.sum(axis=summed_axes) if summed_axes else cube
+        remaining = [d for d in self.dims if d in keep]
+        result = np.moveaxis(result, [remaining.index(d) for d in keep], range(len(keep)))
+
+        if drop_missing:
+            for axis, dim in enumerate(keep):
+                if dim in selections and selections[dim] is not None:
+                    continue
+                index = [slice(None)] * result.ndim
+                index[axis] = slice(0, len(self.labels[dim]))
+                result = result[tuple(index)]
+        return result
+
+    @property
+    def nbytes(self) -> int:
+        return self.counts.nbytes
+
+
+def build_count_cube(df: pd.DataFrame, category_labels: List[str],
+                     weights: Optional[np.ndarray] = None) -> CountCube:
+    """
+    Construit le cube (pdq, year, month, category, shift, day_type) en un np.bincount
+
+    Args:
+        df: Données préparées par DataManager (codes normalisés), ou lignes
+            déjà regroupées avec leur nombre d'incidents dans weights
+        category_labels: Libellés des catégories indexés par CATEGORY_CODE
+        weights: Nombre d'incidents par ligne (défaut: 1)
+    """
+    pdqs = pdq_axis(df)
+    years_raw = df['YEAR'].to_numpy(dtype=np.float64, na_value=np.nan)
+    valid_years = years_raw[~np.isnan(years_raw)]
+    first_year = int(valid_years.min()) if len(valid_years) else 0
+    last_year = int(valid_years.max()) if len(valid_years) else -1
+    years = list(range(first_year, last_year + 1))
+
+    labels = {
+        'pdq': pdqs,
+        'year': years,
+        'month': list(range(1, 13)),
+        'category': list(category_labels),
+        'shift': ['jour', 'soir', 'nuit'],
+        'day_type': ['Weekday', 'Weekend'],
+    }
+    shape = tuple(len(labels[d]) + 1 for d in CUBE_DIMS)
+
+    year_codes = np.where(np.isnan(years_raw), -1, years_raw - first_year).astype(np.int64)
+    months = df['MONTH'].to_numpy(dtype=np.float64, na_value=np.nan)
+    month_codes = np.where(np.isnan(months), -1, months - 1).astype(np.int64)
+    day_of_week = (df['DayOfWeek'] if 'DayOfWeek' in df.columns else df['DATE'].dt.dayofweek)
+    day_of_week = day_of_week.to_numpy(dtype=np.float64, na_value=np.nan)
+    day_type_codes = np.where(np.isnan(day_of_week), -1, day_of_week >= 5).astype(np.int64)
+    shift = df['SHIFT_CODE'].to_numpy() if 'SHIFT_CODE' in df.columns else np.full(len(df), -1)
+
+    codes = (
+        pdq_codes(df, pdqs),
+        _codes(year_codes, len(years)),
+        _codes(month_codes, 12),
+        _codes(df['CATEGORY_CODE'].to_numpy(), len(category_labels)),
+        _codes(shift, 3),
+        _codes(day_type_codes, 2),
+    )
+    flat = np.ravel_multi_index(codes, shape)
+    counts = np.bincount(flat, weights=weights, minlength=int(np.prod(shape))).reshape(shape)
+    return CountCube(counts.astype(np.int32), CUBE_DIMS, labels)
+
+
+def month_to_season_matrix() -> np.ndarray:
+    """Matrice (12 mois x 4 saisons) pour replier un axe mois en saisons (mois % 12 // 3)"""
+    matrix = np.zeros((12, 4), dtype=np.int32)
+    for month in range(1, 13):
+        matrix[month - 1, month % 12 // 3] = 1
+    return matrix
+
+
+def selection_codes(cube: CountCube, dim: str, values: Optional[Sequence[Any]]) -> Optional[List[int]]:
+    """Traduit une sélection de libellés en codes (None = tout l'axe)"""
+    if values is None:
+        return None
+    return cube.index_of(dim, values)
+
+
+class DailyCounts:
+    """
+    Comptes quotidiens par PDQ et catégorie: tableau (jours, pdq + 1, catégorie + 1)
+
+    Le jour d'indice i correspond à start + i jours.
+    """
+
+    def __init__(self, counts: np.ndarray, start: np.datetime64,
+                 pdqs: List[int], categories: List[str]):
+        self.counts = counts
+        self.start = start
+        self.labels = {'pdq': pdqs, 'category': list(categories)}
+        self._cumulative = None
+
+    @property
+    def dates(self) -> np.ndarray:
+        return self.start + np.arange(self.counts.shape[0]).astype('timedelta64[D]')
+
+    def day_index(self, date) -> int:
+        """Indice du jour (borné à la période couverte)"""
+        offset = int((np.datetime64(date, 'D') - self.start) / np.timedelta64(1, 'D'))
+        return min(max(offset, 0), self.counts.shape[0])
+
+    def series(self, pdq_codes: Optional[Sequence[int]] = None,
+               category_codes: Optional[Sequence[int]] = None) -> np.ndarray:
+        """Série quotidienne sommée sur les PDQ et catégories choisis (None = tous)"""
+        counts = self.counts
+        if pdq_codes is not None:
+            counts = np.take(counts, np.asarray(pdq_codes, dtype=np.int64), axis=1)
+        if category_codes is not None:
+            counts = np.take(counts, np.asarray(category_codes, dtype=np.int64), axis=2)
+        return counts.sum(axis=(1, 2))
+
+    @property
+    def cumulative(self) -> np.ndarray:
+        """Comptes cumulés par jour (jours + 1, pdq + 1, catégorie + 1), calculés une fois"""
+        if getattr(self, '_cumulative', None) is None:
+            cumulative = np.zeros((self.counts.shape[0] + 1,) + self.counts.shape[1:], dtype=np.int64)
+            np.cumsum(self.counts, axis=0, out=cumulative[1:])
+            self._cumulative = cumulative
+        return self._cumulative
+
+    def period_totals(self, start, end):
+        """
+        Comptes (pdq + 1, catégorie + 1) du jour start au jour end inclus
+
+        Returns:
+            (comptes, nombre de jours couverts par les données)
+        """
+        first = self.day_index(start)
+        last = max(first, min(self.day_index(end) + 1, self.counts.shape[0]))
+        return self.cumulative[last] - self.cumulative[first], last - first
+
+    @property
+    def nbytes(self) -> int:
+        cumulative = getattr(self, '_cumulative', None)
+        return self.counts.nbytes + (cumulative.nbytes if cumulative is not None else 0)
+
+
+def build_daily_counts(df: pd.DataFrame, category_labels: List[str],
+                       weights: Optional[np.ndarray] = None) -> DailyCounts:
+    """
+    Construit les comptes (jour, pdq, catégorie) en un np.bincount sur le décalage en jours
+
+    Les lignes sans date sont ignorées (elles n'ont pas de jour). weights donne
+    le nombre d'incidents par ligne pour des lignes déjà regroupées.
+    """
+    pdqs = pdq_axis(df)
+    days = df['DATE'].to_numpy(dtype='datetime64[ns]').astype('datetime64[D]')
+    valid = ~np.isnat(days)
+    if not valid.any():
+        return DailyCounts(np.zeros((0, len(pdqs) + 1, len(category_labels) + 1), dtype=np.int32),
+                           np.datetime64('1970-01-01', 'D'), pdqs, category_labels)
+
+    start = days[valid].min()
+    offsets = (days[valid] - start).astype(np.int64)
+    shape = (int(offsets.max()) + 1, len(pdqs) + 1, len(category_labels) + 1)
+
+    codes = (
+        offsets,
+        pdq_codes(df, pdqs)[valid],
+        _codes(df['CATEGORY_CODE'].to_numpy()[valid], len(category_labels)),
+    )
+    flat = np.ravel_multi_index(codes, shape)
+    if weights is not None:
+        weights = np.asarray(weights)[valid]
+    counts = np.bincount(flat, weights=weights, minlength=int(np.prod(shape))).reshape(shape)
+    return DailyCounts(counts.astype(np.int32), start, pdqs, category_labels)
+
+
+def weekly_totals(dates: np.ndarray, values: np.ndarray):
+    """
+    Agrège une série quotidienne en semaines commençant le lundi
+
+    Returns:
+        (dates de début de semaine, totaux)
+    """
+    if len(dates) == 0:
+        return dates, values
+    # 1970-01-01 était un jeudi: +3 aligne les semaines sur le lundi
+    week = (dates.astype('datetime64[D]').astype(np.int64) + 3) // 7
+    starts = np.flatnonzero(np.r_[True, week[1:] != week[:-1]])
+    week_starts = (week[starts] * 7 - 3).astype('datetime64[D]')
+    return week_starts, np.add.reduceat(values, starts)
+
+
+def lttb_indices(y: np.ndarray, threshold: int) -> np.ndarray:
+    """
+    Largest-Triangle-Three-Buckets sur une série à pas régulier
+
+    Conserve la forme visuelle (pics et creux) en choisissant, dans chaque
+    intervalle, le point qui forme le plus grand triangle avec le point retenu
+    précédemment et la moyenne de l'intervalle suivant.
+
+    Returns:
+        Indices des points retenus (toujours le premier et le dernier)
+    """
+    n = len(y)
+    if threshold >= n or threshold < 3:
+        return np.arange(n)
+
+    y = np.asarray(y, dtype=np.float64)
+    edges = np.floor(np.linspace(1, n - 1, threshold - 1)).astype(np.int64)
+    selected = np.empty(threshold, dtype=np.int64)
+    selected[0] = 0
+    selected[-1] = n - 1
+
+    a = 0
+    for i in range(threshold - 2):
+        lo, hi = edges[i], max(edges[i + 1], edges[i] + 1)
+        next_lo, next_hi = hi, (edges[i + 2] if i + 2 < len(edges) else n)
+        next_hi = max(next_hi, next_lo + 1)
+        avg_x = (next_lo + min(next_hi, n) - 1) / 2.0
+        avg_y = y[next_lo:next_hi].mean()
+
+        xs = np.arange(lo, hi)
+        areas = np.abs((a - avg_x) * (y[lo:hi] - y[a]) - (a - xs) * (avg_y - y[a]))
+        a = lo + int(np.argmax(areas))
+        selected[i + 1] = a
+    return selected
+
+
+class YearPrefixCounts:
+    """
+    Comptes cumulés par année:
+    (pdq + 1, années + 1, catégorie + 1, quart + 1, type de jour + 1)
+
+    prefix[:, k] contient la somme des années d'indice < k, de sorte que toute
+    plage [début, fin] s'obtient par la différence de deux lignes, quel que
+    soit le nombre de lignes d'incidents ou la largeur de la plage.
+    """
+
+    def __init__(self, cube: CountCube):
+        by_year = cube.sum(keep=('pdq', 'year', 'category', 'shift', 'day_type'), drop_missing=False)
+        # Les incidents sans année ne tombent dans aucune plage
+        by_year = by_year[:, :len(cube.labels['year'])]
+        self.years = list(cube.labels['year'])
+        self.labels = {'pdq': cube.labels['pdq'], 'category': cube.labels['category'],
+                       'shift': cube.labels['shift'], 'day_type': cube.labels['day_type']}
+        self.by_year = by_year
+        shape = (by_year.shape[0], by_year.shape[1] + 1) + by_year.shape[2:]
+        self.prefix = np.zeros(shape, dtype=np.int64)
+        np.cumsum(by_year, axis=1, out=self.prefix[:, 1:])
+        # Ligne supplémentaire « tous PDQ » pour éviter de sommer les PDQ à chaque appel
+        self.prefix_all = self.prefix.sum(axis=0)
+        self.by_year_all = by_year.sum(axis=0)
+
+    def _year_bounds(self, start_year: int, end_year: int):
+        if not self.years:
+            return 0, 0
+        first = self.years[0]
+        start = min(max(int(start_year) - first, 0), len(self.years))
+        end = min(max(int(end_year) - first + 1, 0), len(self.years))
+        return start, max(start, end)
+
+    @staticmethod
+    def _select(per_pdq: np.ndarray, all_pdq: np.ndarray, pdq_code, category_code) -> np.ndarray:
+        """
+        Réduit (pdq, année, catégorie, ...) à (année, ...) pour une sélection
+
+        pdq_code / category_code: un code, une liste de codes ou None (tous)
+        """
+        if pdq_code is None:
+            selected = all_pdq
+        elif np.ndim(pdq_code) == 0:
+            selected = per_pdq[pdq_code]
+        else:
+            selected = per_pdq[list(pdq_code)].sum(axis=0)
+
+        if category_code is None:
+            return selected.sum(axis=1)
+        if np.ndim(category_code) == 0:
+            return selected[:, category_code]
+        return selected[:, list(category_code)].sum(axis=1)
+
+    def range_counts(self, start_year: int, end_year: int,
+                     pdq_code: CodeSelection = None, category_code: CodeSelection = None) -> np.ndarray:
+        """Comptes (quart + 1, type de jour + 1) de la plage [start_year, end_year]"""
+        start, end = self._year_bounds(start_year, end_year)
+        prefix = self._select(self.prefix[:, [start, end]], self.prefix_all[[start, end]],
+                              pdq_code, category_code)
+        return prefix[1] - prefix[0]
+
+    def yearly(self, start_year: int, end_year: int,
+               pdq_code: CodeSelection = None, category_code: CodeSelection = None):
+        """Comptes par année (années, quart + 1, type de jour + 1) sur la plage"""
+        start, end = self._year_bounds(start_year, end_year)
+        by_year = self._select(self.by_year[:, start:end], self.by_year_all[start:end],
+                               pdq_code, category_code)
+        return self.years[start:end], by_year
+
+    @property
+    def nbytes(self) -> int:
+        return (self.prefix.nbytes + self.by_year.nbytes
+                + self.prefix_all.nbytes + self.by_year_all.nbytes)
@@ -0,0 +1,404 @@
+"""
+Statistiques glissantes, référence saisonnière et prévision des séries temporelles
+
+Toutes les séries (par exemple chaque couple PDQ x catégorie des comptes
+quotidiens) sont traitées ensemble comme un tableau 2-D (temps x séries):
+chaque opération est vectorisée sur toutes les colonnes à la fois.
+
+L'état (sommes cumulées, profil saisonnier, résidus) est mis à jour de façon
+incrémentale par append() lorsque de nouveaux jours sont ingérés, sans
+recalculer l'historique.
+
+Modèle de prévision (simple et explicable):
+    référence[t]  = moyenne historique du même intervalle saisonnier (semaine de l'année)
+    niveau        = somme récente observée / somme récente de la référence
+    prévision[h]  = référence[T + h] x niveau
+    bande         = prévision ± z x écart-type des résidus (observé - référence)
+
+Détection d'anomalies (AnomalyDetector): score z robuste de chaque jour contre
+la médiane et l'écart interquartile des semaines précédentes, calculé pour
+toutes les séries en une passe et prolongé par append().
+"""
+
+import math
+from typing import Optional, Sequence, Tuple
+
+import numpy as np
+
+SEASON_BUCKETS = 53
+DEFAULT_Z = 1.96
+
+
+def week_of_year_buckets(dates: np.ndarray) -> np.ndarray:
+    """Intervalle saisonnier (0..52) de chaque date: semaine de l'année"""
+    days = np.asarray(dates, dtype='datetime64[D]')
+    years = days.astype('datetime64[Y]')
+    day_of_year = (days - years).astype(np.int64)
+    return np.minimum(day_of_year // 7, SEASON_BUCKETS - 1)
+
+
+def rolling_mean_from_cumsum(cumsum: np.ndarray, window: int) -> np.ndarray:
+    """
+    Moyenne glissante (fenêtre finissant en t) à partir des sommes cumulées
+
+    Args:
+        cumsum: (T + 1, S) avec cumsum[0] = 0
+        window: Taille de la fenêtre
+
+    Returns:
+        (T, S), NaN pour les t < window - 1
+    """
+    steps = cumsum.shape[0] - 1
+    result = np.full((steps,) + cumsum.shape[1:], np.nan)
+    if window <= 0 or steps < window:
+        return result
+    result[window - 1:] = (cumsum[window:] - cumsum[:-window]) / window
+    return result
+
+
+class SeriesAnalytics:
+    """
+    Analyse vectorisée d'un ensemble de séries régulières (temps x séries)
+
+    Args:
+        values: Comptes (T, S)
+        buckets: Intervalle saisonnier de chaque pas de temps (T,)
+        n_buckets: Nombre d'intervalles saisonniers (1 = pas de saisonnalité)
+        level_window: Nombre de pas récents utilisés pour ajuster le niveau
+    """
+
+    def __init__(self, values: np.ndarray, buckets: np.ndarray,
+                 n_buckets: int = SEASON_BUCKETS, level_window: int = 28):
+        values = np.asarray(values, dtype=np.float64)
+        if values.ndim == 1:
+            values = values[:, None]
+        self.n_buckets = n_buckets
+        self.level_window = level_window
+        self.values = values
+        self.buckets = np.asarray(buckets, dtype=np.int64)
+
+        self.cumsum = np.zeros((values.shape[0] + 1, values.shape[1]))
+        np.cumsum(values, axis=0, out=self.cumsum[1:])
+
+        self.profile_sums = np.zeros((n_buckets, values.shape[1]))
+        self.profile_counts = np.zeros(n_buckets)
+        np.add.at(self.profile_sums, self.buckets, values)
+        np.add.at(self.profile_counts, self.buckets, 1)
+
+        residuals = values - self.baseline()
+        self.residual_sq_sum = (residuals ** 2).sum(axis=0)
+
+    @property
+    def steps(self) -> int:
+        return self.values.shape[0]
+
+    @property
+    def profile(self) -> np.ndarray:
+        """Moyenne par intervalle saisonnier (n_buckets, S)"""
+        counts = np.maximum(self.profile_counts, 1)[:, None]
+        return self.profile_sums / counts
+
+    def append(self, values: np.ndarray, buckets: np.ndarray):
+        """
+        Ajoute de nouveaux pas de temps à la fin de l'historique
+
+        Coût proportionnel au nombre de nouveaux pas: les sommes cumulées, le
+        profil et la somme des carrés des résidus sont prolongés. Les résidus
+        des nouveaux pas sont mesurés contre le profil connu avant l'ajout.
+        Les tableaux existants ne sont pas modifiés (une copie superficielle
+        peut être prolongée sans toucher l'original).
+        """
+        values = np.asarray(values, dtype=np.float64)
+        if values.ndim == 1:
+            values = values[:, None]
+        buckets = np.asarray(buckets, dtype=np.int64)
+        if len(values) == 0:
+            return
+
+        residuals = values - self.profile[buckets]
+        self.residual_sq_sum = self.residual_sq_sum + (residuals ** 2).sum(axis=0)
+
+        new_cumsum = self.cumsum[-1] + np.cumsum(values, axis=0)
+        self.cumsum = np.vstack([self.cumsum, new_cumsum])
+        self.values = np.vstack([self.values, values])
+        self.buckets = np.concatenate([self.buckets, buckets])
+        self.profile_sums = self.profile_sums.copy()
+        self.profile_counts = self.profile_counts.copy()
+        np.add.at(self.profile_sums, buckets, values)
+        np.add.at(self.profile_counts, buckets, 1)
+
+    def rolling_mean(self, window: int) -> np.ndarray:
+        """Moyenne glissante de chaque série (T, S)"""
+        return rolling_mean_from_cumsum(self.cumsum, window)
+
+    def baseline(self) -> np.ndarray:
+        """Référence saisonnière de chaque pas de temps (T, S)"""
+        return self.profile[self.buckets]
+
+    def residual_std(self) -> np.ndarray:
+        """Écart-type des résidus observé - référence (S,)"""
+        return np.sqrt(self.residual_sq_sum / max(self.steps, 1))
+
+    def level(self) -> np.ndarray:
+        """Facteur de niveau récent: observé / référence sur les derniers pas (S,)"""
+        window = min(self.level_window, self.steps)
+        if window == 0:
+            return np.ones(self.values.shape[1])
+        observed = self.cumsum[-1] - self.cumsum[-1 - window]
+        expected = self.profile[self.buckets[-window:]].sum(axis=0)
+        return np.divide(observed, expected, out=np.ones_like(observed), where=expected > 0)
+
+    def forecast(self, future_buckets: np.ndarray, z: float = DEFAULT_Z
+                 ) -> Tuple[np.ndarray, np.ndarray, np.ndarray]:
+        """
+        Prévision saisonnière avec bande de confiance
+
+        Args:
+            future_buckets: Intervalle saisonnier de chaque pas futur (H,)
+            z: Quantile de la loi normale pour la bande
+
+        Returns:
+            (prévision, borne basse, borne haute), chacun (H, S)
+        """
+        future_buckets = np.asarray(future_buckets, dtype=np.int64)
+        mean = self.profile[future_buckets] * self.level()
+        margin = z * self.residual_std()
+        return mean, np.maximum(mean - margin, 0), mean + margin
+
+    def select(self, columns: Optional[Sequence[int]] = None) -> 'SeriesAnalytics':
+        """Analyse de la somme des colonnes choisies (toutes si None)"""
+        values = self.values if columns is None else self.values[:, list(columns)]
+        return SeriesAnalytics(values.sum(axis=1), self.buckets, self.n_buckets, self.level_window)
+
+
+def daily_analytics(daily, level_window: int = 28) -> SeriesAnalytics:
+    """
+    Analyse de toutes les séries quotidiennes PDQ x catégorie
+
+    Les colonnes suivent l'ordre aplati (pdq, catégorie) de DailyCounts.counts.
+    """
+    values = daily.counts.reshape(daily.counts.shape[0], -1)
+    return SeriesAnalytics(values, week_of_year_buckets(daily.dates),
+                           SEASON_BUCKETS, level_window)
+
+
+def series_columns(daily, pdq_codes: Optional[Sequence[int]] = None,
+                   category_codes: Optional[Sequence[int]] = None) -> np.ndarray:
+    """Indices de colonnes (pdq, catégorie) aplatis pour une sélection"""
+    n_pdq, n_cat = daily.counts.shape[1], daily.counts.shape[2]
+    pdqs = np.arange(n_pdq) if pdq_codes is None else np.asarray(pdq_codes, dtype=np.int64)
+    cats = np.arange(n_cat) if category_codes is None else np.asarray(category_codes, dtype=np.int64)
+    return (pdqs[:, None] * n_cat + cats[None, :]).ravel()
+
+
+def compare_periods(counts_a: np.ndarray, counts_b: np.ndarray,
+                    days_a: int, days_b: int, z: float = DEFAULT_Z) -> dict:
+    """
+    Comparaison de deux périodes pour toute une matrice de comptes (ex: PDQ x catégorie)
+
+    Test de Poisson conditionnel, en approximation normale: sous l'hypothèse
+    d'un taux quotidien inchangé, le compte de B parmi le total A + B suit une
+    binomiale de proportion days_b / (days_a + days_b).
+
+    Args:
+        counts_a, counts_b: Comptes des périodes A et B (même forme)
+        days_a, days_b: Durées des périodes en jours
+        z: Seuil de |z| pour le drapeau de significativité
+
+    Returns:
+        Dictionnaire de tableaux de la forme des comptes: 'change' (B - A),
+        'pct_change' (variation du taux quotidien en %, NaN si A est nul),
+        'z', 'p_value' (bilatérale) et 'significant'
+    """
+    a = np.asarray(counts_a, dtype=np.float64)
+    b = np.asarray(counts_b, dtype=np.float64)
+    total = a + b
+    share = days_b / float(days_a + days_b)
+
+    with np.errstate(divide='ignore', invalid='ignore'):
+        z_scores = (b - total * share) / np.sqrt(total * share * (1 - share))
+        rate_a = a / days_a
+        pct_change = (b / days_b - rate_a) / rate_a * 100
+    z_scores = np.where(total > 0, z_scores, 0.0)
+    pct_change = np.where(rate_a > 0, pct_change, np.nan)
+    p_values = np.vectorize(math.erfc, otypes=[np.float64])(np.abs(z_scores) / math.sqrt(2))
+
+    return {
+        'change': b - a,
+        'pct_change': pct_change,
+        'z': z_scores,
+        'p_value': p_values,
+        'significant': np.abs(z_scores) >= z,
+    }
+
+
+# --- Détection d'anomalies ----------------------------------------------------
+
+ANOMALY_WINDOW = 56
+ANOMALY_MIN_HISTORY = 28
+ANOMALY_Z = 4.0
+ANOMALY_MIN_COUNT = 5
+ANOMALY_MAX_LEVEL = 63
+ANOMALY_BLOCK = 256
+IQR_TO_SIGMA = 1.349
+
+
+def rolling_quantiles(values: np.ndarray, start: int, window: int,
+                      quantiles: Sequence[float], max_level: int = ANOMALY_MAX_LEVEL,
+                      block: int = ANOMALY_BLOCK) -> Tuple[np.ndarray, np.ndarray]:
+    """
+    Quantiles des fenêtres glissantes précédant chaque pas, pour des comptes entiers
+
+    Pour chaque pas t >= start, la fenêtre couvre les pas [t - window, t)
+    (plus courte au début de l'historique). Les comptes étant de petits
+    entiers, les quantiles sont lus dans l'histogramme cumulé des valeurs
+    (nombre de pas <= v, pour chaque niveau v): aucun tri, toutes les séries
+    traitées ensemble. Les valeurs au-delà de max_level sont ramenées à
+    max_level. Le calcul procède par blocs de pas pour borner la mémoire.
+
+    Args:
+        values: Comptes (T, S)
+        start: Premier pas évalué
+        window: Taille de la fenêtre
+        quantiles: Quantiles recherchés (entre 0 et 1)
+
+    Returns:
+        (quantiles (T - start, S, Q), taille de la fenêtre de chaque pas (T - start,))
+    """
+    values = np.asarray(values)
+    steps, n_series = values.shape
+    if values.size:
+        max_level = int(min(max_level, values.max()))
+    levels = np.arange(max_level + 1)
+    clipped = np.minimum(values, max_level)
+    result = np.zeros((max(steps - start, 0), n_series, len(quantiles)), dtype=np.float64)
+    sizes = np.minimum(np.arange(start, steps), window)
+
+    for block_start in range(start, steps, block):
+        block_end = min(block_start + block, steps)
+        first = max(block_start - window, 0)
+        below = (clipped[first:block_end, :, None] <= levels).astype(np.int32)
+        cumulative = np.zeros((block_end - first + 1,) + below.shape[1:], dtype=np.int32)
+        np.cumsum(below, axis=0, out=cumulative[1:])
+
+        t = np.arange(block_start, block_end)
+        in_window = cumulative[t - first] - cumulative[np.maximum(t - window, 0) - first]
+        n = sizes[block_start - start:block_end - start]
+        for i, q in enumerate(quantiles):
+            # Plus petit niveau v avec au moins ceil(q x n) pas <= v
+            need = np.maximum(np.ceil(q * n), 1)[:, None, None]
+            result[block_start - start:block_end - start, :, i] = np.minimum(
+                (in_window < need).sum(axis=-1), max_level)
+    # Fenêtre vide (premier pas de l'historique)
+    result[sizes == 0] = 0
+    return result, sizes
+
+
+class AnomalyDetector:
+    """
+    Détection des pics de toutes les séries quotidiennes à la fois (temps x séries)
+
+    Référence robuste de chaque pas: médiane des `window` pas précédents;
+    dispersion: écart interquartile / 1.349, au moins l'écart-type de Poisson
+    du troisième quartile (sqrt(max(q3, 1))) pour les séries peu fréquentes.
+    Un pas est signalé si z = (compte - médiane) / dispersion >= z_threshold
+    et compte >= min_count.
+
+    La fenêtre suivant la série dans le temps, la référence suit la saison.
+    append() évalue seulement les nouveaux pas à partir des `window` derniers.
+
+    Args:
+        values: Comptes (T, S)
+        window: Taille de la fenêtre de référence (pas)
+        z_threshold: Seuil du score z
+        min_count: Compte minimal d'un pas signalé
+        min_history: Nombre minimal de pas dans la fenêtre pour évaluer un pas
+    """
+
+    def __init__(self, values: np.ndarray, window: int = ANOMALY_WINDOW,
+                 z_threshold: float = ANOMALY_Z, min_count: int = ANOMALY_MIN_COUNT,
+                 min_history: int = ANOMALY_MIN_HISTORY):
+        values = np.asarray(values)
+        if values.ndim == 1:
+            values = values[:, None]
+        self.window = window
+        self.z_threshold = z_threshold
+        self.min_count = min_count
+        self.min_history = min_history
+        self.values = np.zeros((0, values.shape[1]), dtype=np.int32)
+        self.baseline = np.zeros((0, values.shape[1]), dtype=np.float32)
+        self.z = np.zeros((0, values.shape[1]), dtype=np.float32)
+        self.append(values)
+
+    @property
+    def steps(self) -> int:
+        return self.values.shape[0]
+
+    @property
+    def series(self) -> int:
+        return self.values.shape[1]
+
+    @property
+    def nbytes(self) -> int:
+        return self.values.nbytes + self.baseline.nbytes + self.z.nbytes
+
+    def append(self, values: np.ndarray):
+        """
+        Ajoute et évalue de nouveaux pas de temps
+
+        Coût proportionnel au nombre de nouveaux pas: seuls les `window`
+        derniers pas connus servent de référence. Les tableaux existants ne
+        sont pas modifiés (une copie superficielle peut être prolongée sans
+        toucher l'original).
+        """
+        values = np.asarray(values, dtype=np.int32)
+        if values.ndim == 1:
+            values = values[:, None]
+        if len(values) == 0:
+            return
+
+        tail = self.values[max(self.steps - self.window, 0):]
+        history = np.concatenate([tail, values])
+        quartiles, _ = rolling_quantiles(history, len(tail), self.window, (0.25, 0.5, 0.75))
+        # Les pas du début de l'historique ont une fenêtre incomplète
+        sizes = np.minimum(np.arange(self.steps, self.steps + len(values)), self.window)
+
+        median = quartiles[..., 1]
+        scale = np.maximum((quartiles[..., 2] - quartiles[..., 0]) / IQR_TO_SIGMA,
+                           np.sqrt(np.maximum(quartiles[..., 2], 1.0)))
+        z = (values - median) / scale
+        z[sizes < self.min_history] = 0.0
+
+        self.values = np.concatenate([self.values, values])
+        self.baseline = np.concatenate([self.baseline, median.astype(np.float32)])
+        self.z = np.concatenate([self.z, z.astype(np.float32)])
+
+    def flags(self, columns: Optional[Sequence[int]] = None) -> np.ndarray:
+        """Pas signalés (T, S), limités aux colonnes choisies si fournies"""
+        values, z = self.values, self.z
+        if columns is not None:
+            columns = list(columns)
+            values, z = values[:, columns], z[:, columns]
+        return (z >= self.z_threshold) & (values >= self.min_count)
+
+    def events(self, columns: Optional[Sequence[int]] = None) -> Tuple[np.ndarray, ...]:
+        """
+        Pas signalés sous forme d'événements
+
+        Returns:
+            (pas, colonne, compte, référence, z), triés par pas puis colonne
+        """
+        columns = np.arange(self.series) if columns is None else np.asarray(columns, dtype=np.int64)
+        steps, index = np.nonzero(self.flags(columns))
+        columns = columns[index]
+        return (steps, columns, self.values[steps, columns],
+                self.baseline[steps, columns], self.z[steps, columns])
+
+
+def daily_anomalies(daily, **kwargs) -> AnomalyDetector:
+    """
+    Détection des pics de toutes les séries quotidiennes PDQ x catégorie
+
+    Les colonnes suivent l'ordre aplati (pdq, catégorie) de DailyCounts.counts.
+    """
+    return AnomalyDetector(daily.counts.reshape(daily.counts.shape[0], -1), **kwargs)
@@ -1,9 +1,27 @@
 from dash import Dash, dcc, html
-from visualizations import viz1, viz2
 from callbacks import register_callbacks
+from profiling import install_profiling
+from memory_accounting import install_memory_tracking
+from export_api import install_export_api
+from payload_inspector import install_payload_inspector
+from snapshot import install_snapshot
+from artifacts import load_artifacts
+from data_manager import data_manager
+from selection import empty_selection
 
 app = Dash(__name__, suppress_callback_exceptions=True)
 server = app.server
+install_profiling(server)
+install_memory_tracking(server)
+install_export_api(server)
+install_payload_inspector(server)
+
+# Démarrage à chaud à partir des artefacts de build (calcul à la demande sinon)
+load_artifacts()
+# Rechargement en arrière-plan du CSV modifié (DASH_REFRESH_INTERVAL, en secondes)
+data_manager.start_refresher()
+# Réponses précalculées (DASH_SNAPSHOT, voir snapshot.py), callbacks en repli
+install_snapshot(server)
 
 app.layout = html.Div([
     html.Div(
@@ -26,6 +44,8 @@ app.layout = html.Div([
                     dcc.Tab(label="Visualization 3", value="viz3", className="custom-tab"),
                     dcc.Tab(label="Visualization 4", value="viz4", className="custom-tab"),
                     dcc.Tab(label="Visualization 5", value="viz5", className="custom-tab"),
+                    dcc.Tab(label="Visualization 6", value="viz6", className="custom-tab"),
+                    dcc.Tab(label="Visualization 7", value="viz7", className="custom-tab"),
                 ],
                 className="custom-tabs-container"
             ),
@@ -48,8 +68,9 @@ app.layout = html.Div([
     ),
     
     # Stores (hidden, used for data/state)
+    # store-viz1 holds the selection shared by every tab (see selection.py)
     html.Div([
-        dcc.Store(id="store-viz1"),
+        dcc.Store(id="store-viz1", data=empty_selection()),
         dcc.Store(id="store-viz2"),
         dcc.Store(id="store-viz3"),
         dcc.Store(id="store-viz4"),
@@ -63,6 +84,11 @@ app.layout = html.Div([
         children=[
             # Main content area with enhanced styling
             html.Div([
+                html.Div([
+                    html.Span("Selection: ", style={"fontWeight": "600", "color": "#2c3e50"}),
+                    html.Span(id="selection-summary", style={"color": "#6c757d", "marginRight": "15px"}),
+                    html.Button("Clear selection", id="selection-clear", n_clicks=0)
+                ], style={"marginBottom": "15px"}),
                 html.Div(id="tab-content", className="content-container")
             ], style={
                 "marginTop": "140px", 
@@ -0,0 +1,284 @@
+"""
+Artefacts de build: données préparées et agrégats calculés avant le démarrage
+
+Tout ce qui ne dépend que du CSV et de montreal.json est calculé une fois au
+build (render.yaml, buildCommand) et écrit dans un répertoire versionné:
+
+    artifacts/v<format>-<empreinte>/
+        manifest.json          version, empreintes, durées de calcul
+        prepared.pkl           table préparée + tables de libellés
+        aggregates.pkl         cube de comptes, comptes cumulés, quotidiens, analyses, anomalies
+        viz3.pkl               comptes et positions des marqueurs de la carte, districts des quartiers
+        viz4.pkl               statistiques PDQ-année, table de référence, figure
+
+L'empreinte couvre le format des artefacts, le CSV et montreal.json: un
+fichier modifié donne un nouveau répertoire, jamais un artefact périmé. Les
+heatmaps de viz5 sont servies à partir du cube de comptes inclus ici.
+
+Au démarrage, load_artifacts() publie ces objets comme génération de
+DataManager (table, agrégats et caches des visualisations); en leur
+absence (ou en cas d'erreur) l'application calcule tout à la demande comme
+avant.
+
+Les agrégats et les caches sont calculés par precompute, en parallèle sur
+tous les cœurs par défaut (--workers): le manifeste garde la durée de chaque
+tâche, la durée totale et le chemin critique.
+
+Usage (depuis src/):
+    python -m artifacts build [--output DIR] [--keep 2] [--workers N]
+"""
+
+import argparse
+import hashlib
+import json
+import logging
+import os
+import pickle
+import shutil
+import sys
+import time
+from typing import Any, Callable, Dict, Optional
+
+import pandas as pd
+
+from data_manager import data_manager
+
+logger = logging.getLogger(__name__)
+
+ARTIFACT_FORMAT = 5
+DEFAULT_ROOT = os.path.join(os.path.dirname(os.path.abspath(__file__)), "artifacts")
+AGGREGATE_KEYS = ('count_cube', 'year_prefix', 'daily_counts', 'series_analytics', 'anomalies')
+
+
+def artifact_root(environ=None) -> str:
+    """Répertoire racine des artefacts (DASH_ARTIFACT_DIR ou src/artifacts)"""
+    environ = os.environ if environ is None else environ
+    return environ.get("DASH_ARTIFACT_DIR") or DEFAULT_ROOT
+
+
+def build_workers(environ=None) -> int:
+    """Processus du précalcul au build (DASH_PRECOMPUTE_WORKERS ou nombre de cœurs)"""
+    environ = os.environ if environ is None else environ
+    try:
+        return max(1, int(environ.get("DASH_PRECOMPUTE_WORKERS") or os.cpu_count() or 1))
+    except ValueError:
+        return os.cpu_count() or 1
+
+
+def file_digest(path: str) -> str:
+    """SHA-256 d'un fichier, lu par blocs"""
+    digest = hashlib.sha256()
+    with open(path, 'rb') as f:
+        for block in iter(lambda: f.read(1 << 20), b''):
+            digest.update(block)
+    return digest.hexdigest()
+
+
+def input_digests() -> Dict[str, str]:
+    """Empreintes des fichiers d'entrée (CSV des incidents, montreal.json)"""
+    from visualizations.viz3 import _get_montreal_json_path
+
+    return {
+        'csv': data_manager.dataset_version(),
+        'geojson': file_digest(_get_montreal_json_path()),
+    }
+
+
+def artifact_version(digests: Dict[str, str]) -> str:
+    """Nom du répertoire versionné pour ces entrées"""
+    combined = hashlib.sha256(
+        f"{ARTIFACT_FORMAT}\n{digests['csv']}\n{digests['geojson']}".encode('ascii')
+    ).hexdigest()
+    return f"v{ARTIFACT_FORMAT}-{combined[:16]}"
+
+
+def _dump(obj: Any, path: str):
+    with open(path, 'wb') as f:
+        pickle.dump(obj, f, protocol=pickle.HIGHEST_PROTOCOL)
+
+
+def _load(path: str) -> Any:
+    with open(path, 'rb') as f:
+        return pickle.load(f)
+
+
+def _prune(root: str, keep: int, current: str):
+    """Supprime les anciennes versions (garde les `keep` plus récentes)"""
+    versions = [
+        os.path.join(root, name) for name in os.listdir(root)
+        if name.startswith('v') and os.path.isdir(os.path.join(root, name))
+    ]
+    versions.sort(key=os.path.getmtime, reverse=True)
+    for path in versions[max(keep, 1):]:
+        if os.path.basename(path) != current:
+            shutil.rmtree(path, ignore_errors=True)
+            logger.info(f"Ancienne version d'artefacts supprimée: {path}")
+
+
+def build_artifacts(root: Optional[str] = None, keep: int = 2,
+                    workers: Optional[int] = None) -> Dict[str, Any]:
+    """
+    Calcule et écrit tous les artefacts dérivés du CSV et de montreal.json
+
+    L'écriture se fait dans un répertoire temporaire renommé à la fin: un
+    build interrompu ne laisse jamais de version partielle.
+
+    Args:
+        root: Répertoire racine (défaut: artifact_root())
+        keep: Nombre de versions conservées
+        workers: Processus du précalcul (défaut: build_workers())
+
+    Returns:
+        Le manifeste écrit (version, empreintes, durées par tâche)
+
+    Raises:
+        RuntimeError: Une tâche du précalcul a échoué
+    """
+    # Les modules des visualisations enregistrent leurs tâches de précalcul
+    from visualizations import viz3, viz4  # noqa: F401
+
+    root = root or artifact_root()
+    workers = build_workers() if workers is None else workers
+    timings = {}
+
+    def timed(name: str, compute: Callable[[], Any]) -> Any:
+        started = time.perf_counter()
+        result = compute()
+        timings[name] = round(time.perf_counter() - started, 3)
+        logger.info(f"Artefact {name}: {timings[name]:.2f}s")
+        return result
+
+    generation = timed('prepared', data_manager.generation)
+    report = data_manager.warm_generation(generation, workers=workers)
+    if report['failed']:
+        raise RuntimeError(f"Précalcul incomplet: {report['failed']}")
+    timings.update({name: round(task['seconds'], 3) for name, task in report['tasks'].items()})
+    timings['precompute'] = round(report['wall_s'], 3)
+    aggregates = {key: generation.aggregates[key] for key in AGGREGATE_KEYS}
+
+    digests = input_digests()
+    version = artifact_version(digests)
+    os.makedirs(root, exist_ok=True)
+    target = os.path.join(root, version)
+    tmp = os.path.join(root, f".tmp-{version}-{os.getpid()}")
+    shutil.rmtree(tmp, ignore_errors=True)
+    os.makedirs(tmp)
+
+    started = time.perf_counter()
+    _dump({'table': generation.table, 'labels': generation.labels}, os.path.join(tmp, 'prepared.pkl'))
+    _dump(aggregates, os.path.join(tmp, 'aggregates.pkl'))
+    # Sans la jointure spatiale (GeoDataFrame): la charger importerait
+    # geopandas et shapely au démarrage, alors que la carte n'en a pas besoin
+    viz3_caches = generation.cache_items('viz3.')
+    viz3_caches.pop(viz3.MAP_DATA_KEY, None)
+    _dump(viz3_caches, os.path.join(tmp, 'viz3.pkl'))
+    _dump(generation.cache_items('viz4.'), os.path.join(tmp, 'viz4.pkl'))
+    timings['write'] = round(time.perf_counter() - started, 3)
+
+    manifest = {
+        'version': version,
+        'format': ARTIFACT_FORMAT,
+        'inputs': digests,
+        'created': time.strftime('%Y-%m-%dT%H:%M:%S%z'),
+        'python': sys.version.split()[0],
+        'pandas': pd.__version__,
+        'rows': len(generation.table),
+        'timings_s': timings,
+        'precompute': {
+            'workers': report['workers'],
+            'wall_s': round(report['wall_s'], 3),
+            'critical_path_s': round(report['critical_path_s'], 3),
+        },
+        'files': {
+            name: os.path.getsize(os.path.join(tmp, name))
+            for name in sorted(os.listdir(tmp))
+        },
+    }
+    with open(os.path.join(tmp, 'manifest.json'), 'w') as f:
+        json.dump(manifest, f, indent=2)
+
+    if os.path.exists(target):
+        shutil.rmtree(target)
+    os.replace(tmp, target)
+    _prune(root, keep, version)
+    logger.info(f"Artefacts écrits dans {target}")
+    return manifest
+
+
+def load_artifacts(root: Optional[str] = None) -> bool:
+    """
+    Publie les artefacts correspondant aux fichiers d'entrée actuels
+
+    Returns:
+        True si une génération a été publiée à partir des artefacts; False si
+        aucune version compatible n'existe (calcul à la demande)
+    """
+    root = root or artifact_root()
+    if data_manager.backend_engine != "pandas":
+        logger.info(f"Moteur {data_manager.backend_engine}: artefacts en mémoire ignorés")
+        return False
+    if not os.path.isdir(root):
+        logger.info(f"Aucun artefact dans {root}: calcul à la demande")
+        return False
+
+    try:
+        started = time.perf_counter()
+        digests = input_digests()
+        version = artifact_version(digests)
+        path = os.path.join(root, version)
+        manifest_path = os.path.join(path, 'manifest.json')
+        if not os.path.exists(manifest_path):
+            logger.info(f"Pas d'artefacts pour la version {version}: calcul à la demande")
+            return False
+        with open(manifest_path) as f:
+            manifest = json.load(f)
+        if manifest.get('pandas') != pd.__version__:
+            logger.warning(f"Artefacts construits avec pandas {manifest.get('pandas')} "
+                           f"(installé: {pd.__version__}): calcul à la demande")
+            return False
+
+        prepared = _load(os.path.join(path, 'prepared.pkl'))
+        aggregates = _load(os.path.join(path, 'aggregates.pkl'))
+        caches = {}
+        caches.update(_load(os.path.join(path, 'viz3.pkl')))
+        caches.update(_load(os.path.join(path, 'viz4.pkl')))
+
+        data_manager.restore_prepared(
+            prepared['table'], prepared['labels'],
+            {key: aggregates[key] for key in AGGREGATE_KEYS if key in aggregates},
+            dataset_version=digests['csv'],
+            caches=caches,
+        )
+        logger.info(f"Artefacts {version} chargés en {time.perf_counter() - started:.2f}s")
+        return True
+    except Exception as e:
+        logger.warning(f"Chargement des artefacts impossible ({e}): calcul à la demande")
+        return False
+
+
+def main(argv=None) -> int:
+    parser = argparse.ArgumentParser(prog="python -m artifacts",
+                                     description="Outils de données du tableau de bord")
+    commands = parser.add_subparsers(dest="command", required=True)
+    build = commands.add_parser("build", help="Génère les artefacts dérivés (étape de build)")
+    build.add_argument("--output", default=None, help="Répertoire racine (défaut: DASH_ARTIFACT_DIR ou src/artifacts)")
+    build.add_argument("--keep", type=int, default=2, help="Nombre de versions conservées")
+    build.add_argument("--workers", type=int, default=None,
+                       help="Processus du précalcul (défaut: DASH_PRECOMPUTE_WORKERS ou nombre de cœurs)")
+    args = parser.parse_args(argv)
+
+    if args.command == "build":
+        started = time.perf_counter()
+        manifest = build_artifacts(args.output, keep=args.keep, workers=args.workers)
+        precompute = manifest['precompute']
+        print(f"Artefacts {manifest['version']} générés en {time.perf_counter() - started:.1f}s "
+              f"({sum(manifest['files'].values()) / 1e6:.1f} Mo)")
+        for name, seconds in manifest['timings_s'].items():
+            print(f"  {name:<34} {seconds:>7.2f}s")
+        print(f"  précalcul: {precompute['workers']} processus, {precompute['wall_s']:.2f}s "
+              f"(chemin critique {precompute['critical_path_s']:.2f}s)")
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,68 @@
+"""
+Budgets par nom ou motif fnmatch des outils de mesure (payload_inspector, startup_bench)
+
+Les budgets par défaut d'un outil sont complétés par une variable
+d'environnement (JSON, ou chemin d'un fichier JSON). Les budgets fournis par
+l'utilisateur sont consultés en premier: son motif "viz3-*.figure" s'applique
+même si les défauts ont une entrée exacte pour "viz3-map.figure". Dans
+chaque groupe, une correspondance exacte l'emporte sur les motifs, puis le
+premier motif qui correspond s'applique.
+"""
+
+import fnmatch
+import json
+import os
+from typing import Callable, Dict, List, Optional
+
+
+class Budgets(dict):
+    """
+    Budgets fusionnés (dict: rapports, JSON) qui gardent l'ordre de consultation
+
+    Args:
+        overrides: Budgets de l'utilisateur, consultés en premier
+        defaults: Budgets par défaut de l'outil
+    """
+
+    def __init__(self, overrides: Dict[str, float], defaults: Dict[str, float]):
+        super().__init__(overrides)
+        for key, value in defaults.items():
+            self.setdefault(key, value)
+        self.tiers: List[Dict[str, float]] = [dict(overrides), dict(defaults)]
+
+
+def load_budgets(variable: str, defaults: Dict[str, float], convert: Callable = float,
+                 environ=None) -> Budgets:
+    """
+    Budgets par défaut complétés par la variable d'environnement (prioritaire)
+
+    Args:
+        variable: Variable contenant le JSON des budgets, ou le chemin d'un fichier JSON
+        defaults: Budgets par défaut
+        convert: Conversion des valeurs de l'utilisateur (int, float)
+    """
+    environ = os.environ if environ is None else environ
+    overrides = {}
+    extra = environ.get(variable)
+    if extra:
+        if os.path.exists(extra):
+            with open(extra) as f:
+                extra = f.read()
+        overrides = {key: convert(value) for key, value in json.loads(extra).items()}
+    return Budgets(overrides, defaults)
+
+
+def budget_for(name: str, budgets: Dict[str, float]) -> Optional[float]:
+    """
+    Budget de name (None = aucun)
+
+    Budgets de l'utilisateur puis défauts (Budgets.tiers; un dict simple forme
+    un seul groupe): dans chaque groupe, correspondance exacte puis premier motif.
+    """
+    for tier in getattr(budgets, "tiers", [budgets]):
+        if name in tier:
+            return tier[name]
+        for pattern, limit in tier.items():
+            if fnmatch.fnmatchcase(name, pattern):
+                return limit
+    return None
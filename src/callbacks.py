@@ -1,9 +1,16 @@
-from dash import Input, Output, html, dcc
+from dash import Input, Output, State, html, dcc, ctx, no_update
 import visualizations.viz1 as viz1
 import visualizations.viz2 as viz2
 import visualizations.viz3 as viz3
 import visualizations.viz4 as viz4
 import visualizations.viz5 as viz5
+import visualizations.viz6 as viz6
+import visualizations.viz7 as viz7
+import selection
+import figure_builder as fb
+from figure_cache import cached_figure
+
+STORE = selection.SELECTION_STORE
 
 def register_callbacks(app):
     
@@ -11,11 +18,24 @@ def register_callbacks(app):
         Output("viz1-graph", "figure"),
         Input("viz1-view-dropdown", "value"),
         Input("viz1-chart-type", "value"),
+        Input("viz1-graph", "relayoutData"),
+        Input("viz1-overlays", "value"),
+        Input(STORE, "data"),
+        State("viz1-graph-width", "data"),
         prevent_initial_call=False
     )
-    def update_viz1_graph(view, chart_type):
+    def update_viz1_graph(view, chart_type, relayout_data, overlays, selected, width):
         try:
-            return viz1.update_graph(view, chart_type)
+            zoom = None
+            if ctx.triggered_id == "viz1-graph":
+                # Le zoom ne change les données que pour les séries quotidiennes/hebdomadaires
+                if view not in viz1.TIME_SERIES_VIEWS:
+                    return no_update
+                zoom = viz1.parse_zoom_range(relayout_data)
+            overlays = tuple(overlays or ())
+            key = (view, chart_type, selection.selection_key(selected), zoom, width, overlays)
+            return cached_figure("viz1", key, lambda: viz1.update_graph(
+                view, chart_type, selected, zoom, width, overlays))
         except Exception as e:
             import plotly.graph_objects as go
             fig = go.Figure()
@@ -34,12 +54,138 @@ def register_callbacks(app):
             )
             return fig
 
+    @app.callback(
+        Output("viz1-anomaly-table", "data"),
+        Input(STORE, "data"),
+        prevent_initial_call=False
+    )
+    def update_viz1_anomalies(selected):
+        return cached_figure("viz1-anomalies", selection.selection_key(selected),
+                             lambda: viz1.get_anomaly_records(selected))
+
+    # Largeur du graphique en pixels pour dimensionner la réduction LTTB
+    app.clientside_callback(
+        """
+        function(graphId) {
+            var el = document.getElementById(graphId);
+            return el ? el.clientWidth : null;
+        }
+        """,
+        Output("viz1-graph-width", "data"),
+        Input("viz1-graph", "id")
+    )
+
+    # Sélection partagée: contrôles et clics de chaque onglet -> store
+    @app.callback(
+        Output(STORE, "data", allow_duplicate=True),
+        Input("viz1-pdq-dropdown", "value"),
+        Input("viz1-category-dropdown", "value"),
+        State(STORE, "data"),
+        prevent_initial_call=True
+    )
+    def select_from_viz1(pdq, category, current):
+        return selection.update_selection(current, pdq=pdq, category=category)
+
+    @app.callback(
+        Output(STORE, "data", allow_duplicate=True),
+        Input("pdq-dropdown", "value"),
+        Input("year-slider", "value"),
+        State(STORE, "data"),
+        prevent_initial_call=True
+    )
+    def select_from_viz2(pdq, years, current):
+        return selection.update_selection(current, pdq=pdq, years=years)
+
+    @app.callback(
+        Output(STORE, "data", allow_duplicate=True),
+        Input("crime-map", "clickData"),
+        State(STORE, "data"),
+        prevent_initial_call=True
+    )
+    def select_from_viz3(click_data, current):
+        changes = viz3.selection_from_click(click_data)
+        return selection.update_selection(current, **changes) if changes else no_update
+
+    @app.callback(
+        Output(STORE, "data", allow_duplicate=True),
+        Input("viz4-scatter", "clickData"),
+        State(STORE, "data"),
+        prevent_initial_call=True
+    )
+    def select_from_viz4(click_data, current):
+        changes = viz4.selection_from_click(click_data)
+        return selection.update_selection(current, **changes) if changes else no_update
+
+    @app.callback(
+        Output(STORE, "data", allow_duplicate=True),
+        Output("viz5-pdq-dropdown", "value"),
+        Output("viz5-district-dropdown", "value"),
+        Input("viz5-pdq-dropdown", "value"),
+        Input("viz5-district-dropdown", "value"),
+        Input("viz5-year-slider", "value"),
+        Input("viz5-heatmap", "clickData"),
+        State(STORE, "data"),
+        prevent_initial_call=True
+    )
+    def select_from_viz5(pdq, district, years, click_data, current):
+        if ctx.triggered_id == "viz5-heatmap":
+            changes = viz5.selection_from_click(click_data)
+            if not changes:
+                return no_update, no_update, no_update
+            return selection.update_selection(current, **changes), no_update, no_update
+        if ctx.triggered_id == "viz5-district-dropdown":
+            # Un district remplace le PDQ choisi
+            updated = selection.update_selection(current, district=district, years=years)
+            return updated, selection.control_value(updated["pdq"]), no_update
+        updated = selection.update_selection(current, pdq=pdq, district=district, years=years)
+        return updated, no_update, no_update
+
+    @app.callback(
+        Output(STORE, "data", allow_duplicate=True),
+        Input("viz6-pdq-dropdown", "value"),
+        Input("viz6-category-dropdown", "value"),
+        State(STORE, "data"),
+        prevent_initial_call=True
+    )
+    def select_from_viz6(pdq, category, current):
+        return selection.update_selection(current, pdq=pdq, category=category)
+
+    @app.callback(
+        Output(STORE, "data", allow_duplicate=True),
+        Input("viz7-table", "active_cell"),
+        State(STORE, "data"),
+        prevent_initial_call=True
+    )
+    def select_from_viz7(active_cell, current):
+        changes = viz7.selection_from_cell(active_cell)
+        return selection.update_selection(current, **changes) if changes else no_update
+
+    @app.callback(
+        Output(STORE, "data", allow_duplicate=True),
+        Input("selection-clear", "n_clicks"),
+        prevent_initial_call=True
+    )
+    def clear_selection(n_clicks):
+        return selection.empty_selection()
+
+    @app.callback(
+        Output("selection-summary", "children"),
+        Input(STORE, "data")
+    )
+    def show_selection(selected):
+        return selection.describe_selection(selected)
+
     @app.callback(
         Output("tab-content", "children"),
         Input("tabs", "value"),
+        Input("selection-clear", "n_clicks"),
+        State(STORE, "data"),
         prevent_initial_call=False
     )
-    def render_tab(tab):
+    def render_tab(tab, clear_clicks=None, selected=None):
+        # Les contrôles de l'onglet sont initialisés à partir de la sélection partagée
+        if ctx.triggered_id == "selection-clear":
+            selected = selection.empty_selection()
         try:
             content_style = {
                 "animation": "fadeIn 0.5s ease-in-out",
@@ -58,10 +204,10 @@ def register_callbacks(app):
                                    "fontSize": "28px",
                                    "fontWeight": "600"
                                }),
-                        html.P("The first visualization is an interactive chart (toggle between line and bar chart). It visualises the total number of crimes recorded, segmented by year, season, or month. The x axis represents the selected time unit, while the y axis shows the number of crimes. Each bar or line point corresponds to the number of crimes during that time period. A dashed red line represents the median crime count across the selected timeframe. This helps compare data points above or below the midpoint. The legend clearly differentiates between the crime data and the median line. ",
+                        html.P("The first visualization is an interactive chart (toggle between line and bar chart). It visualises the total number of crimes recorded, segmented by year, season, month, week or day, for all of Montreal or a single PDQ and crime type. Daily and weekly series are simplified to fit the chart width; zoom in to see every point. The x axis represents the selected time unit, while the y axis shows the number of crimes. Each bar or line point corresponds to the number of crimes during that time period. A dashed red line represents the median crime count across the selected timeframe. This helps compare data points above or below the midpoint. The legend clearly differentiates between the crime data and the median line. ",
                                style={"color": "#6c757d", "fontSize": "16px", "marginBottom": "30px"}),
                     ]),
-                    viz1.layout()
+                    viz1.layout(selected)
                 ], style=content_style)
                 
             elif tab == "viz2":
@@ -79,7 +225,7 @@ def register_callbacks(app):
                         html.P("​​This visualization explores how crime in Montreal has changed over time, focusing on three key aspects: time of day, day of the week, and long-term trends in night-time activity. It consists of three connected charts that highlight different dimensions of temporal crime data from 2015 to 2025.",
                                style={"color": "#6c757d", "fontSize": "16px", "marginBottom": "30px"}),
                     ]),
-                    viz2.layout()
+                    viz2.layout(selected)
                 ], style=content_style)
                 
             elif tab == "viz3":
@@ -140,7 +286,7 @@ def register_callbacks(app):
                             "marginBottom": "25px"
                         })
                     ]),
-                    viz4.layout()
+                    viz4.layout(selected)
                 ], style=content_style)
                 
             elif tab == "viz5":
@@ -177,7 +323,43 @@ def register_callbacks(app):
                             "marginBottom": "25px"
                         })
                     ]),
-                    viz5.layout()
+                    viz5.layout(selected)
+                ], style=content_style)
+
+            elif tab == "viz6":
+                return html.Div([
+                    html.Div([
+                        html.H3("Visualization 6", 
+                               style={
+                                   "color": "#2c3e50", 
+                                   "marginBottom": "20px",
+                                   "borderBottom": "3px solid #2c3e50",
+                                   "paddingBottom": "10px",
+                                   "fontSize": "28px",
+                                   "fontWeight": "600"
+                               }),
+                        html.P("This calendar heatmap shows the number of crimes recorded on every single day. Each band is one year: columns are the weeks of the year and rows the days of the week, so day-level events such as holidays, heat waves or the 2020 lockdown stand out as lighter or darker cells. Filter by PDQ and crime type, or pick a year range in another tab to focus on fewer years.",
+                               style={"color": "#6c757d", "fontSize": "16px", "marginBottom": "30px"}),
+                    ]),
+                    viz6.layout(selected)
+                ], style=content_style)
+
+            elif tab == "viz7":
+                return html.Div([
+                    html.Div([
+                        html.H3("Visualization 7", 
+                               style={
+                                   "color": "#2c3e50", 
+                                   "marginBottom": "20px",
+                                   "borderBottom": "3px solid #2c3e50",
+                                   "paddingBottom": "10px",
+                                   "fontSize": "28px",
+                                   "fontWeight": "600"
+                               }),
+                        html.P("This view compares two periods of your choice for every PDQ and crime type. The matrix shows the change in the daily crime rate between period A and period B (red for increases, blue for decreases); cells marked with * are statistically significant changes (Poisson test, |z| ≥ 1.96) rather than normal fluctuation. The table lists the counts, the absolute and percentage change, the z-score and the p-value of every pair, biggest movers first; click a column header to sort or a row to select that PDQ and crime type in every tab.",
+                               style={"color": "#6c757d", "fontSize": "16px", "marginBottom": "30px"}),
+                    ]),
+                    viz7.layout(selected)
                 ], style=content_style)
             
             
@@ -203,38 +385,15 @@ def register_callbacks(app):
         Output("bar-chart", "figure"),
         Output("pie-chart", "figure"),
         Output("line-chart", "figure"),
-        Input("pdq-dropdown", "value"),
-        Input("year-slider", "value"),
+        Input(STORE, "data"),
+        Input("viz2-overlays", "value"),
         prevent_initial_call=False
     )
-    def update_all_charts(selected_pdq, selected_years):
+    def update_all_charts(selected, overlays=None):
         try:
-            start_year, end_year = selected_years
-            pdq_value = None if selected_pdq == "All" else selected_pdq
-
-            filtered_df = viz2.filter_data(start_year, end_year, pdq=pdq_value)
-
-            bar_fig = viz2.create_bar_chart(filtered_df)
-            pie_fig = viz2.create_pie_chart(filtered_df)
-            line_fig = viz2.create_line_chart(filtered_df)
-            
-            for fig in [bar_fig, pie_fig, line_fig]:
-                fig.update_layout(
-                    plot_bgcolor='rgba(0,0,0,0)',
-                    paper_bgcolor='rgba(0,0,0,0)',
-                    font=dict(family="Segoe UI, Roboto, Helvetica Neue", size=12),
-                    margin=dict(l=40, r=40, t=60, b=40),
-                    title=dict(font=dict(size=18, color="#2c3e50")),
-                    legend=dict(
-                        bgcolor="rgba(255,255,255,0.8)",
-                        bordercolor="rgba(0,0,0,0.2)",
-                        borderwidth=1,
-                        font=dict(size=11)
-                    )
-                )
-
-            return bar_fig, pie_fig, line_fig
-            
+            overlays = tuple(overlays or ())
+            key = (selection.selection_key(selected), overlays)
+            return cached_figure("viz2", key, lambda: build_viz2_charts(selected, overlays))
         except Exception as e:
             # Return empty figures with error messages
             import plotly.graph_objects as go
@@ -254,4 +413,91 @@ def register_callbacks(app):
                 paper_bgcolor='rgba(0,0,0,0)',
             )
             
-            return error_fig, error_fig, error_fig
\ No newline at end of file
+            return error_fig, error_fig, error_fig
+
+    def build_viz2_charts(selected, overlays):
+        summary = viz2.get_range_summary(selected)
+
+        bar_fig = viz2.create_bar_chart(summary['time_of_day'])
+        pie_fig = viz2.create_pie_chart(summary['day_type'])
+        anomaly_years = viz2.get_anomaly_years(selected) if "anomalies" in overlays else None
+        line_fig = viz2.create_line_chart(summary['night_trend'], overlays, anomaly_years)
+
+        # Figures en dictionnaires (figure_builder): fusion directe du style commun
+        for fig in [bar_fig, pie_fig, line_fig]:
+            fb.update_layout(
+                fig,
+                plot_bgcolor='rgba(0,0,0,0)',
+                paper_bgcolor='rgba(0,0,0,0)',
+                font=dict(family="Segoe UI, Roboto, Helvetica Neue", size=12),
+                margin=dict(l=40, r=40, t=60, b=40),
+                title=dict(font=dict(size=18, color="#2c3e50")),
+                legend=dict(
+                    bgcolor="rgba(255,255,255,0.8)",
+                    bordercolor="rgba(0,0,0,0.2)",
+                    borderwidth=1,
+                    font=dict(size=11)
+                )
+            )
+
+        return bar_fig, pie_fig, line_fig
+
+    @app.callback(
+        Output("viz4-scatter", "figure"),
+        Input(STORE, "data"),
+        prevent_initial_call=True
+    )
+    def update_viz4_scatter(selected):
+        return cached_figure("viz4", selection.selection_key(selected),
+                             lambda: viz4.create_selection_figure(selected))
+
+    @app.callback(
+        Output("pdq-table", "data"),
+        Output("pdq-table", "page_count"),
+        Input("pdq-table", "page_current"),
+        Input("pdq-table", "page_size"),
+        Input("pdq-table", "sort_by"),
+        Input("pdq-table-district", "value"),
+        Input("pdq-table-type", "value"),
+        prevent_initial_call=True
+    )
+    def update_pdq_table(page_current, page_size, sort_by, districts, area_types):
+        return viz4.query_pdq_table(page_current, page_size, sort_by, districts, area_types)
+
+    @app.callback(
+        Output("viz5-heatmap", "figure"),
+        Input("viz5-view", "value"),
+        Input(STORE, "data"),
+        prevent_initial_call=False
+    )
+    def update_viz5_heatmap(view, selected):
+        selected = selection.normalize_selection(selected)
+        return cached_figure("viz5", (view, selection.selection_key(selected)), lambda: viz5.create_heatmap_figure(
+            view, selected["pdq"], selected["district"], selected["years"], selected["category"]))
+
+    @app.callback(
+        Output("viz6-calendar", "figure"),
+        Input(STORE, "data"),
+        prevent_initial_call=False
+    )
+    def update_viz6_calendar(selected):
+        return cached_figure("viz6", selection.selection_key(selected),
+                             lambda: viz6.create_calendar_figure(selected))
+
+    @app.callback(
+        Output("viz7-matrix", "figure"),
+        Output("viz7-table", "data"),
+        Input("viz7-period-a", "start_date"),
+        Input("viz7-period-a", "end_date"),
+        Input("viz7-period-b", "start_date"),
+        Input("viz7-period-b", "end_date"),
+        Input(STORE, "data"),
+        prevent_initial_call=False
+    )
+    def update_viz7_comparison(start_a, end_a, start_b, end_b, selected):
+        if not (start_a and end_a and start_b and end_b):
+            return no_update, no_update
+        period_a = [start_a[:10], end_a[:10]]
+        period_b = [start_b[:10], end_b[:10]]
+        key = (tuple(period_a), tuple(period_b), selection.selection_key(selected))
+        return cached_figure("viz7", key, lambda: viz7.update_comparison(period_a, period_b, selected))
@@ -1,128 +1,887 @@
 """
 Gestionnaire de données centralisé pour l'application Dash Montreal Crimes
 Optimise les performances en chargeant les données une seule fois et en les mettant en cache
+
+Plusieurs jeux de données peuvent être servis par le même processus: chacun
+est décrit par un DatasetSpec (fichiers, lecture, préparation) enregistré avec
+register_dataset(), et get_data_manager(nom) retourne son gestionnaire (le
+jeu des incidents, DEFAULT_DATASET, reste l'instance globale data_manager).
+Les caches de tous les jeux partagent le budget mémoire de memory_accounting
+(DASH_MEMORY_BUDGET_MB): les entrées les moins récemment utilisées sont
+évincées quel que soit leur jeu, et la table d'un jeu inactif non épinglé
+est déchargée puis relue à la demande.
+
+Variables d'environnement:
+    DASH_DATASETS=nom=chemin,...   Jeux supplémentaires au format des incidents
+                                   (ex: archives annuelles)
 """
 
+import copy
+import hashlib
+import io
+import itertools
+import threading
+import time
+from collections import OrderedDict
+import numpy as np
 import pandas as pd
 import os
-from functools import lru_cache
-from typing import Optional, Dict, Any
+from typing import Optional, Dict, Any, Callable, Iterator, List, Sequence, Tuple
 import logging
+import memory_accounting
+from memory_accounting import memory_budget
+from single_flight import single_flight
+import selection as shared_selection
+from analytics import (AnomalyDetector, SeriesAnalytics, daily_analytics, daily_anomalies, series_columns,
+                       week_of_year_buckets)
+from aggregates import CountCube, DailyCounts, YearPrefixCounts, build_count_cube, build_daily_counts
 
 # Configuration du logging pour le debug
 logging.basicConfig(level=logging.INFO)
 logger = logging.getLogger(__name__)
 
+# Tables de normalisation: clé canonique (minuscules, sans espaces superflus)
+# -> (libellé français, libellé anglais). L'ordre définit les codes.
+CRIME_CATEGORIES = {
+    "introduction": ("Introduction", "Breaking And Entering"),
+    "méfait": ("Méfait", "Mischief"),
+    "vol de véhicule à moteur": ("Vol de véhicule à moteur", "Motor Vehicle Theft"),
+    "infractions entrainant la mort": ("Infractions entrainant la mort", "Offences Causing Death"),
+    "vols qualifiés": ("Vols qualifiés", "Robbery"),
+    "vol dans / sur véhicule à moteur": ("Vol dans / sur véhicule à moteur", "Theft From/In Motor Vehicle"),
+}
+
+SHIFT_KEYS = ['jour', 'soir', 'nuit']
+SHIFT_LABELS = {
+    'fr': ['Jour', 'Soir', 'Nuit'],
+    'en': ['Day', 'Evening', 'Night'],
+    'en_hours': ['Day (09:01–16:00)', 'Evening (16:01–00:00)', 'Night (00:01–08:00)']
+}
+
+# Codes de saison: (mois % 12) // 3
+SEASON_LABELS = {
+    'fr': ['Hiver', 'Printemps', 'Été', 'Automne'],
+    'en': ['Winter', 'Spring', 'Summer', 'Autumn']
+}
+
+
+def _normalize_categories(values: pd.Series,
+                          categories: Optional[List[str]] = None) -> Tuple[Any, Dict[str, List[str]]]:
+    """
+    Convertit la colonne CATEGORIE en codes canoniques
+    
+    Le travail sur les chaînes ne porte que sur les valeurs distinctes; les
+    catégories inconnues reçoivent un code après les catégories connues.
+    
+    Args:
+        values: Valeurs brutes de CATEGORIE
+        categories: Valeurs brutes distinctes de tout le jeu de données, triées
+            (codes identiques pour un sous-ensemble de lignes); défaut: celles de values
+    
+    Returns:
+        (codes int8, -1 si manquant), {'fr': [...], 'en': [...]}
+    """
+    categorical = pd.Categorical(values, categories=categories)
+    keys = pd.Index(categorical.categories).astype(str).str.strip().str.lower()
+    
+    canonical = list(CRIME_CATEGORIES)
+    labels = {'fr': [fr for fr, _ in CRIME_CATEGORIES.values()],
+              'en': [en for _, en in CRIME_CATEGORIES.values()]}
+    
+    mapping = []
+    for raw, key in zip(categorical.categories, keys):
+        if key not in canonical:
+            canonical.append(key)
+            labels['fr'].append(str(raw).strip())
+            labels['en'].append(key.title())
+        mapping.append(canonical.index(key))
+    
+    # Le code -1 (valeur manquante) tombe sur le dernier élément de la table
+    lookup = np.array(mapping + [-1], dtype=np.int8)
+    return lookup[categorical.codes], labels
+
+
+def _normalize_shifts(values: pd.Series):
+    """Convertit la colonne QUART en codes (0 jour, 1 soir, 2 nuit, -1 inconnu)"""
+    categorical = pd.Categorical(values)
+    keys = pd.Index(categorical.categories).astype(str).str.strip().str.lower()
+    mapping = [SHIFT_KEYS.index(k) if k in SHIFT_KEYS else -1 for k in keys]
+    lookup = np.array(mapping + [-1], dtype=np.int8)
+    return lookup[categorical.codes]
+
+
+def _prepare_table(table: pd.DataFrame, categories: Optional[List[str]] = None) -> Dict[str, Any]:
+    """
+    Prépare la table brute (colonnes communes utilisées par plusieurs visualisations)
+    
+    La normalisation des catégories, des quarts et des saisons est faite ici,
+    une seule fois à l'ingestion: les visualisations utilisent les codes
+    (CATEGORY_CODE, SHIFT_CODE, SEASON_CODE) et les tables de libellés
+    retournées par get_labels() au lieu de retravailler les chaînes.
+    
+    La table est modifiée sur place. categories: voir _normalize_categories().
+    
+    Returns:
+        Tables de libellés des dimensions codées
+    """
+    # Ajout des colonnes temporelles communes
+    table["YEAR"] = table["DATE"].dt.year
+    table["MONTH"] = table["DATE"].dt.month
+    season_codes = (table["MONTH"] % 12 // 3).fillna(-1).astype("int8")
+    table["SEASON_CODE"] = season_codes
+    table["SEASON"] = pd.Categorical.from_codes(
+        season_codes, categories=SEASON_LABELS['en'], ordered=True
+    )
+    
+    # Catégories de crimes: codes canoniques + libellés français/anglais
+    category_codes, category_labels = _normalize_categories(table["CATEGORIE"], categories)
+    table["CATEGORY_CODE"] = category_codes
+    table["CATEGORIE"] = pd.Categorical.from_codes(
+        category_codes, categories=category_labels['fr']
+    )
+    labels = {
+        'category': category_labels,
+        'shift': SHIFT_LABELS,
+        'season': SEASON_LABELS
+    }
+    
+    # Nettoyage des données QUART
+    if 'QUART' in table.columns:
+        shift_codes = _normalize_shifts(table['QUART'])
+        table['SHIFT_CODE'] = shift_codes
+        table['QUART'] = pd.Categorical.from_codes(shift_codes, categories=SHIFT_KEYS)
+        table['DayOfWeek'] = table['DATE'].dt.dayofweek
+        table['Day Type'] = pd.Categorical.from_codes(
+            (table['DayOfWeek'] >= 5).astype("int8"),
+            categories=['Weekday', 'Weekend']
+        )
+        
+        # Mapping des périodes de la journée
+        table['Time of Day'] = pd.Categorical.from_codes(
+            shift_codes, categories=SHIFT_LABELS['en_hours']
+        )
+    
+    logger.info("Données de base préparées avec colonnes temporelles et codes normalisés")
+    return labels
+
+
+def _read_incidents(content: bytes) -> pd.DataFrame:
+    """Lecture du CSV des incidents (DATE en datetime)"""
+    return pd.read_csv(io.BytesIO(content), parse_dates=["DATE"])
+
+
+class DatasetSpec:
+    """
+    Description d'un jeu de données servi par DataManager
+    
+    Args:
+        name: Nom unique (clé de get_data_manager())
+        paths: Chemins candidats du CSV, essayés dans l'ordre
+        read: Lecture du contenu brut du fichier (octets) en DataFrame
+        prepare: Préparation de la table sur place; retourne les tables de libellés
+        sql: Schéma des incidents: les moteurs SQL de sql_backend sont utilisables
+        pinned: Table jamais déchargée par le budget mémoire
+        description: Texte retourné par list_datasets()
+    """
+    
+    def __init__(self, name: str, paths: List[str],
+                 read: Callable[[bytes], pd.DataFrame] = _read_incidents,
+                 prepare: Callable[[pd.DataFrame], Dict[str, Any]] = _prepare_table,
+                 sql: bool = False, pinned: bool = False, description: str = ""):
+        self.name = name
+        self.paths = list(paths)
+        self.read = read
+        self.prepare = prepare
+        self.sql = sql
+        self.pinned = pinned
+        self.description = description
+
+
+DEFAULT_DATASET = "crimes"
+# Résultats de get_filtered_data() gardés par jeu de données (LRU)
+FILTERED_CACHE_SIZE = 32
+DATASETS: Dict[str, DatasetSpec] = {}
+
+
+def register_dataset(spec: DatasetSpec):
+    """Enregistre un jeu de données (un nouvel enregistrement remplace l'ancien)"""
+    DATASETS[spec.name] = spec
+
+
+register_dataset(DatasetSpec(
+    DEFAULT_DATASET,
+    [
+        "src/data/actes-criminels.csv",
+        "data/actes-criminels.csv",
+        "../data/actes-criminels.csv",
+        os.path.join(os.path.dirname(__file__), "data", "actes-criminels.csv"),
+        os.path.join(os.path.dirname(__file__), "..", "data", "actes-criminels.csv")
+    ],
+    sql=True,
+    pinned=True,
+    description="Actes criminels du SPVM (données ouvertes de Montréal)",
+))
+
+
+def register_datasets_from_environ(environ=None) -> List[str]:
+    """
+    Enregistre les jeux au format des incidents listés dans DASH_DATASETS
+    
+    Returns:
+        Noms des jeux enregistrés
+    """
+    environ = os.environ if environ is None else environ
+    names = []
+    for item in (environ.get("DASH_DATASETS") or "").split(","):
+        name, _, path = item.strip().partition("=")
+        if not name or not path:
+            continue
+        register_dataset(DatasetSpec(name.strip(), [path.strip()], sql=True,
+                                     description=f"Incidents ({os.path.basename(path.strip())})"))
+        names.append(name.strip())
+    return names
+
+
+def _source_signature(path: str) -> Optional[Tuple[int, int]]:
+    """(taille, mtime en ns) du fichier source, None s'il est absent"""
+    try:
+        stat = os.stat(path)
+    except OSError:
+        return None
+    return stat.st_size, stat.st_mtime_ns
+
+
+_MISSING = object()
+# Identifiants de génération uniques entre jeux de données (clés des caches
+# de figures, de single_flight et du budget mémoire)
+_generation_ids = itertools.count(1)
+
+
+class DatasetGeneration:
+    """
+    Génération complète et immuable du jeu de données
+    
+    Une génération regroupe la table préparée, ses libellés, ses agrégats et
+    les caches dérivés des visualisations (jointure spatiale, statistiques
+    PDQ...). Elle n'est jamais modifiée après avoir été publiée, sauf pour
+    ajouter des entrées calculées à la demande: un lecteur qui a obtenu une
+    génération travaille sur un état cohérent, même si une nouvelle génération
+    est publiée pendant sa requête.
+    
+    Args:
+        generation_id: Identifiant croissant (clé de tous les caches)
+        table: Table préparée par _prepare_table()
+        labels: Tables de libellés correspondantes
+        dataset_version: Empreinte SHA-256 du CSV d'origine, si connue
+        source: Signature (taille, mtime) du CSV au moment de la lecture
+        backend: Moteur SQL (sql_backend) qui sert filtres et regroupements;
+            la table n'est alors matérialisée qu'à sa première utilisation
+        dataset: Nom du jeu de données
+    """
+    
+    def __init__(self, generation_id: int, table: Optional[pd.DataFrame], labels: Dict[str, Any],
+                 dataset_version: Optional[str] = None,
+                 source: Optional[Tuple[int, int]] = None,
+                 backend=None, dataset: str = DEFAULT_DATASET):
+        self.id = generation_id
+        self.dataset = dataset
+        self._table = table
+        self.labels = labels
+        self.dataset_version = dataset_version
+        self.source = source
+        self.backend = backend
+        self.rows = len(table) if table is not None else backend.row_count()
+        self.created = time.time()
+        # Agrégats de DataManager (cube de comptes, comptes cumulés...)
+        self.aggregates = {}
+        # Caches des visualisations, clés préfixées par le module ('viz3.', 'viz4.')
+        self.caches = {}
+        # Remplacée ou déchargée: ses nouvelles entrées ne comptent plus dans le budget
+        self.retired = False
+    
+    @property
+    def owner(self) -> Tuple[str, int]:
+        """Propriétaire des entrées de la génération dans le budget mémoire"""
+        return self.dataset, self.id
+    
+    @property
+    def table(self) -> pd.DataFrame:
+        """Table préparée (lue depuis le moteur SQL à la première utilisation)"""
+        if self._table is None:
+            single_flight.do("data_manager.table", self.id, self._materialize)
+        return self._table
+    
+    @property
+    def table_loaded(self) -> bool:
+        return self._table is not None
+    
+    def _materialize(self):
+        if self._table is None:
+            logger.info(f"Matérialisation de la table ({self.rows} lignes, moteur {self.backend.engine})")
+            self._table = self.backend.rows()
+    
+    def cached(self, key: str, compute: Callable[[], Any]) -> Any:
+        """
+        Valeur du cache de la génération pour key, calculée par compute() sinon
+        
+        Les appels concurrents pour une clé absente attendent un seul calcul.
+        """
+        return self._get_or_compute('caches', key, compute)
+    
+    def aggregate(self, key: str, compute: Callable[[], Any]) -> Any:
+        """Agrégat de la génération pour key, calculé une seule fois par compute()"""
+        return self._get_or_compute('aggregates', key, compute)
+    
+    def _get_or_compute(self, kind: str, key: str, compute: Callable[[], Any]) -> Any:
+        store = getattr(self, kind)
+        value = store.get(key, _MISSING)
+        if value is not _MISSING:
+            memory_budget.touch(self.owner, (kind, key))
+            return value
+        
+        def compute_once():
+            # Un calcul terminé juste avant l'entrée dans le vol est réutilisé
+            value = store.get(key, _MISSING)
+            if value is _MISSING:
+                value = compute()
+                store[key] = value
+                self._track(kind, key, value)
+            return value
+        
+        return single_flight.do(key, self.id, compute_once)
+    
+    def _track(self, kind: str, key: str, value: Any):
+        """Compte une entrée dans le budget mémoire (évincée = recalculée à la demande)"""
+        if not self.retired:
+            store = getattr(self, kind)
+            # La table du jeu en cours d'utilisation passe après les entrées plus anciennes
+            memory_budget.touch(self.owner, 'table')
+            memory_budget.add(self.owner, (kind, key), value, evict=lambda: store.pop(key, None))
+    
+    def preload(self, aggregates: Optional[Dict[str, Any]] = None,
+                caches: Optional[Dict[str, Any]] = None):
+        """Ajoute des agrégats et des caches calculés ailleurs (artefacts de build)"""
+        for kind, values in (('aggregates', aggregates), ('caches', caches)):
+            for key, value in (values or {}).items():
+                getattr(self, kind)[key] = value
+                self._track(kind, key, value)
+    
+    def cache_items(self, prefix: str = "") -> Dict[str, Any]:
+        """Entrées du cache dont la clé commence par prefix"""
+        return {k: v for k, v in list(self.caches.items()) if k.startswith(prefix)}
+    
+    def evict(self, prefix: str = "", kind: str = 'caches'):
+        """Retire les entrées dont la clé commence par prefix ('caches' ou 'aggregates')"""
+        store = getattr(self, kind)
+        for key in list(store):
+            if key.startswith(prefix):
+                store.pop(key, None)
+                memory_budget.discard(self.owner, (kind, key))
+
+
 class DataManager:
     """
     Gestionnaire centralisé des données avec mise en cache
+    
+    Les données sont servies à partir de la génération courante
+    (DatasetGeneration). Un rechargement construit une nouvelle génération
+    complète à côté de la courante (lecture du CSV, agrégats, caches des
+    visualisations) puis la publie par une seule affectation: les lecteurs ne
+    sont jamais bloqués et ne voient jamais un état à moitié mis à jour.
+    
+    Avec DASH_DATA_BACKEND=sqlite ou duckdb (voir sql_backend), les filtres et
+    les regroupements sont exécutés par un moteur SQL embarqué au lieu de
+    garder tous les incidents en mémoire.
+    
+    Une seule instance par jeu de données (DataManager(nom) retourne toujours
+    la même); chaque instance a ses propres générations et caches.
     """
-    _instance = None
-    _data_cache = {}
-    _processed_cache = {}
+    _instances: Dict[str, 'DataManager'] = {}
+    _instances_lock = threading.Lock()
     
-    def __new__(cls):
-        """Singleton pattern pour s'assurer qu'une seule instance existe"""
-        if cls._instance is None:
-            cls._instance = super(DataManager, cls).__new__(cls)
-        return cls._instance
+    def __new__(cls, dataset: str = DEFAULT_DATASET):
+        """Une instance par jeu de données enregistré"""
+        with cls._instances_lock:
+            instance = cls._instances.get(dataset)
+            if instance is None:
+                if dataset not in DATASETS:
+                    raise ValueError(f"Jeu de données inconnu: {dataset} ({', '.join(DATASETS)})")
+                instance = super(DataManager, cls).__new__(cls)
+                cls._instances[dataset] = instance
+        return instance
     
-    def __init__(self):
+    def __init__(self, dataset: str = DEFAULT_DATASET):
         """Initialisation du gestionnaire de données"""
         if not hasattr(self, 'initialized'):
+            self.dataset = dataset
+            self.spec = DATASETS[dataset]
             self.data_path = self._get_data_path()
-            self.raw_data = None
+            self.backend_engine = ((os.environ.get("DASH_DATA_BACKEND") or "pandas").lower()
+                                   if self.spec.sql else "pandas")
+            self._generation = None
+            # Données filtrées de la génération courante (LRU, budget mémoire)
+            self._processed_cache: "OrderedDict[tuple, pd.DataFrame]" = OrderedDict()
+            self._filtered_lock = threading.Lock()
+            self._filtered_hits = 0
+            self._filtered_misses = 0
+            # Constructeurs des caches des visualisations, exécutés sur une nouvelle
+            # génération avant sa publication (name -> fonction(génération))
+            self._generation_builders = {}
+            # Rechargements: un à la fois (le premier chargement passe par single_flight)
+            self._refresh_lock = threading.Lock()
+            self._refresher = None
+            self._refresher_stop = threading.Event()
+            # Dernières analyse des séries et détection d'anomalies (axes des
+            # comptes quotidiens, état), prolongées si la génération suivante
+            # ajoute des jours
+            self._series_state = None
+            self._anomaly_state = None
+            self._register_memory()
             self.initialized = True
-            logger.info("DataManager initialisé")
+            logger.info(f"DataManager initialisé ({dataset})")
+    
+    @property
+    def raw_data(self) -> Optional[pd.DataFrame]:
+        """Table de la génération courante (None si elle n'est pas chargée)"""
+        generation = self._generation
+        return generation._table if generation is not None else None
+    
+    @property
+    def labels(self) -> Optional[Dict[str, Any]]:
+        generation = self._generation
+        return generation.labels if generation is not None else None
+    
+    @property
+    def data_version(self) -> int:
+        """Identifiant de la génération courante: invalide les caches de figures"""
+        generation = self._generation
+        return generation.id if generation is not None else 0
+    
+    @property
+    def _aggregate_cache(self) -> Dict[str, Any]:
+        generation = self._generation
+        return generation.aggregates if generation is not None else {}
+    
+    def _register_memory(self):
+        """
+        Comptabilité mémoire: table et agrégats (non évictables), données filtrées
+        
+        À l'approche du plafond RSS, seules les données filtrées sont vidées:
+        les agrégats, coûteux à reconstruire, restent sous le contrôle du
+        budget mémoire (éviction LRU entrée par entrée).
+        """
+        prefix = "data_manager" if self.dataset == DEFAULT_DATASET else f"data_manager.{self.dataset}"
+        memory_accounting.register_cache(f"{prefix}.raw_data", lambda: self.raw_data)
+        memory_accounting.register_cache(
+            f"{prefix}.filtered_cache",
+            lambda: self._filtered_values(),
+            evict=self._clear_filtered,
+            priority=10
+        )
+        memory_accounting.register_cache(f"{prefix}.aggregates", lambda: dict(self._aggregate_cache))
     
     def _get_data_path(self) -> str:
         """
         Détermine le chemin correct vers le fichier CSV
         """
-        # Essayer différents chemins possibles
-        possible_paths = [
-            "src/data/actes-criminels.csv",
-            "data/actes-criminels.csv",
-            "../data/actes-criminels.csv",
-            os.path.join(os.path.dirname(__file__), "data", "actes-criminels.csv"),
-            os.path.join(os.path.dirname(__file__), "..", "data", "actes-criminels.csv")
-        ]
-        
-        for path in possible_paths:
+        # Essayer les chemins possibles du jeu de données
+        for path in self.spec.paths:
             if os.path.exists(path):
                 logger.info(f"Fichier CSV trouvé à: {path}")
                 return path
         
         # Si aucun chemin ne fonctionne, utiliser le chemin par défaut
-        default_path = "src/data/actes-criminels.csv"
+        default_path = self.spec.paths[0]
         logger.warning(f"Fichier CSV non trouvé, utilisation du chemin par défaut: {default_path}")
         return default_path
     
-    def load_raw_data(self, force_reload: bool = False) -> pd.DataFrame:
+    def generation(self) -> DatasetGeneration:
+        """
+        Retourne la génération courante, chargée au premier appel
+        
+        Une requête doit obtenir la génération une seule fois et s'y tenir
+        pour rester cohérente pendant un rechargement.
+        """
+        generation = self._generation
+        if generation is None:
+            generation = single_flight.do("data_manager.load", self.data_path, self._load_first_generation)
+        memory_budget.touch(generation.owner, 'table')
+        return generation
+    
+    def _load_first_generation(self) -> DatasetGeneration:
+        if self._generation is None:
+            with self._refresh_lock:
+                if self._generation is None:
+                    self._publish(self._build_generation())
+        return self._generation
+    
+    def _build_generation(self) -> DatasetGeneration:
+        """
+        Lit et prépare le CSV dans une nouvelle génération, sans la publier
+        
+        Le fichier est lu une seule fois en mémoire: la table et l'empreinte
+        correspondent au même contenu même si le fichier est remplacé pendant
+        la lecture.
+        """
+        if self.backend_engine != "pandas":
+            generation = self._build_sql_generation()
+            if generation is not None:
+                return generation
+        try:
+            logger.info(f"Chargement des données depuis: {self.data_path}")
+            source = _source_signature(self.data_path)
+            with open(self.data_path, 'rb') as f:
+                content = f.read()
+            table = self.spec.read(content)
+            logger.info(f"Données chargées: {len(table)} lignes, {len(table.columns)} colonnes")
+            
+            # Nettoyage et préparation des données de base
+            labels = self.spec.prepare(table)
+            return DatasetGeneration(next(_generation_ids), table, labels,
+                                     dataset_version=hashlib.sha256(content).hexdigest(),
+                                     source=source, dataset=self.dataset)
+        except Exception as e:
+            logger.error(f"Erreur lors du chargement des données: {e}")
+            raise
+    
+    def _build_sql_generation(self) -> Optional[DatasetGeneration]:
+        """
+        Génération servie par le moteur SQL (base ingérée si le CSV a changé)
+        
+        Returns:
+            None si le moteur est indisponible: repli sur le chargement en mémoire
+        """
+        from sql_backend import open_backend
+        
+        source = _source_signature(self.data_path)
+        try:
+            backend, digest = open_backend(self.backend_engine, self.data_path,
+                                           os.environ.get("DASH_DATA_DB_DIR"))
+        except (ImportError, ValueError) as e:
+            logger.warning(f"Moteur {self.backend_engine} indisponible ({e}): données en mémoire")
+            self.backend_engine = "pandas"
+            return None
+        labels = {
+            'category': backend.category_labels(),
+            'shift': SHIFT_LABELS,
+            'season': SEASON_LABELS
+        }
+        logger.info(f"Données servies par {backend.engine}: {backend.path}")
+        return DatasetGeneration(next(_generation_ids), None, labels,
+                                 dataset_version=digest, source=source, backend=backend,
+                                 dataset=self.dataset)
+    
+    def _publish(self, generation: DatasetGeneration):
+        """Remplace la génération courante (une seule affectation)"""
+        previous = self._generation
+        self._generation = generation
+        # Les entrées des anciennes générations ne sont plus accessibles
+        # (leur comptabilité part avec memory_budget.release)
+        with self._filtered_lock:
+            self._processed_cache.clear()
+        if previous is not None:
+            previous.retired = True
+            memory_budget.release(previous.owner)
+        # Table d'un jeu non épinglé: déchargée par le budget si le jeu est inactif
+        memory_budget.add(generation.owner, 'table', generation._table,
+                          evict=None if self.spec.pinned else lambda: self._unload(generation.id),
+                          nbytes=0 if generation._table is None else None)
+        logger.info(f"Génération {generation.id} publiée ({generation.rows} lignes, "
+                    f"{len(generation.aggregates)} agrégats, {len(generation.caches)} caches)"
+                    + (f", remplace la génération {previous.id}" if previous is not None else ""))
+    
+    def _unload(self, generation_id: int):
+        """
+        Décharge la génération courante si c'est encore generation_id
+        
+        Les requêtes en cours gardent leur génération; la suivante relit le CSV.
+        """
+        generation = self._generation
+        if generation is None or generation.id != generation_id:
+            return
+        self._generation = None
+        generation.retired = True
+        with self._filtered_lock:
+            self._processed_cache.clear()
+        memory_budget.release(generation.owner)
+        logger.info(f"Jeu {self.dataset} déchargé (génération {generation_id}, budget mémoire)")
+    
+    def register_generation_builder(self, name: str, builder: Callable[[DatasetGeneration], Any]):
+        """
+        Enregistre un constructeur de caches exécuté sur chaque nouvelle
+        génération avant sa publication
+        
+        Args:
+            name: Nom unique (un nouvel enregistrement remplace l'ancien)
+            builder: Fonction recevant la génération à remplir
+        """
+        self._generation_builders[name] = builder
+    
+    def warm_generation(self, generation: DatasetGeneration, workers: Optional[int] = None) -> Dict[str, Any]:
+        """
+        Calcule les agrégats et les caches des visualisations d'une génération
+        
+        Les tâches enregistrées dans precompute (agrégats, caches viz3/viz4)
+        s'exécutent selon leurs dépendances, en parallèle si workers > 1
+        (défaut: DASH_PRECOMPUTE_WORKERS); les constructeurs enregistrés par
+        register_generation_builder() ensuite.
+        
+        Returns:
+            Rapport de precompute.precompute() (durées par tâche)
+        """
+        import precompute
+        
+        started = time.perf_counter()
+        report = precompute.precompute(generation, workers)
+        for name, builder in list(self._generation_builders.items()):
+            try:
+                builder(generation)
+            except Exception as e:
+                # Le cache sera calculé à la demande après la publication
+                logger.warning(f"Préparation de {name} impossible pour la génération {generation.id}: {e}")
+        logger.info(f"Génération {generation.id} préparée en {time.perf_counter() - started:.2f}s")
+        return report
+    
+    def refresh(self, warm: bool = True) -> DatasetGeneration:
+        """
+        Recharge le CSV dans une nouvelle génération et la publie
+        
+        Les requêtes en cours continuent sur l'ancienne génération pendant la
+        construction. Un seul rechargement à la fois.
+        
+        Args:
+            warm: Calcule agrégats et caches des visualisations avant publication
+            
+        Returns:
+            La nouvelle génération
+        """
+        with self._refresh_lock:
+            generation = self._build_generation()
+            if warm:
+                self.warm_generation(generation)
+            self._publish(generation)
+            return generation
+    
+    def source_changed(self) -> bool:
+        """True si le CSV a changé depuis la lecture de la génération courante"""
+        generation = self._generation
+        if generation is None:
+            return False
+        current = _source_signature(self.data_path)
+        return current is not None and current != generation.source
+    
+    def start_refresher(self, interval: Optional[float] = None, environ=None) -> bool:
+        """
+        Démarre la surveillance du CSV en arrière-plan
+        
+        Toutes les `interval` secondes (DASH_REFRESH_INTERVAL par défaut), un
+        fichier modifié est rechargé dans une nouvelle génération préparée
+        hors des requêtes. Sans intervalle, rien n'est démarré.
+        
+        Returns:
+            True si le thread de surveillance tourne
+        """
+        environ = os.environ if environ is None else environ
+        if interval is None:
+            interval = float(environ.get("DASH_REFRESH_INTERVAL") or 0)
+        if interval <= 0:
+            return False
+        if self._refresher is not None and self._refresher.is_alive():
+            return True
+        
+        def watch():
+            while not self._refresher_stop.wait(interval):
+                if not self.source_changed():
+                    continue
+                try:
+                    logger.info(f"{self.data_path} modifié: construction d'une nouvelle génération")
+                    self.refresh()
+                except Exception as e:
+                    # La génération courante reste en service
+                    logger.error(f"Rechargement en arrière-plan impossible: {e}")
+        
+        self._refresher_stop.clear()
+        self._refresher = threading.Thread(target=watch, name=f"dataset-refresher-{self.dataset}", daemon=True)
+        self._refresher.start()
+        logger.info(f"Surveillance de {self.data_path} toutes les {interval:g}s")
+        return True
+    
+    def stop_refresher(self):
+        """Arrête la surveillance du CSV"""
+        self._refresher_stop.set()
+        if self._refresher is not None:
+            self._refresher.join()
+            self._refresher = None
+    
+    def load_raw_data(self, force_reload: bool = False,
+                      generation: Optional[DatasetGeneration] = None) -> pd.DataFrame:
         """
         Charge les données brutes du CSV avec mise en cache
         
         Args:
             force_reload: Force le rechargement des données même si elles sont en cache
+            generation: Génération à lire (défaut: génération courante)
             
         Returns:
             DataFrame contenant les données brutes
         """
-        if self.raw_data is None or force_reload:
-            try:
-                logger.info(f"Chargement des données depuis: {self.data_path}")
-                self.raw_data = pd.read_csv(self.data_path, parse_dates=["DATE"])
-                logger.info(f"Données chargées: {len(self.raw_data)} lignes, {len(self.raw_data.columns)} colonnes")
-                
-                # Nettoyage et préparation des données de base
-                self._prepare_base_data()
-                
-            except Exception as e:
-                logger.error(f"Erreur lors du chargement des données: {e}")
-                raise
+        return self._ensure_loaded(force_reload, generation).copy()
+    
+    def _ensure_loaded(self, force_reload: bool = False,
+                       generation: Optional[DatasetGeneration] = None) -> pd.DataFrame:
+        """
+        Charge les données si nécessaire et retourne la table partagée (sans copie)
         
-        return self.raw_data.copy()
+        La table retournée ne doit pas être modifiée par l'appelant.
+        """
+        if force_reload:
+            generation = self.refresh(warm=False)
+        return (generation or self.generation()).table
     
-    def _prepare_base_data(self):
+    def get_columns(self, columns: List[str],
+                    generation: Optional[DatasetGeneration] = None) -> pd.DataFrame:
         """
-        Prépare les données de base (colonnes communes utilisées par plusieurs visualisations)
+        Retourne quelques colonnes de la table préparée (copie)
+        
+        Avec un moteur SQL, seules ces colonnes sont lues: la table n'est pas
+        matérialisée (voir SQLBackend.select pour les colonnes disponibles).
+        
+        Args:
+            columns: Colonnes voulues, dans l'ordre du résultat
+            generation: Génération à lire (défaut: génération courante)
         """
-        if self.raw_data is not None:
-            # Ajout des colonnes temporelles communes
-            self.raw_data["YEAR"] = self.raw_data["DATE"].dt.year
-            self.raw_data["MONTH"] = self.raw_data["DATE"].dt.month
-            self.raw_data["SEASON"] = self.raw_data["MONTH"] % 12 // 3 + 1
-            
-            # Mapping des saisons
-            season_map = {1: "Winter", 2: "Spring", 3: "Summer", 4: "Autumn"}
-            self.raw_data["SEASON"] = self.raw_data["SEASON"].map(season_map)
+        generation = generation or self.generation()
+        if generation.backend is not None and not generation.table_loaded:
+            return generation.backend.select(columns)
+        return generation.table[list(columns)]
+    
+    def iter_incidents(self, columns: List[str],
+                       years: Optional[Sequence[int]] = None,
+                       pdqs: Optional[Sequence[int]] = None,
+                       category: Optional[int] = None,
+                       bbox: Optional[Sequence[float]] = None,
+                       chunk_rows: int = 10_000,
+                       generation: Optional[DatasetGeneration] = None) -> Iterator[pd.DataFrame]:
+        """
+        Incidents filtrés, tranche par tranche (au moins une tranche, vide si
+        aucune ligne ne correspond)
+        
+        En mémoire, le masque est calculé par tranche de la table partagée;
+        avec un moteur SQL, les filtres passent dans la clause WHERE et les
+        lignes sont lues par tranches: la table n'est jamais matérialisée.
+        
+        Args:
+            columns: Colonnes voulues (celles absentes du jeu sont ignorées)
+            years: Première et dernière année incluses
+            pdqs: PDQ retenus
+            category: Code de catégorie (CATEGORY_CODE)
+            bbox: lon_min, lat_min, lon_max, lat_max
+            chunk_rows: Lignes lues par tranche
+            generation: Génération à lire (défaut: génération courante)
+        """
+        generation = generation or self.generation()
+        if generation.backend is not None and not generation.table_loaded:
+            backend = generation.backend
+            where, params = backend.incident_where(years, pdqs, category, bbox)
+            empty = True
+            for chunk in backend.iter_rows(where, params, chunk_rows):
+                columns = [c for c in columns if c in chunk.columns]
+                empty = False
+                yield chunk[columns]
+            if empty:
+                # Aucune ligne: une tranche vide garde les colonnes
+                chunk = backend.rows("WHERE 1 = 0")
+                yield chunk[[c for c in columns if c in chunk.columns]]
+            return
+        
+        table = generation.table
+        columns = [c for c in columns if c in table.columns]
+        empty = True
+        for start in range(0, len(table), chunk_rows):
+            chunk = table.iloc[start:start + chunk_rows]
+            mask = np.ones(len(chunk), dtype=bool)
+            if years is not None:
+                chunk_years = chunk['YEAR'].to_numpy()
+                mask &= (chunk_years >= years[0]) & (chunk_years <= years[1])
+            if pdqs is not None:
+                mask &= chunk['PDQ'].isin(pdqs).to_numpy()
+            if category is not None:
+                mask &= chunk['CATEGORY_CODE'].to_numpy() == category
+            if bbox is not None:
+                lon_min, lat_min, lon_max, lat_max = bbox
+                mask &= (chunk['LONGITUDE'].between(lon_min, lon_max)
+                         & chunk['LATITUDE'].between(lat_min, lat_max)).to_numpy()
+            if mask.any():
+                empty = False
+                yield chunk.loc[mask, columns]
+        if empty:
+            yield table.iloc[:0][columns]
+    
+    def restore_prepared(self, table: pd.DataFrame, labels: Dict[str, Any],
+                         aggregates: Optional[Dict[str, Any]] = None,
+                         dataset_version: Optional[str] = None,
+                         caches: Optional[Dict[str, Any]] = None) -> DatasetGeneration:
+        """
+        Publie une table déjà préparée (artefacts de build) à la place du CSV
+        
+        Args:
+            table: Table telle que produite par _prepare_table()
+            labels: Tables de libellés correspondantes
+            aggregates: Agrégats précalculés (clés de DatasetGeneration.aggregates)
+            dataset_version: Empreinte du CSV d'origine, si connue
+            caches: Caches précalculés des visualisations
             
-            # Nettoyage des données QUART
-            if 'QUART' in self.raw_data.columns:
-                self.raw_data['QUART'] = self.raw_data['QUART'].str.lower()
-                self.raw_data['DayOfWeek'] = self.raw_data['DATE'].dt.dayofweek
-                self.raw_data['Day Type'] = self.raw_data['DayOfWeek'].apply(
-                    lambda x: 'Weekend' if x >= 5 else 'Weekday'
-                )
-                
-                # Mapping des périodes de la journée
-                time_labels = {
-                    'jour': 'Day (09:01–16:00)',
-                    'soir': 'Evening (16:01–00:00)',
-                    'nuit': 'Night (00:01–08:00)'
-                }
-                self.raw_data['Time of Day'] = self.raw_data['QUART'].map(time_labels)
+        Returns:
+            La génération publiée
+        """
+        generation = DatasetGeneration(next(_generation_ids), table, labels,
+                                       dataset_version=dataset_version,
+                                       source=_source_signature(self.data_path),
+                                       dataset=self.dataset)
+        generation.preload(aggregates, caches)
+        with self._refresh_lock:
+            self._publish(generation)
+        return generation
+    
+    def dataset_version(self) -> str:
+        """
+        Empreinte SHA-256 du fichier CSV chargé
+        
+        Identique dans tous les workers et entre déploiements tant que le
+        fichier ne change pas (ETags des exports). Avant le premier
+        chargement, l'empreinte du fichier sur disque.
+        """
+        generation = self._generation
+        if generation is None:
+            return _file_digest(self.data_path)
+        if generation.dataset_version is None:
+            generation.dataset_version = _file_digest(self.data_path)
+        return generation.dataset_version
+    
+    def get_labels(self, dimension: str, lang: str = 'en',
+                   generation: Optional[DatasetGeneration] = None) -> List[str]:
+        """
+        Retourne la table de libellés d'une dimension codée
+        
+        Args:
+            dimension: 'category', 'shift' ou 'season'
+            lang: 'fr', 'en' (et 'en_hours' pour les quarts)
+            generation: Génération à lire (défaut: génération courante)
             
-            logger.info("Données de base préparées avec colonnes temporelles")
+        Returns:
+            Liste des libellés, indexée par code
+        """
+        generation = generation or self.generation()
+        return list(generation.labels[dimension][lang])
     
-    @lru_cache(maxsize=32)
     def get_filtered_data(self, 
                          start_year: Optional[int] = None,
                          end_year: Optional[int] = None,
                          pdq: Optional[int] = None,
                          category: Optional[str] = None) -> pd.DataFrame:
         """
-        Retourne les données filtrées avec mise en cache LRU
+        Retourne les données filtrées avec mise en cache LRU (FILTERED_CACHE_SIZE
+        résultats par jeu de données, comptés par le budget mémoire)
         
         Args:
             start_year: Année de début (incluse)
@@ -133,30 +892,243 @@ class DataManager:
         Returns:
             DataFrame filtré
         """
-        cache_key = f"{start_year}_{end_year}_{pdq}_{category}"
-        
-        if cache_key in self._processed_cache:
+        generation = self.generation()
+        cache_key = (generation.id, start_year, end_year, pdq, category)
+        with self._filtered_lock:
+            data = self._processed_cache.get(cache_key)
+            if data is not None:
+                self._processed_cache.move_to_end(cache_key)
+                self._filtered_hits += 1
+            else:
+                self._filtered_misses += 1
+        if data is not None:
             logger.debug(f"Données filtrées trouvées en cache: {cache_key}")
-            return self._processed_cache[cache_key].copy()
-        
-        # Charger les données brutes si nécessaire
-        data = self.load_raw_data()
-        
-        # Appliquer les filtres
-        if start_year is not None:
-            data = data[data['YEAR'] >= start_year]
-        if end_year is not None:
-            data = data[data['YEAR'] <= end_year]
-        if pdq is not None:
-            data = data[data['PDQ'] == pdq]
-        if category is not None:
-            data = data[data['CATEGORIE'] == category]
-        
-        # Mettre en cache le résultat
-        self._processed_cache[cache_key] = data.copy()
+            memory_budget.touch(generation.owner, ('filtered', cache_key))
+            return data.copy()
+        return single_flight.do("data_manager.filtered", cache_key,
+                                lambda: self._filtered_data(generation, cache_key)).copy()
+    
+    def _filtered_data(self, generation: DatasetGeneration, cache_key: tuple) -> pd.DataFrame:
+        """Filtrage de get_filtered_data() sur generation, gardé si elle est encore courante"""
+        _, start_year, end_year, pdq, category = cache_key
+        if generation.backend is not None:
+            # Filtres exécutés par le moteur SQL: seules les lignes retenues sont lues
+            data = generation.backend.filtered(start_year, end_year, pdq, category)
+        else:
+            data = generation.table
+            
+            # Appliquer les filtres
+            if start_year is not None:
+                data = data[data['YEAR'] >= start_year]
+            if end_year is not None:
+                data = data[data['YEAR'] <= end_year]
+            if pdq is not None:
+                data = data[data['PDQ'] == pdq]
+            if category is not None:
+                data = data[data['CATEGORIE'] == category]
+        # Copie gardée en cache: les appelants reçoivent chacun leur copie
+        data = data.copy()
+        
+        # Génération remplacée pendant le calcul: résultat retourné, non conservé
+        # (le cache ne contient que des entrées de la génération courante)
+        if generation is not self._generation:
+            logger.debug(f"Génération {generation.id} remplacée pendant le filtrage")
+            return data
+        
+        with self._filtered_lock:
+            self._processed_cache[cache_key] = data
+            self._processed_cache.move_to_end(cache_key)
+            dropped = []
+            while len(self._processed_cache) > FILTERED_CACHE_SIZE:
+                dropped.append(self._processed_cache.popitem(last=False)[0])
+        memory_budget.add(generation.owner, ('filtered', cache_key), data,
+                          evict=lambda: self._pop_filtered(cache_key))
+        for key in dropped:
+            memory_budget.discard((self.dataset, key[0]), ('filtered', key))
         logger.debug(f"Données filtrées mises en cache: {cache_key} ({len(data)} lignes)")
+        return data
+    
+    def _pop_filtered(self, cache_key: tuple):
+        """Éviction d'une entrée des données filtrées par le budget mémoire"""
+        with self._filtered_lock:
+            self._processed_cache.pop(cache_key, None)
+    
+    def _filtered_values(self) -> List[pd.DataFrame]:
+        with self._filtered_lock:
+            return list(self._processed_cache.values())
+    
+    def get_count_cube(self, generation: Optional[DatasetGeneration] = None) -> CountCube:
+        """
+        Retourne le cube de comptes (pdq, year, month, category, shift, day_type)
+        
+        Construit une seule fois par jeu de données avec np.bincount; les filtres
+        des visualisations deviennent des découpages et sommes sur ce tableau.
+        """
+        generation = generation or self.generation()
         
-        return data.copy()
+        def build():
+            labels = self.get_labels('category', 'en', generation)
+            if generation.backend is not None:
+                cube = generation.backend.count_cube(labels)
+            else:
+                cube = build_count_cube(generation.table, labels)
+            logger.info(f"Cube de comptes construit: forme {cube.counts.shape}, {cube.nbytes / 1e6:.1f} Mo")
+            return cube
+        
+        return generation.aggregate('count_cube', build)
+    
+    def get_year_prefix_counts(self, generation: Optional[DatasetGeneration] = None) -> YearPrefixCounts:
+        """
+        Retourne les comptes cumulés par année (pdq, année, catégorie, quart, type de jour)
+        
+        Toute plage d'années est une différence de deux lignes cumulées.
+        """
+        generation = generation or self.generation()
+        return generation.aggregate('year_prefix', lambda: YearPrefixCounts(self.get_count_cube(generation)))
+    
+    def get_daily_counts(self, generation: Optional[DatasetGeneration] = None) -> DailyCounts:
+        """
+        Retourne les comptes quotidiens (jour, pdq, catégorie)
+        
+        Construits une seule fois par jeu de données avec np.bincount sur le
+        décalage en jours de DATE.
+        """
+        generation = generation or self.generation()
+        
+        def build():
+            labels = self.get_labels('category', 'en', generation)
+            if generation.backend is not None:
+                daily = generation.backend.daily_counts(labels)
+            else:
+                daily = build_daily_counts(generation.table, labels)
+            logger.info(f"Comptes quotidiens construits: forme {daily.counts.shape}, {daily.nbytes / 1e6:.1f} Mo")
+            return daily
+        
+        return generation.aggregate('daily_counts', build)
+    
+    @staticmethod
+    def _daily_state(daily: DailyCounts) -> Tuple[tuple, np.ndarray]:
+        """Axes (premier jour, PDQ, catégories) et valeurs (jours x séries) des comptes quotidiens"""
+        values = daily.counts.reshape(daily.counts.shape[0], -1)
+        return (daily.start, tuple(daily.labels['pdq']), tuple(daily.labels['category'])), values
+    
+    @staticmethod
+    def _extended_state(state, axes: tuple, values: np.ndarray):
+        """
+        État incrémental précédent (analyse ou détection) si les comptes le
+        prolongent: mêmes axes, jours déjà connus inchangés; None sinon
+        """
+        if state is None:
+            return None
+        previous_axes, previous = state
+        if (previous_axes == axes and previous.steps <= len(values)
+                and np.array_equal(previous.values, values[:previous.steps])):
+            return previous
+        return None
+    
+    def get_series_analytics(self, generation: Optional[DatasetGeneration] = None) -> SeriesAnalytics:
+        """
+        Retourne l'analyse (moyennes glissantes, référence saisonnière, prévision)
+        de toutes les séries quotidiennes PDQ x catégorie
+        
+        Si les comptes de la génération prolongent ceux de l'analyse
+        précédente, seuls les nouveaux jours sont ajoutés (SeriesAnalytics.append).
+        """
+        generation = generation or self.generation()
+        
+        def build():
+            daily = self.get_daily_counts(generation)
+            axes, values = self._daily_state(daily)
+            previous = self._extended_state(self._series_state, axes, values)
+            if previous is not None:
+                analytics = copy.copy(previous)
+                analytics.append(values[previous.steps:], week_of_year_buckets(daily.dates[previous.steps:]))
+                logger.info(f"Analyse des séries prolongée de {len(values) - previous.steps} jours")
+            else:
+                analytics = daily_analytics(daily)
+            self._series_state = (axes, analytics)
+            return analytics
+        
+        return generation.aggregate('series_analytics', build)
+    
+    def get_anomalies(self, generation: Optional[DatasetGeneration] = None) -> AnomalyDetector:
+        """
+        Retourne la détection des pics de toutes les séries quotidiennes PDQ x catégorie
+        
+        Si les comptes de la génération prolongent ceux de la détection
+        précédente (mêmes jours déjà connus, jours ajoutés à la fin), seuls
+        les nouveaux jours sont évalués.
+        """
+        generation = generation or self.generation()
+        
+        def build():
+            daily = self.get_daily_counts(generation)
+            axes, values = self._daily_state(daily)
+            previous = self._extended_state(self._anomaly_state, axes, values)
+            if previous is not None:
+                detector = copy.copy(previous)
+                detector.append(values[previous.steps:])
+                logger.info(f"Anomalies prolongées de {len(values) - previous.steps} jours")
+            else:
+                detector = daily_anomalies(daily)
+            self._anomaly_state = (axes, detector)
+            return detector
+        
+        return generation.aggregate('anomalies', build)
+    
+    def _anomaly_columns(self, daily: DailyCounts, pdq_codes=None, category_codes=None) -> np.ndarray:
+        """Colonnes (pdq, catégorie) des séries sélectionnées, sans les cases « manquant »"""
+        pdqs = np.arange(len(daily.labels['pdq'])) if pdq_codes is None else pdq_codes
+        categories = np.arange(len(daily.labels['category'])) if category_codes is None else category_codes
+        return series_columns(daily, pdqs, categories)
+    
+    def get_anomaly_flags(self, pdq_codes=None, category_codes=None,
+                          generation: Optional[DatasetGeneration] = None) -> np.ndarray:
+        """
+        Jours où au moins une des séries sélectionnées est signalée
+        
+        Returns:
+            Booléens alignés sur DailyCounts.dates
+        """
+        generation = generation or self.generation()
+        daily = self.get_daily_counts(generation)
+        columns = self._anomaly_columns(daily, pdq_codes, category_codes)
+        return self.get_anomalies(generation).flags(columns).any(axis=1)
+    
+    def get_anomaly_events(self, pdq_codes=None, category_codes=None, years=None,
+                           generation: Optional[DatasetGeneration] = None) -> pd.DataFrame:
+        """
+        Table des jours signalés par la détection d'anomalies
+        
+        Args:
+            pdq_codes: Codes de PDQ (None = tous)
+            category_codes: Codes de catégorie (None = toutes)
+            years: [début, fin] inclus, ou None
+        
+        Returns:
+            DataFrame DATE, PDQ, CATEGORY_CODE, CATEGORY, COUNT, BASELINE, Z,
+            du plus récent au plus ancien
+        """
+        generation = generation or self.generation()
+        daily = self.get_daily_counts(generation)
+        columns = self._anomaly_columns(daily, pdq_codes, category_codes)
+        steps, columns, counts, baseline, z = self.get_anomalies(generation).events(columns)
+        
+        n_cat = daily.counts.shape[2]
+        pdqs, categories = np.divmod(columns, n_cat)
+        events = pd.DataFrame({
+            'DATE': daily.start + steps.astype('timedelta64[D]'),
+            'PDQ': np.asarray(daily.labels['pdq'])[pdqs],
+            'CATEGORY_CODE': categories,
+            'CATEGORY': np.asarray(daily.labels['category'], dtype=object)[categories],
+            'COUNT': counts,
+            'BASELINE': baseline.astype(np.float64),
+            'Z': np.round(z.astype(np.float64), 2),
+        })
+        if years is not None:
+            event_years = events['DATE'].dt.year
+            events = events[(event_years >= years[0]) & (event_years <= years[1])]
+        return events.sort_values(['DATE', 'Z'], ascending=False, kind='stable').reset_index(drop=True)
     
     def get_data_for_viz1(self) -> pd.DataFrame:
         """
@@ -170,17 +1142,19 @@ class DataManager:
         """
         return self.load_raw_data()
     
-    def get_data_for_viz3(self) -> pd.DataFrame:
+    def get_data_for_viz3(self, generation: Optional[DatasetGeneration] = None) -> pd.DataFrame:
         """
-        Retourne les données préparées pour la visualisation 3
+        Retourne les colonnes de la visualisation 3 (positions, PDQ, année, catégorie)
         """
-        return self.load_raw_data()
+        return self.get_columns(['LONGITUDE', 'LATITUDE', 'PDQ', 'YEAR', 'CATEGORY_CODE'], generation)
     
-    def get_data_for_viz4(self) -> pd.DataFrame:
+    def get_data_for_viz4(self, generation: Optional[DatasetGeneration] = None) -> pd.DataFrame:
         """
         Retourne les données préparées pour la visualisation 4
+        
+        Les statistiques de viz4 viennent du cube de comptes (get_count_cube).
         """
-        return self.load_raw_data()
+        return self.load_raw_data(generation=generation)
     
     def get_data_for_viz5(self) -> pd.DataFrame:
         """
@@ -188,27 +1162,103 @@ class DataManager:
         """
         return self.load_raw_data()
     
+    def generation_caches(self, prefix: str = "") -> Dict[str, Any]:
+        """Caches de la génération courante (sans déclencher de chargement)"""
+        generation = self._generation
+        return generation.cache_items(prefix) if generation is not None else {}
+    
+    def evict_generation_caches(self, prefix: str = ""):
+        """Retire des caches de la génération courante (recalculés à la demande)"""
+        generation = self._generation
+        if generation is not None:
+            generation.evict(prefix)
+    
+    def _clear_filtered(self):
+        """Vide les données filtrées (et retire leurs entrées du budget mémoire)"""
+        with self._filtered_lock:
+            keys = list(self._processed_cache)
+            self._processed_cache.clear()
+        for key in keys:
+            memory_budget.discard((self.dataset, key[0]), ('filtered', key))
+    
     def clear_cache(self):
         """
-        Vide tous les caches
+        Vide les données filtrées et les agrégats de la génération courante
         """
-        self._processed_cache.clear()
-        self.get_filtered_data.cache_clear()
+        self._clear_filtered()
+        generation = self._generation
+        if generation is not None:
+            generation.evict(kind='aggregates')
         logger.info("Cache vidé")
     
-    def get_cache_info(self) -> Dict[str, Any]:
+    def get_cache_info(self, top_allocations: int = 0) -> Dict[str, Any]:
         """
         Retourne des informations sur l'état du cache
+        
+        Args:
+            top_allocations: Nombre de sites d'allocation tracemalloc à inclure
+            
+        Returns:
+            Dictionnaire avec la taille des caches et la comptabilité mémoire
+            de tous les jeux de données et caches enregistrés (octets)
         """
+        generation = self._generation
         return {
+            'dataset': self.dataset,
+            'datasets': list_datasets(),
+            'memory_budget': memory_budget.report(),
             'processed_cache_size': len(self._processed_cache),
-            'lru_cache_info': self.get_filtered_data.cache_info(),
-            'data_loaded': self.raw_data is not None,
-            'data_shape': self.raw_data.shape if self.raw_data is not None else None
+            'filtered_cache_info': {'size': len(self._processed_cache), 'maxsize': FILTERED_CACHE_SIZE,
+                                    'hits': self._filtered_hits, 'misses': self._filtered_misses},
+            'data_loaded': generation is not None,
+            'data_shape': generation._table.shape if generation is not None and generation.table_loaded else None,
+            'backend': self.backend_engine,
+            'generation': {
+                'id': generation.id,
+                'rows': generation.rows,
+                'created': generation.created,
+                'aggregates': sorted(generation.aggregates),
+                'caches': sorted(generation.caches),
+            } if generation is not None else None,
+            'single_flight': single_flight.stats(),
+            'memory': memory_accounting.memory_report(top_allocations=top_allocations)
         }
 
-# Instance globale du gestionnaire de données
+
+def _file_digest(path: str) -> str:
+    """SHA-256 d'un fichier, lu par blocs"""
+    digest = hashlib.sha256()
+    with open(path, 'rb') as f:
+        for block in iter(lambda: f.read(1 << 20), b''):
+            digest.update(block)
+    return digest.hexdigest()
+
+register_datasets_from_environ()
+
+# Instance globale du gestionnaire de données (jeu des incidents)
 data_manager = DataManager()
+# Codes de catégorie des sélections partagées vérifiés contre le jeu courant
+shared_selection.register_category_labels(lambda: data_manager.get_labels('category', 'en'))
+
+
+def get_data_manager(dataset: str = DEFAULT_DATASET) -> DataManager:
+    """Gestionnaire d'un jeu de données enregistré (créé au premier appel)"""
+    return DataManager(dataset)
+
+
+def list_datasets() -> Dict[str, Dict[str, Any]]:
+    """Jeux de données enregistrés: description et génération chargée"""
+    result = {}
+    for name, spec in DATASETS.items():
+        manager = DataManager._instances.get(name)
+        generation = manager._generation if manager is not None else None
+        result[name] = {
+            'description': spec.description,
+            'pinned': spec.pinned,
+            'generation': generation.id if generation is not None else None,
+            'rows': generation.rows if generation is not None else None,
+        }
+    return result
 
 # Fonctions utilitaires pour faciliter l'utilisation
 def get_data() -> pd.DataFrame:
@@ -219,7 +1269,10 @@ def get_filtered_data(**kwargs) -> pd.DataFrame:
     """Fonction utilitaire pour obtenir les données filtrées"""
     return data_manager.get_filtered_data(**kwargs)
 
+def get_labels(dimension: str, lang: str = 'en') -> List[str]:
+    """Fonction utilitaire pour obtenir une table de libellés"""
+    return data_manager.get_labels(dimension, lang)
+
 def clear_data_cache():
     """Fonction utilitaire pour vider le cache"""
     data_manager.clear_cache()
-
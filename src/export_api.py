@@ -0,0 +1,380 @@
+"""
+API d'export en flux des incidents filtrés et des agrégats du tableau de bord
+
+Routes installées sur le serveur Flask de l'application:
+    GET /api/export/incidents
+    GET /api/export/aggregates            (liste des agrégats disponibles)
+    GET /api/export/aggregates/<nom>
+
+Paramètres communs:
+    format=csv|jsonl|arrow     (csv par défaut; arrow demande pyarrow)
+    start_year, end_year       Plage d'années incluse (400 si start_year > end_year;
+                               une plage hors des données est vide)
+    pdq=21,22                  Un ou plusieurs PDQ
+    district=West              District SPVM (ignoré si pdq est donné)
+    category=4 | Robbery       Code ou libellé (fr/en) du type de crime
+    bbox=lon_min,lat_min,lon_max,lat_max   (incidents seulement)
+    by=year,category           Axes du cube (agrégat « counts » seulement)
+
+Les lignes sont produites par tranches de CHUNK_ROWS: la mémoire utilisée ne
+dépend pas du nombre de lignes exportées. Chaque réponse porte un ETag dérivé
+de la version du jeu de données et de la requête; If-None-Match est honoré
+(304 sans corps).
+"""
+
+import hashlib
+import io
+import itertools
+import json
+import logging
+from typing import Any, Callable, Dict, Iterator, List, Optional
+
+import numpy as np
+import pandas as pd
+
+import selection as shared_selection
+from data_manager import data_manager
+
+logger = logging.getLogger(__name__)
+
+EXPORT_PREFIX = "/api/export"
+CHUNK_ROWS = 10_000
+INCIDENT_COLUMNS = ['CATEGORIE', 'DATE', 'QUART', 'PDQ', 'X', 'Y', 'LONGITUDE', 'LATITUDE']
+
+FORMATS = {
+    'csv': 'text/csv; charset=utf-8',
+    'jsonl': 'application/x-ndjson',
+    'arrow': 'application/vnd.apache.arrow.stream',
+}
+EXTENSIONS = {'csv': 'csv', 'jsonl': 'jsonl', 'arrow': 'arrows'}
+
+
+class ExportError(ValueError):
+    """Paramètre d'export invalide (réponse 400)"""
+
+
+def _int_list(value: Optional[str], name: str) -> Optional[List[int]]:
+    if not value:
+        return None
+    try:
+        return [int(float(v)) for v in value.split(',') if v.strip()]
+    except (ValueError, OverflowError):
+        raise ExportError(f"{name}: entiers séparés par des virgules attendus")
+
+
+def _category_code(value: Optional[str]) -> Optional[int]:
+    if not value:
+        return None
+    labels = [data_manager.get_labels('category', lang) for lang in ('en', 'fr')]
+    if value.lstrip('-').isdigit():
+        code = int(value)
+        if 0 <= code < len(labels[0]):
+            return code
+    for table in labels:
+        lowered = [label.lower() for label in table]
+        if value.lower() in lowered:
+            return lowered.index(value.lower())
+    raise ExportError(f"category: type de crime inconnu '{value}'")
+
+
+def parse_filters(args) -> Dict[str, Any]:
+    """
+    Filtres d'export à partir des paramètres de requête
+
+    Returns:
+        dict avec 'selection' (format de selection.py), 'pdqs' (liste ou None),
+        'bbox' (lon_min, lat_min, lon_max, lat_max ou None) et 'several_pdqs'
+        (plusieurs PDQ demandés explicitement)
+    """
+    years = None
+    start, end = args.get('start_year'), args.get('end_year')
+    if start or end:
+        try:
+            start, end = (int(start) if start else None), (int(end) if end else None)
+        except ValueError:
+            raise ExportError("start_year / end_year: années entières attendues")
+        if start is not None and end is not None and start > end:
+            raise ExportError("start_year: doit précéder end_year")
+        # Borne absente: jusqu'au bout des données, sans ramener l'autre borne
+        # dans la plage disponible (une plage hors données est vide)
+        available = data_manager.get_count_cube().labels['year']
+        if start is None:
+            start = min(available[0], end)
+        if end is None:
+            end = max(available[-1], start)
+        years = [start, end]
+
+    pdqs = _int_list(args.get('pdq'), 'pdq')
+    district = args.get('district') or None
+    if district is not None and district not in shared_selection.district_pdqs():
+        raise ExportError(f"district: district inconnu '{district}'")
+
+    selection = shared_selection.normalize_selection({
+        'pdq': pdqs[0] if pdqs and len(pdqs) == 1 else None,
+        'district': None if pdqs else district,
+        'category': _category_code(args.get('category')),
+        'years': years,
+    })
+    several_pdqs = pdqs is not None and len(pdqs) > 1
+    if pdqs is None:
+        pdqs = shared_selection.selected_pdqs(selection)
+
+    bbox = args.get('bbox')
+    if bbox:
+        try:
+            bbox = [float(v) for v in bbox.split(',')]
+        except ValueError:
+            bbox = None
+        if bbox is None or len(bbox) != 4:
+            raise ExportError("bbox: lon_min,lat_min,lon_max,lat_max attendu")
+
+    return {'selection': selection, 'pdqs': pdqs, 'bbox': bbox, 'several_pdqs': several_pdqs}
+
+
+def iter_incident_chunks(filters: Dict[str, Any], chunk_rows: int = CHUNK_ROWS) -> Iterator[pd.DataFrame]:
+    """
+    Incidents filtrés, tranche par tranche (DataManager.iter_incidents)
+
+    Aucune copie de la table complète; avec un moteur SQL, les filtres sont
+    exécutés par la base et la table n'est pas matérialisée. Sans ligne, une
+    tranche vide garde l'en-tête CSV / le schéma Arrow.
+    """
+    selection = filters['selection']
+    return data_manager.iter_incidents(INCIDENT_COLUMNS, years=selection['years'], pdqs=filters['pdqs'],
+                                       category=selection['category'], bbox=filters['bbox'],
+                                       chunk_rows=chunk_rows)
+
+
+def _frame_chunks(frame: pd.DataFrame, chunk_rows: int = CHUNK_ROWS) -> Iterator[pd.DataFrame]:
+    yield frame.iloc[:chunk_rows]
+    for start in range(chunk_rows, len(frame), chunk_rows):
+        yield frame.iloc[start:start + chunk_rows]
+
+
+# --- Agrégats -----------------------------------------------------------------
+
+def _period_counts(view: str) -> Callable[[Dict[str, Any]], pd.DataFrame]:
+    def build(filters):
+        from visualizations import viz1
+        if view in viz1.TIME_SERIES_VIEWS:
+            # Largeur « infinie »: série complète, sans réduction LTTB
+            series = viz1.get_time_series(view, filters['selection'], width=np.iinfo(np.int64).max)
+            x, y = series['x'], series['y']
+        else:
+            x, y = viz1.get_period_counts(view, filters['selection'])
+        return pd.DataFrame({'period': x, 'crimes': y})
+    return build
+
+
+def _range_summary(part: str) -> Callable[[Dict[str, Any]], pd.DataFrame]:
+    def build(filters):
+        from visualizations import viz2
+        summary = viz2.get_range_summary(filters['selection'])[part]
+        if isinstance(summary, pd.Series):
+            return summary.rename_axis('label').reset_index(name='crimes')
+        return summary.rename(columns={'YEAR': 'year', 'Crimes': 'crimes'})
+    return build
+
+
+def _pdq_year_stats(filters):
+    from visualizations import viz4
+    stats = viz4.get_pdq_year_stats()
+    selection = filters['selection']
+    if filters['pdqs'] is not None:
+        stats = stats[stats['PDQ'].isin(filters['pdqs'])]
+    if selection['years'] is not None:
+        stats = stats[stats['YEAR'].between(*selection['years'])]
+    return stats
+
+
+def _heatmap(index: int) -> Callable[[Dict[str, Any]], pd.DataFrame]:
+    def build(filters):
+        from visualizations import viz5
+        selection = filters['selection']
+        heat = viz5.get_heatmap_data(selection['pdq'], selection['district'], selection['years'])[index]
+        heat = heat.rename_axis(index='category', columns='column')
+        return heat.stack().rename('crimes').reset_index()
+    return build
+
+
+def _anomalies(filters):
+    daily = data_manager.get_daily_counts()
+    pdq_codes = None
+    if filters['pdqs'] is not None:
+        wanted = set(filters['pdqs'])
+        pdq_codes = [i for i, p in enumerate(daily.labels['pdq']) if p in wanted]
+    selection = filters['selection']
+    category = None if selection['category'] is None else [selection['category']]
+    events = data_manager.get_anomaly_events(pdq_codes, category, selection['years'])
+    return events.drop(columns='CATEGORY_CODE').rename(columns=str.lower)
+
+
+def _cube_counts(filters, by: Optional[str] = None):
+    cube = data_manager.get_count_cube()
+    keep = tuple(d.strip() for d in (by or 'year').split(',') if d.strip())
+    unknown = [d for d in keep if d not in cube.dims]
+    if unknown or len(set(keep)) != len(keep):
+        raise ExportError(f"by: axes parmi {', '.join(cube.dims)} attendus")
+
+    selection = filters['selection']
+    year_codes = None
+    if selection['years'] is not None:
+        year_codes = [i for i, y in enumerate(cube.labels['year'])
+                      if selection['years'][0] <= y <= selection['years'][1]]
+    pdq_codes = None if filters['pdqs'] is None else cube.index_of('pdq', filters['pdqs'])
+    category = None if selection['category'] is None else [selection['category']]
+
+    counts = cube.sum(keep=keep, pdq=pdq_codes, category=category, year=year_codes)
+    if not keep:
+        return pd.DataFrame({'crimes': [int(counts)]})
+
+    axes = []
+    for dim in keep:
+        labels = list(cube.labels[dim])
+        if dim == 'pdq' and pdq_codes is not None:
+            labels = [labels[i] for i in pdq_codes]
+        elif dim == 'year' and year_codes is not None:
+            labels = [labels[i] for i in year_codes]
+        elif dim == 'category' and category is not None:
+            labels = [labels[i] for i in category]
+        axes.append(labels)
+    index = pd.MultiIndex.from_product(axes, names=list(keep))
+    frame = pd.DataFrame({'crimes': counts.reshape(-1)}, index=index).reset_index()
+    return frame[frame['crimes'] > 0].reset_index(drop=True)
+
+
+AGGREGATES: Dict[str, Dict[str, Any]] = {
+    'yearly': {'build': _period_counts('Yearly'), 'description': "viz1: crimes per year"},
+    'seasonal': {'build': _period_counts('Seasonal'), 'description': "viz1: crimes per season"},
+    'monthly': {'build': _period_counts('Monthly'), 'description': "viz1: crimes per month"},
+    'weekly': {'build': _period_counts('Weekly'), 'description': "viz1: crimes per week (full resolution)"},
+    'daily': {'build': _period_counts('Daily'), 'description': "viz1: crimes per day (full resolution)"},
+    'time_of_day': {'build': _range_summary('time_of_day'), 'description': "viz2: crimes per time of day"},
+    'day_type': {'build': _range_summary('day_type'), 'description': "viz2: weekday vs weekend"},
+    'night_trend': {'build': _range_summary('night_trend'), 'description': "viz2: night-time crimes per year"},
+    'pdq_year': {'build': _pdq_year_stats, 'description': "viz4: per PDQ-year totals and dominant crime",
+                 'multi_pdq': True},
+    'heatmap_time': {'build': _heatmap(0), 'description': "viz5: crime type x time of day"},
+    'heatmap_season': {'build': _heatmap(1), 'description': "viz5: crime type x season"},
+    'heatmap_year': {'build': _heatmap(2), 'description': "viz5: crime type x year"},
+    'anomalies': {'build': _anomalies, 'description': "flagged days per PDQ x crime type (robust z vs baseline)",
+                  'multi_pdq': True},
+    'counts': {'build': _cube_counts, 'description': "count cube summed over any axes (by=pdq,year,...)",
+               'multi_pdq': True},
+}
+
+
+# --- Sérialisation ------------------------------------------------------------
+
+def serialize_chunks(chunks: Iterator[pd.DataFrame], fmt: str) -> Iterator[bytes]:
+    """Encode des tranches de DataFrame en CSV, JSON lines ou flux Arrow IPC"""
+    if fmt == 'csv':
+        header = True
+        for chunk in chunks:
+            yield chunk.to_csv(index=False, header=header, date_format='%Y-%m-%d').encode('utf-8')
+            header = False
+    elif fmt == 'jsonl':
+        for chunk in chunks:
+            if len(chunk):
+                yield chunk.to_json(orient='records', lines=True, date_format='iso',
+                                    force_ascii=False).encode('utf-8').rstrip(b'\n') + b'\n'
+    elif fmt == 'arrow':
+        import pyarrow as pa
+
+        sink = io.BytesIO()
+        writer = None
+        for chunk in chunks:
+            batch = pa.RecordBatch.from_pandas(chunk, preserve_index=False)
+            if writer is None:
+                writer = pa.ipc.new_stream(sink, batch.schema)
+            writer.write_batch(batch)
+            yield sink.getvalue()
+            sink.seek(0)
+            sink.truncate()
+        if writer is not None:
+            writer.close()
+            yield sink.getvalue()
+    else:
+        raise ExportError(f"format: {', '.join(FORMATS)} attendu")
+
+
+def _check_format(fmt: str):
+    if fmt not in FORMATS:
+        raise ExportError(f"format: {', '.join(FORMATS)} attendu")
+    if fmt == 'arrow':
+        try:
+            import pyarrow  # noqa: F401
+        except ImportError:
+            raise ExportError("format=arrow: pyarrow n'est pas installé sur le serveur")
+
+
+def export_etag(kind: str, args) -> str:
+    """ETag de la version du jeu de données et des paramètres de la requête"""
+    query = json.dumps(sorted((k, v) for k, v in args.items(multi=True)), ensure_ascii=False)
+    digest = hashlib.sha256(f"{kind}\n{query}".encode('utf-8')).hexdigest()[:16]
+    return f'"{data_manager.dataset_version()[:16]}-{digest}"'
+
+
+def install_export_api(server):
+    """Installe les routes d'export sur le serveur Flask"""
+    from flask import Response, jsonify, request
+
+    def _error(message: str, status: int = 400):
+        response = jsonify({'error': message})
+        response.status_code = status
+        return response
+
+    def _stream(kind: str, name: str, make_chunks: Callable[[Dict[str, Any]], Iterator[pd.DataFrame]]):
+        fmt = request.args.get('format', 'csv').lower()
+        try:
+            _check_format(fmt)
+            etag = export_etag(kind, request.args)
+            if request.if_none_match.contains_weak(etag.strip('"')):
+                response = Response(status=304)
+                response.headers['ETag'] = etag
+                return response
+            filters = parse_filters(request.args)
+            chunks = make_chunks(filters)
+            # Première tranche calculée avant l'envoi des en-têtes: les erreurs
+            # de paramètres donnent encore une réponse 400
+            first = next(chunks)
+        except ExportError as e:
+            return _error(str(e))
+
+        def generate():
+            for part in serialize_chunks(itertools.chain([first], chunks), fmt):
+                if part:
+                    yield part
+
+        response = Response(generate(), mimetype=FORMATS[fmt])
+        response.headers['ETag'] = etag
+        response.headers['Cache-Control'] = 'no-cache'
+        response.headers['Content-Disposition'] = f'attachment; filename="{name}.{EXTENSIONS[fmt]}"'
+        return response
+
+    @server.route(f"{EXPORT_PREFIX}/incidents")
+    def export_incidents():
+        return _stream('incidents', 'incidents', lambda filters: iter_incident_chunks(filters))
+
+    @server.route(f"{EXPORT_PREFIX}/aggregates")
+    def list_aggregates():
+        return jsonify({name: entry['description'] for name, entry in AGGREGATES.items()})
+
+    @server.route(f"{EXPORT_PREFIX}/aggregates/<name>")
+    def export_aggregate(name):
+        if name not in AGGREGATES:
+            return _error(f"agrégat inconnu '{name}'", 404)
+        build = AGGREGATES[name]['build']
+
+        def make_chunks(filters):
+            if filters['several_pdqs'] and not AGGREGATES[name].get('multi_pdq'):
+                raise ExportError(f"pdq: un seul PDQ accepté pour l'agrégat '{name}'")
+            if name == 'counts':
+                frame = build(filters, request.args.get('by'))
+            else:
+                frame = build(filters)
+            return _frame_chunks(frame)
+
+        return _stream(f'aggregate:{name}', name, make_chunks)
+
+    logger.info(f"API d'export installée sous {EXPORT_PREFIX}")
@@ -0,0 +1,210 @@
+"""
+Construction légère des figures des callbacks fréquents
+
+viz1.update_graph, les graphiques de viz2 (et leur mise en forme commune) et
+les traces de la carte viz3 construisaient des go.Figure / px: plotly valide
+chaque propriété à l'affectation, puis l'encodeur JSON reconvertit chaque
+tableau numpy en liste nombre par nombre. Ce module produit directement le
+dictionnaire {"data": [...], "layout": {...}} que reçoit dcc.Graph:
+
+- aucune validation: les propriétés sont écrites sous la forme exacte que
+  plotly sérialise (titres {"text": ...}, gabarit par défaut dans
+  layout.template), le rendu est donc identique;
+- les colonnes numériques sont des tableaux typés plotly.js
+  ({"dtype": "f8", "bdata": <base64>}, plotly.js >= 2.28), décodés d'un bloc
+  par le navigateur; les dates sont des chaînes ISO;
+- to_json() sérialise avec orjson s'il est installé (json sinon); Dash
+  utilise de même orjson via plotly.io.json quand il est disponible.
+
+plain() décode les tableaux typés: plain(figure) est comparable au résultat
+de fig.to_plotly_json() d'une go.Figure équivalente.
+"""
+
+import base64
+import functools
+import json
+import math
+from typing import Any, Dict, Iterable, Optional
+
+import numpy as np
+
+try:
+    import orjson
+except ImportError:  # pragma: no cover - dépendance optionnelle
+    orjson = None
+
+# En dessous, une liste JSON est plus courte que l'en-tête du tableau typé
+TYPED_ARRAY_MIN = 8
+
+# Types de tableaux typés reconnus par plotly.js (pas d'entiers 64 bits)
+_TYPED_CODES = {
+    np.dtype("<f8"): "f8", np.dtype("<f4"): "f4",
+    np.dtype("<i4"): "i4", np.dtype("<u4"): "u4",
+    np.dtype("<i2"): "i2", np.dtype("<u2"): "u2",
+    np.dtype("i1"): "i1", np.dtype("u1"): "u1",
+}
+_TYPED_DTYPES = {code: dtype for dtype, code in _TYPED_CODES.items()}
+_INT_DTYPES = [np.dtype(code) for code in ("u1", "i1", "u2", "i2", "u4", "i4")]
+
+
+def _smallest_int(values: np.ndarray) -> np.dtype:
+    """Plus petit type entier de plotly.js qui contient values (None sinon)"""
+    low, high = (values.min(), values.max()) if len(values) else (0, 0)
+    for dtype in _INT_DTYPES:
+        info = np.iinfo(dtype)
+        if low >= info.min and high <= info.max:
+            return dtype
+    return None
+
+
+def typed_array(values: np.ndarray) -> Dict[str, str]:
+    """
+    Tableau typé plotly.js d'un tableau numérique 1-D
+
+    Les entiers (et les réels à valeurs entières, ex. une ligne de médiane)
+    sont écrits dans le plus petit type entier qui les contient: un compte
+    quotidien tient sur un octet au lieu de 8. NaN reste une valeur manquante.
+    """
+    values = np.asarray(values).ravel()
+    if values.dtype.kind == "b":
+        values = values.astype(np.uint8)
+    elif values.dtype.kind == "f" and np.isfinite(values).all() and (values == np.round(values)).all():
+        dtype = _smallest_int(values)
+        if dtype is not None:
+            values = values.astype(dtype)
+    if values.dtype.kind in "iu":
+        values = values.astype(_smallest_int(values) or np.float64, copy=False)
+    elif values.dtype.itemsize not in (4, 8):
+        values = values.astype(np.float64)
+    dtype = values.dtype.newbyteorder("<") if values.dtype.itemsize > 1 else values.dtype
+    return {
+        "dtype": _TYPED_CODES[dtype],
+        "bdata": base64.b64encode(np.ascontiguousarray(values, dtype=dtype).tobytes()).decode("ascii"),
+    }
+
+
+def array(values) -> Any:
+    """
+    Valeur JSON d'une colonne de données (x, y, lat, customdata...)
+
+    Tableaux numériques 1-D: tableau typé (liste si moins de TYPED_ARRAY_MIN
+    valeurs); dates: chaînes ISO les plus courtes sans perte ("2015-01-01"
+    pour des jours, comme dans les réponses Dash); le reste (texte,
+    objets, 2-D): listes imbriquées, NaN remplacé par null.
+    """
+    if hasattr(values, "to_numpy"):
+        values = values.to_numpy()
+    values = np.asarray(values)
+    kind = values.dtype.kind
+    if kind == "M":
+        strings = np.datetime_as_string(values, unit="auto")
+        return np.where(np.isnat(values), None, strings).tolist()
+    if kind in "iuf" and values.ndim == 1 and len(values) >= TYPED_ARRAY_MIN:
+        return typed_array(values)
+    if kind == "f" and np.isnan(values).any():
+        return np.where(np.isnan(values), None, values.astype(object)).tolist()
+    return values.tolist()
+
+
+def _encode(value: Any) -> Any:
+    if isinstance(value, dict):
+        return {key: _encode(item) for key, item in value.items() if item is not None}
+    if isinstance(value, np.ndarray) or hasattr(value, "to_numpy"):
+        return array(value)
+    if isinstance(value, np.generic):
+        return value.item()
+    if isinstance(value, float) and math.isnan(value):
+        return None
+    return value
+
+
+def trace(kind: str, **props) -> Dict[str, Any]:
+    """
+    Trace sans validation: {"type": kind, ...}
+
+    Les propriétés sont écrites telles quelles (dictionnaires imbriqués, pas
+    de raccourcis marker_color); les tableaux numpy / pandas sont encodés par
+    array() et les propriétés None omises, comme le fait plotly.
+    """
+    result = _encode(props)
+    result["type"] = kind
+    return result
+
+
+@functools.lru_cache(maxsize=None)
+def _template(name: str) -> Dict[str, Any]:
+    import plotly.io as pio
+
+    return pio.templates[name].to_plotly_json()
+
+
+def default_template() -> Dict[str, Any]:
+    """Gabarit par défaut de plotly (celui qu'ajoute go.Figure), partagé: ne pas modifier"""
+    import plotly.io as pio
+
+    return _template(pio.templates.default)
+
+
+def figure(data: Iterable[Dict[str, Any]] = (), layout: Optional[Dict[str, Any]] = None) -> Dict[str, Any]:
+    """Figure {"data", "layout"} avec le gabarit par défaut, comme go.Figure(data, layout)"""
+    fig_layout = _encode(layout or {})
+    fig_layout.setdefault("template", default_template())
+    return {"data": list(data), "layout": fig_layout}
+
+
+def merge(target: Dict[str, Any], props: Dict[str, Any]) -> Dict[str, Any]:
+    """
+    Fusion récursive de props dans target (sémantique de update_layout)
+
+    Les dictionnaires imbriqués modifiés sont copiés: un objet partagé (le
+    gabarit, une constante de module) n'est jamais modifié en place.
+    """
+    for key, value in _encode(props).items():
+        current = target.get(key)
+        if isinstance(value, dict) and isinstance(current, dict):
+            target[key] = merge(dict(current), value)
+        else:
+            target[key] = value
+    return target
+
+
+def update_layout(fig: Dict[str, Any], **props) -> Dict[str, Any]:
+    """Équivalent de fig.update_layout(...) pour un dictionnaire de figure"""
+    merge(fig["layout"], props)
+    return fig
+
+
+def add_trace(fig: Dict[str, Any], new_trace: Dict[str, Any]) -> Dict[str, Any]:
+    fig["data"].append(new_trace)
+    return fig
+
+
+def plain(value: Any) -> Any:
+    """Copie de value où les tableaux typés sont redevenus des listes (comparaisons, inspection)"""
+    if isinstance(value, dict):
+        if set(value) == {"dtype", "bdata"} and value["dtype"] in _TYPED_DTYPES:
+            decoded = np.frombuffer(base64.b64decode(value["bdata"]), dtype=_TYPED_DTYPES[value["dtype"]])
+            if decoded.dtype.kind == "f" and np.isnan(decoded).any():
+                return np.where(np.isnan(decoded), None, decoded.astype(object)).tolist()
+            return decoded.tolist()
+        return {key: plain(item) for key, item in value.items()}
+    if isinstance(value, list):
+        return [plain(item) for item in value]
+    return value
+
+
+def _default(value: Any) -> Any:
+    if isinstance(value, np.generic):
+        return value.item()
+    if isinstance(value, np.ndarray):
+        return array(value)
+    if hasattr(value, "to_plotly_json"):
+        return value.to_plotly_json()
+    raise TypeError(f"Type non sérialisable: {type(value).__name__}")
+
+
+def to_json(value: Any) -> bytes:
+    """JSON compact (UTF-8) d'une figure ou d'une réponse: orjson si disponible"""
+    if orjson is not None:
+        return orjson.dumps(value, default=_default, option=orjson.OPT_NON_STR_KEYS)
+    return json.dumps(value, default=_default, separators=(",", ":"), ensure_ascii=False).encode("utf-8")
@@ -0,0 +1,84 @@
+"""
+Cache LRU des figures, versionné par jeu de données
+
+Les figures sont indexées par (nom, version des données, clé de la requête):
+un changement de sélection déjà vu est servi sans recalcul, et un
+rechargement des données (DataManager.data_version) rend les anciennes
+entrées inaccessibles sans invalidation explicite. Les demandes simultanées
+d'une même figure absente partagent un seul calcul (single_flight).
+"""
+
+import threading
+from collections import OrderedDict
+from typing import Any, Callable, Dict, Hashable
+
+import memory_accounting
+from data_manager import data_manager
+from single_flight import single_flight
+
+DEFAULT_MAXSIZE = 256
+
+
+class FigureCache:
+    """
+    Cache LRU thread-safe de figures
+
+    Args:
+        maxsize: Nombre maximal de figures gardées
+    """
+
+    def __init__(self, maxsize: int = DEFAULT_MAXSIZE):
+        self.maxsize = maxsize
+        self._entries = OrderedDict()
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+
+    def get(self, name: str, key: Hashable, builder: Callable[[], Any]) -> Any:
+        """
+        Figure en cache pour (name, version, key), construite par builder() sinon
+
+        La figure retournée est partagée: l'appelant ne doit pas la modifier.
+        """
+        full_key = (name, data_manager.data_version, key)
+        with self._lock:
+            if full_key in self._entries:
+                self._entries.move_to_end(full_key)
+                self.hits += 1
+                return self._entries[full_key]
+            self.misses += 1
+
+        return single_flight.do(f"figure.{name}", full_key, lambda: self._build(full_key, builder))
+
+    def _build(self, full_key: tuple, builder: Callable[[], Any]) -> Any:
+        figure = builder()
+        with self._lock:
+            self._entries[full_key] = figure
+            self._entries.move_to_end(full_key)
+            while len(self._entries) > self.maxsize:
+                self._entries.popitem(last=False)
+        return figure
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+
+    def info(self) -> Dict[str, Any]:
+        with self._lock:
+            return {'size': len(self._entries), 'maxsize': self.maxsize,
+                    'hits': self.hits, 'misses': self.misses}
+
+    def values(self):
+        with self._lock:
+            return list(self._entries.values())
+
+
+figure_cache = FigureCache()
+
+memory_accounting.register_cache("figure_cache", figure_cache.values,
+                                 evict=figure_cache.clear, priority=5)
+
+
+def cached_figure(name: str, key: Hashable, builder: Callable[[], Any]) -> Any:
+    """Fonction utilitaire: figure du cache global"""
+    return figure_cache.get(name, key, builder)
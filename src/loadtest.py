@@ -0,0 +1,480 @@
+"""
+Test de charge local des callbacks Dash (/_dash-update-component)
+
+Démarre app:server localement (gunicorn, comme sur Render), rejoue des
+interactions réalistes depuis plusieurs clients concurrents et rapporte la
+distribution des latences, le débit, le taux d'erreurs et l'évolution de la
+mémoire des workers.
+
+Usage (depuis la racine du dépôt):
+    python src/loadtest.py --users 20 --duration 60 --workers 2 --threads 4
+    python src/loadtest.py --url http://127.0.0.1:8050 --pid 12345
+"""
+
+import argparse
+import json
+import os
+import random
+import signal
+import subprocess
+import sys
+import threading
+import time
+import urllib.error
+import urllib.request
+from concurrent.futures import ThreadPoolExecutor
+from typing import Any, Dict, List, Optional, Tuple
+
+UPDATE_PATH = "/_dash-update-component"
+SRC_DIR = os.path.dirname(os.path.abspath(__file__))
+
+# Valeurs par défaut si la mise en page de viz2 ne peut pas être lue
+DEFAULT_PDQS = ["All", 1, 5, 7, 20, 21, 38, 44, 48]
+DEFAULT_YEARS = (2015, 2025)
+
+# Store de la sélection partagée entre onglets (selection.SELECTION_STORE)
+SELECTION_STORE = "store-viz1"
+
+
+def callback_payload(outputs: List[Tuple[str, str]],
+                     inputs: List[Tuple[str, str, Any]],
+                     changed: Optional[List[str]] = None,
+                     state: Optional[List[Tuple[str, str, Any]]] = None) -> Dict[str, Any]:
+    """
+    Construit le corps JSON envoyé par dash-renderer à /_dash-update-component
+
+    Args:
+        outputs: Liste de (id, propriété) des sorties du callback
+        inputs: Liste de (id, propriété, valeur) des entrées
+        changed: Propriétés déclenchantes ("id.prop"), la première entrée par défaut
+        state: Liste de (id, propriété, valeur) des State du callback
+    """
+    if len(outputs) == 1:
+        output = f"{outputs[0][0]}.{outputs[0][1]}"
+        outputs_spec = {"id": outputs[0][0], "property": outputs[0][1]}
+    else:
+        output = ".." + "...".join(f"{i}.{p}" for i, p in outputs) + ".."
+        outputs_spec = [{"id": i, "property": p} for i, p in outputs]
+
+    inputs_spec = [{"id": i, "property": p, "value": v} for i, p, v in inputs]
+    if changed is None:
+        changed = [f"{inputs[0][0]}.{inputs[0][1]}"]
+
+    return {
+        "output": output,
+        "outputs": outputs_spec,
+        "inputs": inputs_spec,
+        "changedPropIds": changed,
+        "state": [{"id": i, "property": p, "value": v} for i, p, v in state or []],
+    }
+
+
+def selection_data(pdq: Any = None, years: Optional[List[int]] = None) -> Dict[str, Any]:
+    """Contenu du store de sélection partagée (voir selection.py)"""
+    return {"pdq": None if pdq == "All" else pdq, "district": None, "category": None,
+            "years": list(years) if years else None}
+
+
+def tab_payload(tab: str, selection: Optional[Dict[str, Any]] = None) -> Dict[str, Any]:
+    """Changement d'onglet"""
+    return callback_payload(
+        [("tab-content", "children")],
+        [("tabs", "value", tab), ("selection-clear", "n_clicks", 0)],
+        state=[(SELECTION_STORE, "data", selection or selection_data())],
+    )
+
+
+def viz1_payload(view: str, chart_type: str, selection: Optional[Dict[str, Any]] = None) -> Dict[str, Any]:
+    """Choix de la vue / du type de graphique de viz1"""
+    return callback_payload(
+        [("viz1-graph", "figure")],
+        [("viz1-view-dropdown", "value", view), ("viz1-chart-type", "value", chart_type),
+         ("viz1-graph", "relayoutData", None), ("viz1-overlays", "value", []),
+         (SELECTION_STORE, "data", selection or selection_data())],
+        state=[("viz1-graph-width", "data", None)],
+    )
+
+
+def viz2_payload(pdq: Any, years: List[int], changed: str = SELECTION_STORE + ".data") -> Dict[str, Any]:
+    """Graphiques de viz2 après un changement de PDQ ou d'années (sélection partagée)"""
+    return callback_payload(
+        [("bar-chart", "figure"), ("pie-chart", "figure"), ("line-chart", "figure")],
+        [(SELECTION_STORE, "data", selection_data(pdq, years)), ("viz2-overlays", "value", [])],
+        changed=[changed],
+    )
+
+
+def viz3_payload(max_points: int) -> Dict[str, Any]:
+    """Déplacement du curseur de viz3"""
+    return callback_payload(
+        [("crime-map", "figure")],
+        [("max-points-slider", "value", max_points), (SELECTION_STORE, "data", selection_data())],
+    )
+
+
+def _find_component(tree: Any, component_id: str) -> Optional[Dict[str, Any]]:
+    """Recherche un composant par id dans un arbre de mise en page sérialisé"""
+    if isinstance(tree, dict):
+        props = tree.get("props")
+        if isinstance(props, dict):
+            if props.get("id") == component_id:
+                return props
+            return _find_component(props.get("children"), component_id)
+    elif isinstance(tree, list):
+        for child in tree:
+            found = _find_component(child, component_id)
+            if found is not None:
+                return found
+    return None
+
+
+class Scenario:
+    """
+    Générateur de requêtes pondéré qui imite les interactions d'un utilisateur
+
+    Chaque client garde son PDQ et sa plage d'années: glisser le curseur
+    déplace la plage pour le PDQ courant, changer de PDQ garde la plage.
+    """
+
+    def __init__(self, pdqs: List[Any], years: Tuple[int, int], seed: int = 0):
+        self.pdqs = pdqs
+        self.years = years
+        self.rng = random.Random(seed)
+        self.pdq = self.rng.choice(self.pdqs)
+        self.range = self._random_range()
+        self.kinds = [
+            ("viz2_slider", 40, self._viz2_slider),
+            ("viz2_pdq", 15, self._viz2_pdq),
+            ("viz1_toggle", 15, self._viz1_toggle),
+            ("viz3_slider", 15, self._viz3_slider),
+            ("tab_switch", 15, self._tab_switch),
+        ]
+        self.weights = [w for _, w, _ in self.kinds]
+
+    def next(self) -> Tuple[str, Dict[str, Any]]:
+        name, _, build = self.rng.choices(self.kinds, weights=self.weights)[0]
+        return name, build()
+
+    def _random_range(self) -> List[int]:
+        start = self.rng.randint(self.years[0], self.years[1])
+        end = self.rng.randint(start, self.years[1])
+        return [start, end]
+
+    def _viz2_slider(self):
+        self.range = self._random_range()
+        return viz2_payload(self.pdq, self.range)
+
+    def _viz2_pdq(self):
+        others = [pdq for pdq in self.pdqs if pdq != self.pdq]
+        if others:
+            self.pdq = self.rng.choice(others)
+        return viz2_payload(self.pdq, self.range)
+
+    def _viz1_toggle(self):
+        return viz1_payload(self.rng.choice(["Yearly", "Seasonal", "Monthly"]), self.rng.choice(["Line", "Bar"]))
+
+    def _viz3_slider(self):
+        return viz3_payload(self.rng.randint(1, 5))
+
+    def _tab_switch(self):
+        return tab_payload(self.rng.choice(["viz1", "viz2", "viz3", "viz4", "viz5", "viz6", "viz7"]))
+
+
+def post_json(url: str, payload: Dict[str, Any], timeout: float) -> Tuple[int, bytes]:
+    """Envoie une requête POST JSON et retourne (statut, corps)"""
+    request = urllib.request.Request(
+        url,
+        data=json.dumps(payload).encode("utf-8"),
+        headers={"Content-Type": "application/json"},
+        method="POST",
+    )
+    try:
+        with urllib.request.urlopen(request, timeout=timeout) as response:
+            return response.status, response.read()
+    except urllib.error.HTTPError as e:
+        return e.code, e.read()
+
+
+def discover_viz2_inputs(base_url: str, timeout: float) -> Tuple[List[Any], Tuple[int, int]]:
+    """
+    Lit les options réelles du menu PDQ et les bornes du curseur d'années
+    en demandant le contenu de l'onglet viz2
+    """
+    try:
+        status, body = post_json(base_url + UPDATE_PATH, tab_payload("viz2"), timeout)
+        if status != 200:
+            raise ValueError(f"statut {status}")
+        tree = json.loads(body)["response"]["tab-content"]["children"]
+        dropdown = _find_component(tree, "pdq-dropdown")
+        slider = _find_component(tree, "year-slider")
+        pdqs = [opt["value"] for opt in dropdown["options"]]
+        return pdqs, (int(slider["min"]), int(slider["max"]))
+    except Exception as e:
+        print(f"Options de viz2 introuvables ({e}), valeurs par défaut utilisées")
+        return DEFAULT_PDQS, DEFAULT_YEARS
+
+
+def warm_up(base_url: str, timeout: float, passes: int = 1):
+    """
+    Visite chaque onglet et déclenche chacun de ses callbacks (scenario_payloads
+    de payload_inspector): jointure spatiale de viz3, statistiques, figures...
+    sont calculées avant les mesures. Une passe par worker gunicorn, les
+    requêtes étant réparties entre eux.
+    """
+    from payload_inspector import scenario_payloads
+
+    url = base_url + UPDATE_PATH
+    started = time.perf_counter()
+    for _ in range(passes):
+        for name, payload in scenario_payloads():
+            status, _ = post_json(url, payload, timeout)
+            if status not in (200, 204):
+                print(f"Préchauffage: {name} -> statut {status}")
+    print(f"Préchauffage terminé en {time.perf_counter() - started:.1f}s")
+
+
+def _process_tree(pid: int) -> List[int]:
+    """Retourne le pid et tous ses descendants (Linux /proc)"""
+    pids = [pid]
+    i = 0
+    while i < len(pids):
+        task_dir = f"/proc/{pids[i]}/task"
+        try:
+            for tid in os.listdir(task_dir):
+                with open(os.path.join(task_dir, tid, "children")) as f:
+                    pids.extend(int(c) for c in f.read().split())
+        except OSError:
+            pass
+        i += 1
+    return pids
+
+
+def rss_mb(pid: int) -> Optional[float]:
+    """RSS total (Mo) du processus et de ses enfants, None si indisponible"""
+    total_kb = 0
+    found = False
+    for p in _process_tree(pid):
+        try:
+            with open(f"/proc/{p}/status") as f:
+                for line in f:
+                    if line.startswith("VmRSS:"):
+                        total_kb += int(line.split()[1])
+                        found = True
+                        break
+        except OSError:
+            continue
+    return total_kb / 1024 if found else None
+
+
+def percentile(values: List[float], q: float) -> float:
+    """Percentile par interpolation linéaire (q entre 0 et 100)"""
+    if not values:
+        return float("nan")
+    ordered = sorted(values)
+    pos = (len(ordered) - 1) * q / 100
+    low = int(pos)
+    high = min(low + 1, len(ordered) - 1)
+    return ordered[low] + (ordered[high] - ordered[low]) * (pos - low)
+
+
+def start_server(port: int, workers: int, threads: int, timeout: float) -> subprocess.Popen:
+    """Démarre gunicorn avec la même commande que render.yaml"""
+    cmd = [
+        sys.executable, "-m", "gunicorn", "--chdir", SRC_DIR, "app:server",
+        "--bind", f"127.0.0.1:{port}",
+        "--workers", str(workers),
+        "--threads", str(threads),
+        "--timeout", "300",
+    ]
+    print(f"Démarrage: {' '.join(cmd)}")
+    proc = subprocess.Popen(cmd, stdout=subprocess.DEVNULL, stderr=subprocess.PIPE, start_new_session=True)
+
+    deadline = time.time() + timeout
+    while time.time() < deadline:
+        if proc.poll() is not None:
+            raise RuntimeError(f"gunicorn s'est arrêté: {proc.stderr.read().decode(errors='replace')[-2000:]}")
+        try:
+            with urllib.request.urlopen(f"http://127.0.0.1:{port}/", timeout=2):
+                return proc
+        except OSError:
+            time.sleep(0.5)
+    stop_server(proc)
+    raise RuntimeError(f"Le serveur n'a pas répondu en {timeout:.0f}s")
+
+
+def stop_server(proc: subprocess.Popen):
+    """Arrête gunicorn et ses workers"""
+    try:
+        os.killpg(proc.pid, signal.SIGTERM)
+        proc.wait(timeout=30)
+    except (OSError, subprocess.TimeoutExpired):
+        os.killpg(proc.pid, signal.SIGKILL)
+
+
+class LoadTest:
+    """
+    Exécute un scénario depuis plusieurs clients concurrents et collecte les mesures
+    """
+
+    def __init__(self, base_url: str, users: int, duration: float,
+                 timeout: float = 60.0, pid: Optional[int] = None,
+                 sample_interval: float = 1.0, seed: int = 0):
+        self.base_url = base_url.rstrip("/")
+        self.users = users
+        self.duration = duration
+        self.timeout = timeout
+        self.pid = pid
+        self.sample_interval = sample_interval
+        self.seed = seed
+        self.results: List[Tuple[str, float, bool, float]] = []
+        self.memory: List[Tuple[float, float]] = []
+        self._lock = threading.Lock()
+
+    def _client(self, index: int, pdqs, years, started: float):
+        scenario = Scenario(pdqs, years, seed=self.seed + index)
+        url = self.base_url + UPDATE_PATH
+        while time.perf_counter() - started < self.duration:
+            name, payload = scenario.next()
+            t0 = time.perf_counter()
+            try:
+                status, _ = post_json(url, payload, self.timeout)
+                ok = status in (200, 204)
+            except OSError:
+                ok = False
+            elapsed = time.perf_counter() - t0
+            with self._lock:
+                self.results.append((name, elapsed, ok, t0 - started))
+
+    def _sample_memory(self, started: float, stop: threading.Event):
+        while not stop.is_set():
+            value = rss_mb(self.pid)
+            if value is not None:
+                self.memory.append((time.perf_counter() - started, value))
+            stop.wait(self.sample_interval)
+
+    def run(self) -> Dict[str, Any]:
+        pdqs, years = discover_viz2_inputs(self.base_url, self.timeout)
+        print(f"{self.users} clients pendant {self.duration:.0f}s sur {self.base_url}")
+
+        stop = threading.Event()
+        started = time.perf_counter()
+        sampler = None
+        if self.pid is not None:
+            sampler = threading.Thread(target=self._sample_memory, args=(started, stop), daemon=True)
+            sampler.start()
+
+        with ThreadPoolExecutor(max_workers=self.users) as pool:
+            for i in range(self.users):
+                pool.submit(self._client, i, pdqs, years, started)
+
+        wall = time.perf_counter() - started
+        stop.set()
+        if sampler is not None:
+            sampler.join()
+        return self.summary(wall)
+
+    def summary(self, wall: float) -> Dict[str, Any]:
+        by_kind: Dict[str, List[Tuple[float, bool]]] = {}
+        for name, elapsed, ok, _ in self.results:
+            by_kind.setdefault(name, []).append((elapsed, ok))
+        by_kind["ALL"] = [(elapsed, ok) for _, elapsed, ok, _ in self.results]
+
+        scenarios = {}
+        for name, samples in by_kind.items():
+            latencies = [e * 1000 for e, ok in samples if ok]
+            errors = sum(1 for _, ok in samples if not ok)
+            scenarios[name] = {
+                "requests": len(samples),
+                "errors": errors,
+                "error_rate": errors / len(samples) if samples else 0.0,
+                "throughput_rps": len(samples) / wall if wall else 0.0,
+                "p50_ms": percentile(latencies, 50),
+                "p90_ms": percentile(latencies, 90),
+                "p99_ms": percentile(latencies, 99),
+                "max_ms": max(latencies) if latencies else float("nan"),
+            }
+
+        memory = {}
+        if self.memory:
+            memory = {
+                "start_mb": self.memory[0][1],
+                "end_mb": self.memory[-1][1],
+                "peak_mb": max(v for _, v in self.memory),
+                "growth_mb": self.memory[-1][1] - self.memory[0][1],
+                "timeline": self.memory,
+            }
+
+        return {
+            "users": self.users,
+            "duration_s": wall,
+            "scenarios": scenarios,
+            "memory": memory,
+        }
+
+
+def print_report(report: Dict[str, Any]):
+    """Affiche le rapport sous forme de tableau"""
+    print()
+    print(f"{'scénario':<14}{'req':>7}{'err':>6}{'req/s':>8}{'p50':>9}{'p90':>9}{'p99':>9}{'max':>9}")
+    for name, s in sorted(report["scenarios"].items(), key=lambda kv: kv[0] == "ALL"):
+        print(f"{name:<14}{s['requests']:>7}{s['errors']:>6}{s['throughput_rps']:>8.1f}"
+              f"{s['p50_ms']:>9.1f}{s['p90_ms']:>9.1f}{s['p99_ms']:>9.1f}{s['max_ms']:>9.1f}")
+    print("(latences en ms)")
+
+    memory = report["memory"]
+    if memory:
+        print()
+        print(f"Mémoire workers: début {memory['start_mb']:.0f} Mo, fin {memory['end_mb']:.0f} Mo, "
+              f"pic {memory['peak_mb']:.0f} Mo, croissance {memory['growth_mb']:+.0f} Mo")
+        timeline = memory["timeline"]
+        step = max(1, len(timeline) // 10)
+        for t, value in timeline[::step]:
+            print(f"  t={t:6.1f}s  {value:8.1f} Mo")
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Test de charge des callbacks Dash")
+    parser.add_argument("--url", help="Serveur déjà démarré (sinon gunicorn est lancé localement)")
+    parser.add_argument("--pid", type=int, help="Pid du serveur à surveiller avec --url")
+    parser.add_argument("--port", type=int, default=8765)
+    parser.add_argument("--workers", type=int, default=1, help="Workers gunicorn")
+    parser.add_argument("--threads", type=int, default=1, help="Threads par worker gunicorn")
+    parser.add_argument("--users", type=int, default=10, help="Clients concurrents")
+    parser.add_argument("--duration", type=float, default=30.0, help="Durée du test (s)")
+    parser.add_argument("--warmup", action="store_true",
+                        help="Visite chaque onglet et déclenche ses callbacks avant le test")
+    parser.add_argument("--timeout", type=float, default=60.0, help="Délai max par requête (s)")
+    parser.add_argument("--startup-timeout", type=float, default=180.0)
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--json", help="Écrit le rapport complet dans ce fichier")
+    args = parser.parse_args(argv)
+
+    proc = None
+    if args.url:
+        base_url, pid = args.url, args.pid
+    else:
+        proc = start_server(args.port, args.workers, args.threads, args.startup_timeout)
+        base_url, pid = f"http://127.0.0.1:{args.port}", proc.pid
+
+    try:
+        if args.warmup:
+            warm_up(base_url, args.timeout, passes=1 if args.url else args.workers)
+
+        test = LoadTest(base_url, args.users, args.duration, timeout=args.timeout, pid=pid, seed=args.seed)
+        report = test.run()
+        report.update({"workers": args.workers, "threads": args.threads})
+    finally:
+        if proc is not None:
+            stop_server(proc)
+
+    print_report(report)
+    if args.json:
+        with open(args.json, "w") as f:
+            json.dump(report, f, indent=2)
+        print(f"Rapport écrit dans {args.json}")
+
+    return 1 if report["scenarios"]["ALL"]["errors"] else 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,396 @@
+"""
+Comptabilité mémoire des jeux de données et des caches de l'application
+
+Chaque module qui garde des données en mémoire (DataManager, caches globaux des
+visualisations) s'enregistre avec register_cache(). memory_report() retourne la
+taille profonde de chaque entrée, le RSS du processus et, si activé, la
+croissance tracemalloc entre requêtes.
+
+Variables d'environnement (aucun hook installé si aucune n'est définie):
+    DASH_TRACEMALLOC=1         Suit la croissance tracemalloc par requête
+    DASH_RSS_CEILING_MB=<Mo>   Plafond RSS: les caches évictables sont vidés
+                               lorsque le RSS approche ce plafond
+    DASH_RSS_EVICT_RATIO=0.9   Fraction du plafond qui déclenche l'éviction
+    DASH_MEMORY_BUDGET_MB=<Mo> Budget commun des caches de tous les jeux de
+                               données (MemoryBudget, éviction LRU)
+"""
+
+import gc
+import os
+import sys
+import threading
+import tracemalloc
+import logging
+from collections import OrderedDict, deque
+from typing import Any, Callable, Dict, Hashable, List, Optional
+
+logger = logging.getLogger(__name__)
+
+# Estimation du coût d'une géométrie shapely/GEOS hors tableau de pointeurs
+# (objet Python + structure GEOS), les coordonnées étant comptées à part
+GEOMETRY_OVERHEAD_BYTES = 112
+COORDINATE_BYTES = 16
+
+_registry: Dict[str, Dict[str, Any]] = {}
+_registry_lock = threading.Lock()
+
+_tracking = {
+    'tracemalloc': False,
+    'baseline': None,
+    'last_current': None,
+    'history': deque(maxlen=200),
+    'evictions': 0,
+}
+
+
+def register_cache(name: str,
+                   getter: Callable[[], Any],
+                   evict: Optional[Callable[[], None]] = None,
+                   priority: int = 100):
+    """
+    Enregistre un cache ou un jeu de données pour la comptabilité mémoire
+
+    Args:
+        name: Nom affiché dans le rapport (ex: "viz3.cached_data")
+        getter: Retourne l'objet à mesurer au moment de l'appel
+        evict: Vide le cache; None si l'entrée n'est pas évictable
+        priority: Ordre d'éviction (les plus petites valeurs sont vidées en premier)
+    """
+    with _registry_lock:
+        _registry[name] = {'getter': getter, 'evict': evict, 'priority': priority}
+
+
+def _geometry_extra_bytes(values) -> int:
+    """Octets des géométries shapely au-delà du tableau de pointeurs"""
+    try:
+        import shapely
+        geoms = getattr(values, '_data', values)
+        coords = int(shapely.get_num_coordinates(geoms).sum())
+        count = int((~shapely.is_missing(geoms)).sum())
+        return count * GEOMETRY_OVERHEAD_BYTES + coords * COORDINATE_BYTES
+    except Exception:
+        return 0
+
+
+def deep_sizeof(obj: Any, seen: Optional[set] = None) -> int:
+    """
+    Taille profonde approximative (octets) d'un objet
+
+    Gère DataFrame/Series (y compris colonnes géométriques), tableaux numpy et
+    conteneurs Python. Les objets déjà vus (seen) ne sont comptés qu'une fois.
+    """
+    if seen is None:
+        seen = set()
+    if obj is None or id(obj) in seen:
+        return 0
+    seen.add(id(obj))
+
+    import numpy as np
+    import pandas as pd
+
+    if isinstance(obj, pd.DataFrame):
+        size = int(obj.memory_usage(deep=True, index=True).sum())
+        for column in obj.columns:
+            if str(obj[column].dtype) == 'geometry':
+                size += _geometry_extra_bytes(obj[column].values)
+        return size
+    if isinstance(obj, (pd.Series, pd.Index)):
+        size = int(obj.memory_usage(deep=True))
+        if str(obj.dtype) == 'geometry':
+            size += _geometry_extra_bytes(obj.values)
+        return size
+    if isinstance(obj, np.ndarray):
+        if obj.dtype == object:
+            return obj.nbytes + sum(deep_sizeof(v, seen) for v in obj.ravel())
+        return obj.nbytes
+    if isinstance(obj, dict):
+        return sys.getsizeof(obj) + sum(
+            deep_sizeof(k, seen) + deep_sizeof(v, seen) for k, v in obj.items()
+        )
+    if isinstance(obj, (list, tuple, set, frozenset, deque)):
+        return sys.getsizeof(obj) + sum(deep_sizeof(v, seen) for v in obj)
+    if hasattr(obj, '__dict__') and not isinstance(obj, type):
+        return sys.getsizeof(obj) + deep_sizeof(vars(obj), seen)
+    return sys.getsizeof(obj)
+
+
+def _measure(obj: Any, seen: set) -> Dict[str, Any]:
+    items = None
+    if hasattr(obj, '__len__') and not isinstance(obj, (str, bytes)):
+        try:
+            items = len(obj)
+        except TypeError:
+            items = None
+    return {'bytes': deep_sizeof(obj, seen), 'items': items}
+
+
+def current_rss() -> Optional[int]:
+    """RSS actuel du processus en octets (Linux), None si indisponible"""
+    try:
+        with open('/proc/self/statm') as f:
+            pages = int(f.read().split()[1])
+        return pages * os.sysconf('SC_PAGE_SIZE')
+    except (OSError, ValueError, IndexError):
+        return None
+
+
+def memory_report(top_allocations: int = 0) -> Dict[str, Any]:
+    """
+    Rapport mémoire de toutes les entrées enregistrées
+
+    Args:
+        top_allocations: Nombre de sites d'allocation tracemalloc (croissance depuis
+                         la référence) à inclure, si le suivi est actif
+    """
+    seen = set()
+    entries = {}
+    with _registry_lock:
+        registry = dict(_registry)
+    for name, entry in sorted(registry.items()):
+        try:
+            entries[name] = _measure(entry['getter'](), seen)
+        except Exception as e:
+            entries[name] = {'bytes': None, 'items': None, 'error': str(e)}
+        entries[name]['evictable'] = entry['evict'] is not None
+
+    report = {
+        'entries': entries,
+        'total_bytes': sum(e['bytes'] or 0 for e in entries.values()),
+        'rss_bytes': current_rss(),
+        'evictions': _tracking['evictions'],
+    }
+
+    if _tracking['tracemalloc'] and tracemalloc.is_tracing():
+        current, peak = tracemalloc.get_traced_memory()
+        history = list(_tracking['history'])
+        report['tracemalloc'] = {
+            'current_bytes': current,
+            'peak_bytes': peak,
+            'recent_requests': history[-20:],
+            'growth_since_start_bytes': sum(h['growth_bytes'] for h in history),
+        }
+        if top_allocations and _tracking['baseline'] is not None:
+            stats = tracemalloc.take_snapshot().compare_to(_tracking['baseline'], 'lineno')
+            report['tracemalloc']['top_growth'] = [
+                {'site': str(s.traceback), 'size_diff_bytes': s.size_diff, 'count_diff': s.count_diff}
+                for s in stats[:top_allocations]
+            ]
+    return report
+
+
+def evict_until_below(limit_bytes: int) -> List[str]:
+    """
+    Vide les caches évictables par priorité jusqu'à ce que le RSS passe sous la limite
+
+    Returns:
+        Noms des caches vidés
+    """
+    with _registry_lock:
+        candidates = sorted(
+            ((e['priority'], n, e['evict']) for n, e in _registry.items() if e['evict'] is not None),
+            key=lambda c: (c[0], c[1])
+        )
+
+    evicted = []
+    for _, name, evict in candidates:
+        rss = current_rss()
+        if rss is None or rss < limit_bytes:
+            break
+        try:
+            evict()
+            gc.collect()
+            evicted.append(name)
+            _tracking['evictions'] += 1
+        except Exception as e:
+            logger.error(f"Erreur lors de l'éviction de {name}: {e}")
+
+    if evicted:
+        logger.warning(f"RSS proche du plafond, caches vidés: {', '.join(evicted)} "
+                       f"(RSS actuel: {(current_rss() or 0) / 1e6:.0f} Mo)")
+    return evicted
+
+
+class MemoryBudget:
+    """
+    Budget mémoire commun aux caches de tous les jeux de données
+
+    Chaque entrée (agrégat, cache de visualisation, données filtrées, table
+    d'un jeu de données) est enregistrée avec sa taille et une fonction
+    d'éviction. Lorsque le total dépasse la limite, les entrées les moins
+    récemment utilisées sont évincées, quel que soit leur jeu de données;
+    les entrées épinglées sont comptées mais jamais évincées.
+
+    Sans limite (DASH_MEMORY_BUDGET_MB absent), rien n'est suivi: add() et
+    touch() ne font rien.
+
+    Args:
+        limit_bytes: Limite en octets (None = désactivé)
+    """
+
+    def __init__(self, limit_bytes: Optional[int] = None):
+        self.limit_bytes = limit_bytes
+        self._lock = threading.Lock()
+        # (propriétaire, clé) -> {'bytes', 'evict', 'pinned'}, du moins au plus récent
+        self._entries: "OrderedDict[tuple, Dict[str, Any]]" = OrderedDict()
+        self._total = 0
+        self._evictions = 0
+        self._evicted_bytes = 0
+
+    @classmethod
+    def from_environ(cls, environ=None) -> 'MemoryBudget':
+        environ = os.environ if environ is None else environ
+        limit_mb = environ.get("DASH_MEMORY_BUDGET_MB")
+        return cls(int(float(limit_mb) * 1024 * 1024) if limit_mb else None)
+
+    @property
+    def enabled(self) -> bool:
+        return self.limit_bytes is not None
+
+    def add(self, owner: Hashable, key: Hashable, value: Any,
+            evict: Optional[Callable[[], None]] = None, nbytes: Optional[int] = None,
+            pinned: bool = False):
+        """
+        Enregistre une entrée puis évince les moins récentes si la limite est dépassée
+
+        Args:
+            owner: Propriétaire (ex: (jeu de données, génération)), voir release()
+            key: Clé de l'entrée chez ce propriétaire
+            value: Objet mesuré avec deep_sizeof() si nbytes n'est pas fourni
+            evict: Retire l'entrée de son cache (None = épinglée)
+            nbytes: Taille connue en octets
+            pinned: Comptée mais jamais évincée
+        """
+        if not self.enabled:
+            return
+        size = deep_sizeof(value) if nbytes is None else nbytes
+        entry_key = (owner, key)
+        with self._lock:
+            previous = self._entries.pop(entry_key, None)
+            if previous is not None:
+                self._total -= previous['bytes']
+            self._entries[entry_key] = {'bytes': size, 'evict': evict,
+                                        'pinned': pinned or evict is None}
+            self._total += size
+        self._enforce(keep=entry_key)
+
+    def touch(self, owner: Hashable, key: Hashable):
+        """Marque une entrée comme utilisée (fin de la file LRU)"""
+        if not self.enabled:
+            return
+        with self._lock:
+            if (owner, key) in self._entries:
+                self._entries.move_to_end((owner, key))
+
+    def discard(self, owner: Hashable, key: Hashable):
+        """Oublie une entrée retirée par son cache (sans appeler evict)"""
+        if not self.enabled:
+            return
+        with self._lock:
+            entry = self._entries.pop((owner, key), None)
+            if entry is not None:
+                self._total -= entry['bytes']
+
+    def release(self, owner: Hashable):
+        """Oublie toutes les entrées d'un propriétaire (ex: génération remplacée)"""
+        if not self.enabled:
+            return
+        with self._lock:
+            for entry_key in [k for k in self._entries if k[0] == owner]:
+                self._total -= self._entries.pop(entry_key)['bytes']
+
+    def _enforce(self, keep: Optional[tuple] = None):
+        """Évince les entrées LRU non épinglées tant que le total dépasse la limite"""
+        victims = []
+        with self._lock:
+            for entry_key in list(self._entries):
+                if self._total <= self.limit_bytes:
+                    break
+                entry = self._entries[entry_key]
+                if entry['pinned'] or entry_key == keep:
+                    continue
+                del self._entries[entry_key]
+                self._total -= entry['bytes']
+                self._evictions += 1
+                self._evicted_bytes += entry['bytes']
+                victims.append((entry_key, entry))
+        # Hors du verrou: une éviction peut libérer d'autres entrées (release)
+        for entry_key, entry in victims:
+            try:
+                entry['evict']()
+            except Exception as e:
+                logger.error(f"Erreur lors de l'éviction de {entry_key}: {e}")
+        if victims:
+            logger.info(f"Budget mémoire: {len(victims)} entrées évincées "
+                        f"({sum(e['bytes'] for _, e in victims) / 1e6:.1f} Mo)")
+
+    def report(self) -> Dict[str, Any]:
+        """Total, limite, évictions et taille par propriétaire"""
+        with self._lock:
+            owners: Dict[str, int] = {}
+            for (owner, _), entry in self._entries.items():
+                owners[str(owner)] = owners.get(str(owner), 0) + entry['bytes']
+            return {
+                'enabled': self.enabled,
+                'limit_bytes': self.limit_bytes,
+                'total_bytes': self._total,
+                'entries': len(self._entries),
+                'pinned_bytes': sum(e['bytes'] for e in self._entries.values() if e['pinned']),
+                'evictions': self._evictions,
+                'evicted_bytes': self._evicted_bytes,
+                'owners': owners,
+            }
+
+
+memory_budget = MemoryBudget.from_environ()
+
+
+def install_memory_tracking(server, environ=None) -> bool:
+    """
+    Installe le suivi tracemalloc et/ou l'éviction sur plafond RSS si configurés
+
+    Returns:
+        True si des hooks ont été installés
+    """
+    environ = os.environ if environ is None else environ
+    trace = environ.get("DASH_TRACEMALLOC", "").lower() in ("1", "true", "yes")
+    ceiling_mb = environ.get("DASH_RSS_CEILING_MB")
+    if not trace and not ceiling_mb:
+        return False
+
+    from flask import request
+
+    if trace:
+        if not tracemalloc.is_tracing():
+            tracemalloc.start()
+        _tracking['tracemalloc'] = True
+
+        @server.before_request
+        def _trace_before():
+            if _tracking['baseline'] is None:
+                _tracking['baseline'] = tracemalloc.take_snapshot()
+                _tracking['last_current'] = tracemalloc.get_traced_memory()[0]
+
+        @server.after_request
+        def _trace_after(response):
+            current = tracemalloc.get_traced_memory()[0]
+            _tracking['history'].append({
+                'path': request.path,
+                'growth_bytes': current - (_tracking['last_current'] or current),
+                'current_bytes': current,
+            })
+            _tracking['last_current'] = current
+            return response
+
+    if ceiling_mb:
+        ratio = float(environ.get("DASH_RSS_EVICT_RATIO", "0.9"))
+        limit = int(float(ceiling_mb) * 1024 * 1024 * ratio)
+
+        @server.after_request
+        def _check_rss(response):
+            rss = current_rss()
+            if rss is not None and rss >= limit:
+                evict_until_below(limit)
+            return response
+
+    logger.info(f"Suivi mémoire activé (tracemalloc={trace}, plafond RSS={ceiling_mb or 'aucun'} Mo)")
+    return True
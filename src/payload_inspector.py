@@ -0,0 +1,323 @@
+"""
+Taille des réponses envoyées au navigateur (figures, mises en page, tables)
+
+Chaque réponse de /_dash-update-component (et la mise en page initiale,
+/_dash-layout) est mesurée telle qu'elle part sur le réseau, puis ventilée:
+par sortie ("id.propriété"), par trace et par attribut de trace pour les
+figures (x, y, customdata, marker...), par clé de layout, et par propriété
+de composant pour les mises en page (ex: "viz4-table.data").
+
+Chaque sortie a un budget en octets (DEFAULT_BUDGETS, motifs fnmatch sur
+"id.propriété"). En mode test, une réponse qui dépasse son budget est
+remplacée par une erreur 500 qui liste les dépassements: ajouter une trace
+ou une colonne ne peut plus doubler silencieusement le volume téléchargé.
+
+Activé uniquement par variable d'environnement (aucun hook sinon):
+    DASH_PAYLOAD_INSPECT=1          Mesure chaque réponse, avertit en cas de dépassement
+    DASH_PAYLOAD_ENFORCE=1          Mode test: réponse en erreur 500 si un budget est dépassé
+    DASH_PAYLOAD_BUDGETS=<json>     Budgets supplémentaires (JSON ou chemin d'un fichier
+                                    JSON), ex: {"viz3-*.figure": 400000}
+
+Vérification de tous les callbacks (depuis src/, code de sortie 1 si un budget
+est dépassé):
+    python payload_inspector.py [--json rapport.json] [--top 5]
+"""
+
+import argparse
+import json
+import os
+import sys
+import threading
+import logging
+from typing import Any, Dict, List, Optional, Tuple
+
+import budget_patterns
+import figure_builder
+from budget_patterns import budget_for
+
+logger = logging.getLogger(__name__)
+
+UPDATE_PATH = "/_dash-update-component"
+LAYOUT_PATH = "/_dash-layout"
+
+# Budgets par sortie (octets de JSON non compressé), environ le double des
+# tailles mesurées: une réponse qui double échoue. Après DASH_PAYLOAD_BUDGETS,
+# correspondance exacte puis premier motif; "*" couvre les sorties non listées.
+DEFAULT_BUDGETS: Dict[str, int] = {
+    "layout": 10_000,
+    "tab-content.children": 150_000,
+    "crime-map.figure": 50_000,
+    "viz1-graph.figure": 75_000,
+    "viz1-anomaly-table.data": 40_000,
+    "viz4-scatter.figure": 130_000,
+    "viz6-calendar.figure": 180_000,
+    "viz7-table.data": 60_000,
+    "*": 20_000,
+}
+
+_lock = threading.Lock()
+_stats: Dict[str, Dict[str, Any]] = {}
+
+
+def _size(value: Any) -> int:
+    """Octets du JSON compact de value (format des réponses Dash)"""
+    return len(figure_builder.to_json(value))
+
+
+def _is_figure(value: Any) -> bool:
+    return isinstance(value, dict) and isinstance(value.get("data"), list) and "layout" in value
+
+
+def figure_breakdown(figure: Dict[str, Any]) -> Dict[str, Any]:
+    """
+    Ventilation d'une figure sérialisée
+
+    Returns:
+        dict avec bytes, traces (type, nom, octets et octets par attribut,
+        du plus gros au plus petit) et layout (octets par clé)
+    """
+    traces = []
+    for index, trace in enumerate(figure.get("data") or []):
+        attributes = {key: _size(value) for key, value in trace.items()}
+        traces.append({
+            "index": index,
+            "type": trace.get("type", "scatter"),
+            "name": trace.get("name"),
+            "bytes": _size(trace),
+            "attributes": dict(sorted(attributes.items(), key=lambda item: -item[1])),
+        })
+    layout = {key: _size(value) for key, value in (figure.get("layout") or {}).items()}
+    return {
+        "bytes": _size(figure),
+        "traces": sorted(traces, key=lambda t: -t["bytes"]),
+        "layout": dict(sorted(layout.items(), key=lambda item: -item[1])),
+    }
+
+
+def _component_props(tree: Any, found: Dict[str, int], figures: Dict[str, Dict[str, Any]]):
+    """Octets de chaque propriété des composants d'une mise en page (hors children)"""
+    if isinstance(tree, list):
+        for child in tree:
+            _component_props(child, found, figures)
+        return
+    if not isinstance(tree, dict) or not isinstance(tree.get("props"), dict):
+        return
+    props = tree["props"]
+    label = props.get("id") or tree.get("type", "component")
+    for key, value in props.items():
+        if key == "children":
+            continue
+        name = f"{label}.{key}"
+        found[name] = found.get(name, 0) + _size(value)
+        if _is_figure(value):
+            figures[name] = figure_breakdown(value)
+    _component_props(props.get("children"), found, figures)
+
+
+def value_breakdown(value: Any) -> Dict[str, Any]:
+    """Ventilation d'une valeur de sortie: figure, mise en page ou donnée brute"""
+    if _is_figure(value):
+        return figure_breakdown(value)
+    result = {"bytes": _size(value)}
+    if isinstance(value, (dict, list)):
+        props, figures = {}, {}
+        _component_props(value, props, figures)
+        if props:
+            result["components"] = dict(sorted(props.items(), key=lambda item: -item[1]))
+        if figures:
+            result["figures"] = figures
+    return result
+
+
+def response_breakdown(path: str, body: bytes) -> Dict[str, Dict[str, Any]]:
+    """
+    Ventilation d'une réponse par sortie
+
+    Returns:
+        dict "id.propriété" (ou "layout") -> ventilation
+    """
+    payload = json.loads(body)
+    if path == LAYOUT_PATH:
+        return {"layout": value_breakdown(payload)}
+    outputs = {}
+    for component_id, props in (payload.get("response") or {}).items():
+        for prop, value in props.items():
+            outputs[f"{component_id}.{prop}"] = value_breakdown(value)
+    return outputs
+
+
+def load_budgets(environ=None) -> Dict[str, int]:
+    """Budgets par défaut complétés par DASH_PAYLOAD_BUDGETS (prioritaires, voir budget_patterns)"""
+    return budget_patterns.load_budgets("DASH_PAYLOAD_BUDGETS", DEFAULT_BUDGETS, int, environ)
+
+
+def check_budgets(outputs: Dict[str, Dict[str, Any]], budgets: Dict[str, int]) -> List[Dict[str, Any]]:
+    """Dépassements de budget d'une réponse ventilée"""
+    violations = []
+    for output, breakdown in outputs.items():
+        limit = budget_for(output, budgets)
+        if limit is not None and breakdown["bytes"] > limit:
+            violations.append({"output": output, "bytes": breakdown["bytes"], "budget": limit,
+                               "largest": largest_parts(breakdown, 3)})
+    return violations
+
+
+def largest_parts(breakdown: Dict[str, Any], top: int = 5) -> List[Tuple[str, int]]:
+    """Plus grosses parties d'une ventilation: attributs de trace ou propriétés de composant"""
+    parts = []
+    for trace in breakdown.get("traces", []):
+        label = f"trace {trace['index']} ({trace['type']}{', ' + str(trace['name']) if trace['name'] else ''})"
+        parts.extend((f"{label}.{attr}", size) for attr, size in trace["attributes"].items())
+    parts.extend((f"layout.{key}", size) for key, size in breakdown.get("layout", {}).items())
+    parts.extend(breakdown.get("components", {}).items())
+    return sorted(parts, key=lambda part: -part[1])[:top]
+
+
+def _record(outputs: Dict[str, Dict[str, Any]]):
+    with _lock:
+        for output, breakdown in outputs.items():
+            stats = _stats.setdefault(output, {"responses": 0, "last_bytes": 0, "max_bytes": 0})
+            stats["responses"] += 1
+            stats["last_bytes"] = breakdown["bytes"]
+            stats["max_bytes"] = max(stats["max_bytes"], breakdown["bytes"])
+
+
+def payload_report() -> Dict[str, Dict[str, Any]]:
+    """Tailles observées par sortie depuis le démarrage (octets)"""
+    with _lock:
+        return {output: dict(stats) for output, stats in sorted(_stats.items())}
+
+
+def install_payload_inspector(server, environ=None) -> bool:
+    """
+    Mesure les réponses des callbacks et de la mise en page si configuré
+
+    Returns:
+        True si le hook a été installé
+    """
+    environ = os.environ if environ is None else environ
+    enabled = lambda name: environ.get(name, "").lower() in ("1", "true", "yes")
+    enforce = enabled("DASH_PAYLOAD_ENFORCE")
+    if not enforce and not enabled("DASH_PAYLOAD_INSPECT"):
+        return False
+
+    from flask import request
+
+    budgets = load_budgets(environ)
+
+    @server.after_request
+    def _inspect_payload(response):
+        if request.path not in (UPDATE_PATH, LAYOUT_PATH) or response.status_code != 200:
+            return response
+        if response.is_streamed or response.mimetype != "application/json":
+            return response
+        outputs = response_breakdown(request.path, response.get_data())
+        _record(outputs)
+        violations = check_budgets(outputs, budgets)
+        if not violations:
+            return response
+        for v in violations:
+            logger.warning(f"Budget de réponse dépassé: {v['output']} {v['bytes']} octets "
+                           f"(budget {v['budget']}), plus grosses parties: {v['largest']}")
+        if enforce:
+            return server.response_class(
+                json.dumps({"error": "payload budget exceeded", "violations": violations}),
+                status=500, mimetype="application/json")
+        return response
+
+    logger.info(f"Inspection des réponses activée (budgets: {len(budgets)}, mode test={enforce})")
+    return True
+
+
+# --- Vérification de tous les callbacks ----------------------------------------
+
+def scenario_payloads() -> List[Tuple[str, Dict[str, Any]]]:
+    """Requêtes couvrant chaque onglet et chaque sortie de figure ou de table"""
+    from loadtest import callback_payload, selection_data, tab_payload, viz1_payload, viz2_payload, viz3_payload
+
+    store = ("store-viz1", "data", selection_data())
+    payloads = [(f"tab {tab}", tab_payload(tab)) for tab in
+                ("viz1", "viz2", "viz3", "viz4", "viz5", "viz6", "viz7")]
+    payloads += [(f"viz1 {view} {chart}", viz1_payload(view, chart))
+                 for view in ("Yearly", "Seasonal", "Monthly", "Weekly", "Daily") for chart in ("Line", "Bar")]
+    payloads.append(("viz1 anomalies", callback_payload([("viz1-anomaly-table", "data")], [store])))
+    payloads += [("viz2 all", viz2_payload("All", [2015, 2025])), ("viz2 PDQ 21", viz2_payload(21, [2019, 2022]))]
+    payloads += [(f"viz3 level {level}", viz3_payload(level)) for level in range(1, 6)]
+    payloads.append(("viz4 scatter", callback_payload([("viz4-scatter", "figure")], [store])))
+    payloads.append(("viz4 table", callback_payload(
+        [("pdq-table", "data"), ("pdq-table", "page_count")],
+        [("pdq-table", "page_current", 0), ("pdq-table", "page_size", None), ("pdq-table", "sort_by", []),
+         ("pdq-table-district", "value", None), ("pdq-table-type", "value", None)])))
+    payloads += [(f"viz5 {view}", callback_payload([("viz5-heatmap", "figure")], [("viz5-view", "value", view), store]))
+                 for view in ("time", "season", "year")]
+    payloads.append(("viz6 calendar", callback_payload([("viz6-calendar", "figure")], [store])))
+    payloads.append(("viz7 comparison", callback_payload(
+        [("viz7-matrix", "figure"), ("viz7-table", "data")],
+        [("viz7-period-a", "start_date", "2023-01-01"), ("viz7-period-a", "end_date", "2023-12-31"),
+         ("viz7-period-b", "start_date", "2024-01-01"), ("viz7-period-b", "end_date", "2024-12-31"), store])))
+    return payloads
+
+
+def inspect_app(budgets: Optional[Dict[str, int]] = None) -> Dict[str, Any]:
+    """
+    Exécute toutes les requêtes de scenario_payloads() dans le processus
+
+    Returns:
+        dict avec 'outputs' (ventilation et budget par sortie, plus grande
+        réponse observée) et 'violations'
+    """
+    import app
+
+    budgets = load_budgets() if budgets is None else budgets
+    client = app.server.test_client()
+    requests = [("layout", None)] + scenario_payloads()
+    outputs, violations, errors = {}, [], []
+    for name, payload in requests:
+        if payload is None:
+            path, response = LAYOUT_PATH, client.get(LAYOUT_PATH)
+        else:
+            path, response = UPDATE_PATH, client.post(UPDATE_PATH, json=payload)
+        if response.status_code != 200:
+            errors.append({"request": name, "status": response.status_code})
+            continue
+        breakdowns = response_breakdown(path, response.get_data())
+        for output, breakdown in breakdowns.items():
+            if output not in outputs or breakdown["bytes"] > outputs[output]["bytes"]:
+                outputs[output] = dict(breakdown, request=name, budget=budget_for(output, budgets))
+        violations += [dict(v, request=name) for v in check_budgets(breakdowns, budgets)]
+    return {"outputs": outputs, "violations": violations, "errors": errors}
+
+
+def print_report(report: Dict[str, Any], top: int = 5):
+    print(f"{'Sortie':<28} {'Octets':>10} {'Budget':>10}  Requête")
+    for output, breakdown in sorted(report["outputs"].items(), key=lambda item: -item[1]["bytes"]):
+        budget = breakdown["budget"]
+        flag = " !" if budget is not None and breakdown["bytes"] > budget else ""
+        print(f"{output:<28} {breakdown['bytes']:>10,} {budget or 0:>10,}  {breakdown['request']}{flag}")
+        for part, size in largest_parts(breakdown, top):
+            print(f"    {part:<52} {size:>10,}")
+    for error in report["errors"]:
+        print(f"Erreur: {error['request']} (statut {error['status']})")
+    if report["violations"]:
+        print(f"\n{len(report['violations'])} dépassement(s) de budget:")
+        for v in report["violations"]:
+            print(f"  {v['output']} ({v['request']}): {v['bytes']:,} > {v['budget']:,} octets")
+
+
+def main(argv=None) -> int:
+    parser = argparse.ArgumentParser(description="Taille des réponses des callbacks Dash et budgets")
+    parser.add_argument("--json", help="Écrit le rapport complet dans ce fichier")
+    parser.add_argument("--top", type=int, default=5, help="Parties les plus grosses affichées par sortie")
+    args = parser.parse_args(argv)
+
+    report = inspect_app()
+    print_report(report, args.top)
+    if args.json:
+        with open(args.json, "w") as f:
+            json.dump(report, f, indent=2)
+        print(f"Rapport écrit dans {args.json}")
+    return 1 if report["violations"] or report["errors"] else 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
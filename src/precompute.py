@@ -0,0 +1,406 @@
+"""
+Précalcul parallèle des agrégats et des caches d'une génération
+
+Les agrégats de DataManager et les caches des visualisations forment un
+graphe de tâches (register_task): chaque tâche déclare ses dépendances,
+l'entrée de la génération qu'elle remplit et son jeu de données. Les
+agrégats servent tous les jeux; les caches des visualisations ne sont
+calculés que pour les générations du jeu par défaut.
+
+    table préparée ─┬─ count_cube ─┬─ year_prefix
+                    │              └─ viz4.stats ─┬─ viz4.table
+                    │                             └─ viz4.figure
+                    ├─ daily_counts ─┬─ series_analytics (processus principal)
+                    │                └─ anomalies (processus principal)
+                    └─ viz3.map_points ─┬─ viz3.markers
+                        (jointure)      └─ viz3.neighbourhood_districts
+
+Les tâches dont les dépendances sont prêtes s'exécutent en parallèle dans un
+pool de processus:
+
+- les processus sont créés par fork une fois la table préparée: ils lisent
+  la génération (table, libellés) sans copie (copy-on-write);
+- chaque résultat revient par un fichier en mémoire (/dev/shm): pickle
+  protocole 5, les tableaux numpy étant écrits hors bande, une seule copie,
+  sans passer par le tube du pool. Le processus principal et les tâches
+  dépendantes projettent ce fichier (mmap): les tableaux du résultat
+  pointent directement dans la projection;
+- les tâches `local` s'exécutent dans le processus principal pendant ce
+  temps (état incrémental de l'analyse des séries et de la détection
+  d'anomalies).
+
+La durée totale tend vers le plus long chemin du graphe (jointure spatiale
+puis agrégats des marqueurs) au lieu de la somme des tâches;
+precompute() retourne la durée de chaque tâche et ce chemin critique.
+
+Nombre de processus: argument workers, sinon DASH_PRECOMPUTE_WORKERS (défaut
+1: calcul séquentiel dans le processus). Un fork depuis le serveur
+multithread (rechargement en arrière-plan) n'est donc fait que sur demande;
+le build des artefacts utilise tous les cœurs par défaut.
+"""
+
+import logging
+import mmap
+import multiprocessing
+import os
+import pickle
+import queue
+import shutil
+import tempfile
+import threading
+import time
+from typing import Any, Callable, Dict, Iterable, List, Optional
+
+from data_manager import DEFAULT_DATASET, DatasetGeneration, get_data_manager
+
+logger = logging.getLogger(__name__)
+
+# Alignement des tableaux dans les fichiers de résultats (lignes de cache)
+_ALIGNMENT = 64
+_SHARED_ROOT = "/dev/shm" if os.path.isdir("/dev/shm") else None
+
+# Génération et répertoire des résultats, hérités par les processus du pool (fork)
+_worker_state: Dict[str, Any] = {}
+
+
+class Task:
+    """
+    Tâche de précalcul d'une génération
+
+    Args:
+        name: Nom unique, clé de l'entrée de la génération par défaut
+        compute: compute(generation, inputs) -> valeur, inputs étant les
+            résultats des dépendances par nom
+        deps: Tâches dont le résultat est nécessaire
+        kind: 'aggregates' ou 'caches' (entrée remplie), None pour un
+            résultat intermédiaire transmis seulement aux dépendances
+        key: Clé dans la génération (défaut: name)
+        local: Exécutée dans le processus principal (état partagé)
+        dataset: Jeu de données dont les générations utilisent la tâche
+            (None: tous les jeux)
+    """
+
+    def __init__(self, name: str, compute: Callable[[DatasetGeneration, Dict[str, Any]], Any],
+                 deps: Iterable[str] = (), kind: Optional[str] = 'caches',
+                 key: Optional[str] = None, local: bool = False,
+                 dataset: Optional[str] = DEFAULT_DATASET):
+        self.name = name
+        self.compute = compute
+        self.deps = tuple(deps)
+        self.kind = kind
+        self.key = key or name
+        self.local = local
+        self.dataset = dataset
+
+    def applies_to(self, dataset: str) -> bool:
+        return self.dataset is None or self.dataset == dataset
+
+
+_tasks: Dict[str, Task] = {}
+
+
+def register_task(name: str, compute: Callable[[DatasetGeneration, Dict[str, Any]], Any],
+                  deps: Iterable[str] = (), kind: Optional[str] = 'caches',
+                  key: Optional[str] = None, local: bool = False,
+                  dataset: Optional[str] = DEFAULT_DATASET) -> Task:
+    """Enregistre une tâche (un nouvel enregistrement remplace l'ancien)"""
+    task = Task(name, compute, deps, kind, key, local, dataset)
+    _tasks[name] = task
+    return task
+
+
+def registered_tasks() -> Dict[str, Task]:
+    return dict(_tasks)
+
+
+def task_order(tasks: Dict[str, Task]) -> List[str]:
+    """
+    Ordre topologique des tâches (ordre d'enregistrement à égalité)
+
+    Raises:
+        ValueError: Dépendance inconnue ou cycle
+    """
+    for task in tasks.values():
+        missing = [dep for dep in task.deps if dep not in tasks]
+        if missing:
+            raise ValueError(f"Tâche {task.name}: dépendances inconnues {missing}")
+    order, done = [], set()
+    while len(order) < len(tasks):
+        ready = [name for name, task in tasks.items()
+                 if name not in done and all(dep in done for dep in task.deps)]
+        if not ready:
+            raise ValueError(f"Cycle entre les tâches {sorted(set(tasks) - done)}")
+        order += ready
+        done.update(ready)
+    return order
+
+
+def select_tasks(names: Optional[Iterable[str]] = None, dataset: Optional[str] = None) -> Dict[str, Task]:
+    """
+    Tâches demandées et leurs dépendances (toutes par défaut)
+
+    Args:
+        names: Tâches à exécuter
+        dataset: Ne garder que les tâches de ce jeu de données (défaut: aucun filtre)
+
+    Raises:
+        ValueError: Tâche demandée hors du jeu de données
+    """
+    tasks = {name: task for name, task in _tasks.items() if dataset is None or task.applies_to(dataset)}
+    if names is None:
+        return tasks
+    selected: Dict[str, Task] = {}
+    pending = list(names)
+    while pending:
+        name = pending.pop()
+        if name not in selected:
+            if name not in tasks:
+                raise ValueError(f"Tâche {name}: inconnue ou hors du jeu {dataset}")
+            selected[name] = tasks[name]
+            pending.extend(tasks[name].deps)
+    return {name: task for name, task in tasks.items() if name in selected}
+
+
+def precompute_workers(environ=None) -> int:
+    """Nombre de processus (DASH_PRECOMPUTE_WORKERS, 1 par défaut)"""
+    environ = os.environ if environ is None else environ
+    try:
+        return max(1, int(environ.get("DASH_PRECOMPUTE_WORKERS") or 1))
+    except ValueError:
+        return 1
+
+
+def critical_path(tasks: Dict[str, Task], seconds: Dict[str, float]) -> float:
+    """Durée du plus long chemin de dépendances (durées de calcul des tâches)"""
+    finish: Dict[str, float] = {}
+    for name in task_order(tasks):
+        finish[name] = seconds.get(name, 0.0) + max((finish[dep] for dep in tasks[name].deps), default=0.0)
+    return max(finish.values(), default=0.0)
+
+
+def _publish(generation: DatasetGeneration, task: Task, value: Any):
+    """Ajoute le résultat à la génération (sauf résultat intermédiaire ou déjà présent)"""
+    if task.kind is not None and task.key not in getattr(generation, task.kind):
+        generation.preload(**{task.kind: {task.key: value}})
+
+
+# --- Transfert des résultats ---------------------------------------------------------
+
+def _share(value: Any, directory: str) -> Dict[str, Any]:
+    """Écrit value dans un fichier de directory: pickle 5, tableaux hors bande alignés"""
+    buffers: List[pickle.PickleBuffer] = []
+    data = pickle.dumps(value, protocol=5, buffer_callback=buffers.append)
+    fd, path = tempfile.mkstemp(dir=directory, suffix=".pkl")
+    spans = []
+    offset = len(data)
+    with os.fdopen(fd, "wb") as f:
+        f.write(data)
+        for buffer in buffers:
+            raw = buffer.raw()
+            padding = -offset % _ALIGNMENT
+            f.write(b"\0" * padding)
+            offset += padding
+            f.write(raw)
+            spans.append((offset, raw.nbytes))
+            offset += raw.nbytes
+    return {"path": path, "pickle": len(data), "buffers": spans, "bytes": offset}
+
+
+def _load(handle: Dict[str, Any]) -> Any:
+    """Valeur écrite par _share(), tableaux projetés depuis le fichier (sans copie)"""
+    with open(handle["path"], "rb") as f:
+        # Copie privée à l'écriture: les tableaux restent modifiables
+        view = memoryview(mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_COPY))
+    buffers = [view[offset:offset + size] for offset, size in handle["buffers"]]
+    return pickle.loads(view[:handle["pickle"]], buffers=buffers)
+
+
+def _run_in_worker(name: str, handles: Dict[str, Dict[str, Any]]):
+    """Exécute une tâche dans un processus du pool; retourne (fichier du résultat, durée)"""
+    generation = _worker_state["generation"]
+    inputs = {dep: _load(handle) for dep, handle in handles.items()}
+    for dep, value in inputs.items():
+        # Les accesseurs de DataManager et des visualisations trouvent ainsi les dépendances
+        _publish(generation, _tasks[dep], value)
+    started = time.perf_counter()
+    value = _tasks[name].compute(generation, inputs)
+    seconds = time.perf_counter() - started
+    return _share(value, _worker_state["directory"]), seconds
+
+
+# --- Exécution -----------------------------------------------------------------------
+
+def _fork_context():
+    try:
+        return multiprocessing.get_context("fork")
+    except ValueError:
+        return None
+
+
+def precompute(generation: DatasetGeneration, workers: Optional[int] = None,
+               names: Optional[Iterable[str]] = None) -> Dict[str, Any]:
+    """
+    Exécute les tâches de précalcul et publie leurs résultats dans la génération
+
+    Une tâche en échec est journalisée et ses dépendantes ignorées: les
+    entrées manquantes seront calculées à la demande.
+
+    Args:
+        generation: Génération à remplir (table préparée)
+        workers: Nombre de processus (défaut: precompute_workers()); 1 ou
+            moteur SQL (connexion non partageable): calcul séquentiel
+        names: Tâches à exécuter avec leurs dépendances (défaut: toutes celles
+            du jeu de la génération)
+
+    Returns:
+        dict avec workers, wall_s, sum_s (somme des durées), critical_path_s,
+        tasks (seconds, start_s, end_s, bytes, where par tâche) et failed
+    """
+    tasks = select_tasks(names, generation.dataset)
+    order = task_order(tasks)
+    workers = precompute_workers() if workers is None else max(1, workers)
+    context = _fork_context()
+    if generation.backend is not None or context is None:
+        workers = 1
+
+    started = time.perf_counter()
+    timings: Dict[str, Dict[str, Any]] = {}
+    failed: Dict[str, str] = {}
+    if workers == 1:
+        _run_serial(generation, tasks, order, started, timings, failed)
+    else:
+        _run_parallel(generation, tasks, order, workers, context, started, timings, failed)
+
+    seconds = {name: timing["seconds"] for name, timing in timings.items()}
+    report = {
+        "workers": workers,
+        "wall_s": time.perf_counter() - started,
+        "sum_s": sum(seconds.values()),
+        "critical_path_s": critical_path(tasks, seconds),
+        "tasks": timings,
+        "failed": failed,
+    }
+    logger.info(f"Précalcul de {len(timings)} tâches en {report['wall_s']:.2f}s avec {workers} processus "
+                f"(somme {report['sum_s']:.2f}s, chemin critique {report['critical_path_s']:.2f}s)")
+    return report
+
+
+def _fail(name: str, error: Any, failed: Dict[str, str]):
+    failed[name] = str(error)
+    logger.warning(f"Précalcul de {name} impossible (calculé à la demande): {error}")
+
+
+def _run_serial(generation, tasks, order, started, timings, failed):
+    results: Dict[str, Any] = {}
+    for name in order:
+        task = tasks[name]
+        if any(dep in failed for dep in task.deps):
+            _fail(name, "dépendance en échec", failed)
+            continue
+        t0 = time.perf_counter()
+        try:
+            value = task.compute(generation, {dep: results[dep] for dep in task.deps})
+        except Exception as e:
+            _fail(name, e, failed)
+            continue
+        t1 = time.perf_counter()
+        _publish(generation, task, value)
+        results[name] = value
+        timings[name] = {"seconds": t1 - t0, "start_s": t0 - started, "end_s": t1 - started,
+                         "bytes": 0, "where": "serial"}
+
+
+def _run_parallel(generation, tasks, order, workers, context, started, timings, failed):
+    directory = tempfile.mkdtemp(prefix="precompute-", dir=_SHARED_ROOT)
+    _worker_state.update(generation=generation, directory=directory)
+    events: "queue.Queue" = queue.Queue()
+    results: Dict[str, Any] = {}
+    handles: Dict[str, Dict[str, Any]] = {}
+    submitted: Dict[str, float] = {}
+    remaining = list(order)
+
+    def run_local(name, inputs):
+        try:
+            t0 = time.perf_counter()
+            value = tasks[name].compute(generation, inputs)
+            events.put((name, (value, time.perf_counter() - t0), None))
+        except Exception as e:
+            events.put((name, None, e))
+
+    # Tous les processus sont créés ici, avant le premier thread de tâche locale
+    pool = context.Pool(min(workers, sum(1 for task in tasks.values() if not task.local)) or 1)
+    try:
+        def launch():
+            for name in list(remaining):
+                task = tasks[name]
+                if any(dep in failed for dep in task.deps):
+                    remaining.remove(name)
+                    _fail(name, "dépendance en échec", failed)
+                elif all(dep in results for dep in task.deps):
+                    remaining.remove(name)
+                    submitted[name] = time.perf_counter()
+                    if task.local:
+                        threading.Thread(target=run_local, args=(name, {dep: results[dep] for dep in task.deps}),
+                                         name=f"precompute-{name}", daemon=True).start()
+                    else:
+                        pool.apply_async(_run_in_worker, (name, {dep: handles[dep] for dep in task.deps}),
+                                         callback=lambda outcome, name=name: events.put((name, outcome, None)),
+                                         error_callback=lambda error, name=name: events.put((name, None, error)))
+
+        launch()
+        while len(submitted) > len(results) + len(set(failed) & set(submitted)):
+            name, outcome, error = events.get()
+            if error is not None:
+                _fail(name, error, failed)
+            else:
+                task = tasks[name]
+                if task.local:
+                    value, seconds = outcome
+                    size = 0
+                else:
+                    handle, seconds = outcome
+                    value = _load(handle)
+                    handles[name] = handle
+                    size = handle["bytes"]
+                _publish(generation, task, value)
+                results[name] = value
+                end = time.perf_counter()
+                timings[name] = {"seconds": seconds, "start_s": submitted[name] - started, "end_s": end - started,
+                                 "bytes": size, "where": "local" if task.local else "process"}
+            launch()
+    finally:
+        pool.terminate()
+        pool.join()
+        _worker_state.clear()
+        shutil.rmtree(directory, ignore_errors=True)
+
+
+def format_report(report: Dict[str, Any]) -> List[str]:
+    """Lignes de rapport: une par tâche (ordre de fin), puis les totaux"""
+    lines = [f"  {'Tâche':<34} {'calcul':>8} {'début':>8} {'fin':>8} {'transfert':>11}"]
+    for name, timing in sorted(report["tasks"].items(), key=lambda item: item[1]["end_s"]):
+        size = f"{timing['bytes'] / 1e6:.1f} Mo" if timing["bytes"] else timing["where"]
+        lines.append(f"  {name:<34} {timing['seconds']:>7.2f}s {timing['start_s']:>7.2f}s "
+                     f"{timing['end_s']:>7.2f}s {size:>11}")
+    lines.append(f"  {report['workers']} processus: {report['wall_s']:.2f}s (somme des tâches "
+                 f"{report['sum_s']:.2f}s, chemin critique {report['critical_path_s']:.2f}s)")
+    for name, error in report["failed"].items():
+        lines.append(f"  échec: {name}: {error}")
+    return lines
+
+
+# Agrégats de DataManager, communs à tous les jeux de données (les tâches des
+# visualisations, enregistrées par leurs modules, ne concernent que le jeu par défaut)
+def _aggregate(getter: str) -> Callable[[DatasetGeneration, Dict[str, Any]], Any]:
+    return lambda generation, inputs: getattr(get_data_manager(generation.dataset), getter)(generation)
+
+
+register_task('count_cube', _aggregate('get_count_cube'), kind='aggregates', dataset=None)
+register_task('year_prefix', _aggregate('get_year_prefix_counts'), deps=('count_cube',), kind='aggregates',
+              dataset=None)
+register_task('daily_counts', _aggregate('get_daily_counts'), kind='aggregates', dataset=None)
+# État incrémental (analyse et détection précédentes) conservé par DataManager: processus principal
+register_task('series_analytics', _aggregate('get_series_analytics'), deps=('daily_counts',), kind='aggregates',
+              local=True, dataset=None)
+register_task('anomalies', _aggregate('get_anomalies'), deps=('daily_counts',), kind='aggregates', local=True,
+              dataset=None)
@@ -0,0 +1,214 @@
+"""
+Profilage à la demande des callbacks Dash
+
+Activé uniquement par variable d'environnement, sinon aucun hook n'est installé
+(surcoût nul):
+    DASH_PROFILE=1                Profile chaque appel à /_dash-update-component
+    DASH_PROFILE_SECRET=<secret>  Profile seulement les requêtes portant un en-tête
+                                  X-Dash-Profile signé (voir sign_profile_header)
+    DASH_PROFILE_DIR=profiles     Répertoire de sortie
+    DASH_PROFILE_INTERVAL=0.001   Période d'échantillonnage (s)
+    DASH_PROFILE_FORMAT=speedscope|folded
+
+Chaque requête profilée produit un fichier speedscope (https://www.speedscope.app)
+ou des piles repliées pour flamegraph.pl. Le profil couvre tout le traitement de
+la requête: appels DataManager, groupby pandas et sérialisation plotly.
+"""
+
+import hashlib
+import hmac
+import json
+import os
+import re
+import sys
+import threading
+import time
+import logging
+from typing import Dict, List, Optional, Tuple
+
+logger = logging.getLogger(__name__)
+
+PROFILE_HEADER = "X-Dash-Profile"
+PROFILED_PATH = "/_dash-update-component"
+SIGNATURE_MAX_AGE = 300
+
+
+def sign_profile_header(secret: str, timestamp: Optional[int] = None) -> str:
+    """
+    Construit la valeur de l'en-tête X-Dash-Profile: "<timestamp>:<hmac-sha256>"
+    """
+    timestamp = int(time.time()) if timestamp is None else timestamp
+    digest = hmac.new(secret.encode(), str(timestamp).encode(), hashlib.sha256).hexdigest()
+    return f"{timestamp}:{digest}"
+
+
+def verify_profile_header(secret: str, value: Optional[str]) -> bool:
+    """Vérifie la signature et la fraîcheur de l'en-tête X-Dash-Profile"""
+    if not value or ":" not in value:
+        return False
+    timestamp, _ = value.split(":", 1)
+    try:
+        age = abs(time.time() - int(timestamp))
+    except ValueError:
+        return False
+    if age > SIGNATURE_MAX_AGE:
+        return False
+    return hmac.compare_digest(value, sign_profile_header(secret, int(timestamp)))
+
+
+class SamplingProfiler:
+    """
+    Profileur par échantillonnage d'un seul thread
+
+    Un thread auxiliaire relève périodiquement la pile du thread cible via
+    sys._current_frames(); le thread profilé n'est pas instrumenté.
+    """
+
+    def __init__(self, thread_id: Optional[int] = None, interval: float = 0.001):
+        self.thread_id = thread_id if thread_id is not None else threading.get_ident()
+        self.interval = interval
+        self.samples: List[Tuple[Tuple[Tuple[str, str, int], ...], float]] = []
+        self._stop = threading.Event()
+        self._thread = None
+        self.start_time = None
+        self.end_time = None
+
+    def start(self):
+        self.start_time = time.perf_counter()
+        self._thread = threading.Thread(target=self._run, name="dash-profiler", daemon=True)
+        self._thread.start()
+
+    def stop(self):
+        self._stop.set()
+        if self._thread is not None:
+            self._thread.join()
+        self.end_time = time.perf_counter()
+
+    def _run(self):
+        last = time.perf_counter()
+        while not self._stop.wait(self.interval):
+            frame = sys._current_frames().get(self.thread_id)
+            now = time.perf_counter()
+            if frame is None:
+                break
+            stack = []
+            while frame is not None:
+                code = frame.f_code
+                stack.append((code.co_name, code.co_filename, code.co_firstlineno))
+                frame = frame.f_back
+            stack.reverse()
+            self.samples.append((tuple(stack), now - last))
+            last = now
+
+    @property
+    def duration(self) -> float:
+        if self.start_time is None or self.end_time is None:
+            return 0.0
+        return self.end_time - self.start_time
+
+    def to_speedscope(self, name: str) -> Dict:
+        """Exporte les échantillons au format speedscope (profil 'sampled')"""
+        frame_index: Dict[Tuple[str, str, int], int] = {}
+        frames = []
+        samples = []
+        weights = []
+        for stack, weight in self.samples:
+            indices = []
+            for key in stack:
+                if key not in frame_index:
+                    frame_index[key] = len(frames)
+                    frames.append({"name": key[0], "file": key[1], "line": key[2]})
+                indices.append(frame_index[key])
+            samples.append(indices)
+            weights.append(weight)
+
+        return {
+            "$schema": "https://www.speedscope.app/file-format-schema.json",
+            "shared": {"frames": frames},
+            "profiles": [{
+                "type": "sampled",
+                "name": name,
+                "unit": "seconds",
+                "startValue": 0,
+                "endValue": sum(weights),
+                "samples": samples,
+                "weights": weights,
+            }],
+            "name": name,
+            "exporter": "montreal-crimes-dashboard",
+        }
+
+    def to_folded(self) -> str:
+        """Exporte les piles repliées (une ligne par pile, poids en microsecondes)"""
+        folded: Dict[str, float] = {}
+        for stack, weight in self.samples:
+            key = ";".join(f"{n} ({os.path.basename(f)}:{l})" for n, f, l in stack)
+            folded[key] = folded.get(key, 0.0) + weight
+        return "\n".join(f"{k} {int(v * 1e6)}" for k, v in folded.items()) + "\n"
+
+
+def _request_label(payload) -> str:
+    """Nom de fichier lisible à partir de la sortie du callback"""
+    output = payload.get("output", "callback") if isinstance(payload, dict) else "callback"
+    return re.sub(r"[^A-Za-z0-9_-]+", "_", output).strip("_")[:80] or "callback"
+
+
+def write_profile(profiler: SamplingProfiler, directory: str, label: str, fmt: str) -> str:
+    """Écrit le profil d'une requête et retourne le chemin du fichier"""
+    os.makedirs(directory, exist_ok=True)
+    stamp = time.strftime("%Y%m%d-%H%M%S")
+    base = f"{stamp}-{int(profiler.duration * 1000)}ms-{label}-{threading.get_ident()}"
+    if fmt == "folded":
+        path = os.path.join(directory, base + ".folded")
+        with open(path, "w") as f:
+            f.write(profiler.to_folded())
+    else:
+        path = os.path.join(directory, base + ".speedscope.json")
+        with open(path, "w") as f:
+            json.dump(profiler.to_speedscope(label), f)
+    return path
+
+
+def install_profiling(server, environ=None) -> bool:
+    """
+    Installe les hooks de profilage sur le serveur Flask si activés
+
+    Returns:
+        True si les hooks ont été installés
+    """
+    environ = os.environ if environ is None else environ
+    always = environ.get("DASH_PROFILE", "").lower() in ("1", "true", "yes")
+    secret = environ.get("DASH_PROFILE_SECRET")
+    if not always and not secret:
+        return False
+
+    from flask import g, request
+
+    directory = environ.get("DASH_PROFILE_DIR", "profiles")
+    interval = float(environ.get("DASH_PROFILE_INTERVAL", "0.001"))
+    fmt = environ.get("DASH_PROFILE_FORMAT", "speedscope")
+
+    @server.before_request
+    def _start_profiler():
+        if request.path != PROFILED_PATH:
+            return
+        if not always and not verify_profile_header(secret, request.headers.get(PROFILE_HEADER)):
+            return
+        g.dash_profiler = SamplingProfiler(interval=interval)
+        g.dash_profiler.start()
+
+    @server.teardown_request
+    def _stop_profiler(exc):
+        profiler = g.pop("dash_profiler", None)
+        if profiler is None:
+            return
+        profiler.stop()
+        try:
+            label = _request_label(request.get_json(silent=True))
+            path = write_profile(profiler, directory, label, fmt)
+            logger.info(f"Profil écrit: {path} ({profiler.duration * 1000:.0f} ms, {len(profiler.samples)} échantillons)")
+        except Exception as e:
+            logger.error(f"Erreur lors de l'écriture du profil: {e}")
+
+    logger.info(f"Profilage activé ({'toutes les requêtes' if always else 'en-tête signé'}) -> {directory}")
+    return True
@@ -0,0 +1,152 @@
+"""
+Sélection globale partagée entre les onglets (filtrage croisé)
+
+La sélection (PDQ, district SPVM, type de crime, plage d'années) est gardée
+dans un dcc.Store existant du layout. Les contrôles de chaque onglet et les
+clics sur les graphiques (bulle de viz4, carte de viz3, cellule de viz5) la
+mettent à jour; les graphiques de tous les onglets sont rendus à partir d'elle
+et des agrégats précalculés de DataManager.
+
+Format stocké (JSON):
+    {'pdq': int | None, 'district': str | None,
+     'category': int | None, 'years': [début, fin] | None}
+
+'category' est un code de catégorie (index de get_labels('category')).
+Un PDQ choisi a priorité sur le district.
+"""
+
+from functools import lru_cache
+from typing import Any, Callable, Dict, List, Optional, Sequence
+
+SELECTION_STORE = "store-viz1"
+SELECTION_FIELDS = ('pdq', 'district', 'category', 'years')
+
+# Libellés des catégories du jeu courant, fournis par DataManager; sans
+# fournisseur (serveur d'instantané autonome), les codes ne sont pas vérifiés
+_category_labels: Optional[Callable[[], Sequence[str]]] = None
+
+
+def register_category_labels(getter: Callable[[], Sequence[str]]):
+    """Source des libellés de catégories: les codes hors table sont retirés des sélections"""
+    global _category_labels
+    _category_labels = getter
+
+
+def empty_selection() -> Dict[str, Any]:
+    """Sélection vide: toutes les données"""
+    return {field: None for field in SELECTION_FIELDS}
+
+
+def _is_all(value) -> bool:
+    return value is None or value == "All" or value == []
+
+
+def normalize_selection(data: Optional[Dict[str, Any]]) -> Dict[str, Any]:
+    """
+    Sélection complète et typée à partir du contenu du store (None accepté)
+
+    Les valeurs « All » des contrôles sont ramenées à None, de même qu'un
+    code de catégorie inconnu (store d'avant un rechargement qui a changé
+    les libellés).
+    """
+    selection = empty_selection()
+    if not data:
+        return selection
+
+    if not _is_all(data.get('pdq')):
+        selection['pdq'] = int(data['pdq'])
+    if not _is_all(data.get('district')):
+        selection['district'] = str(data['district'])
+    if not _is_all(data.get('category')):
+        category = int(data['category'])
+        if _category_labels is None or 0 <= category < len(_category_labels()):
+            selection['category'] = category
+    years = data.get('years')
+    if years and len(years) == 2 and None not in years:
+        start, end = sorted(int(y) for y in years)
+        selection['years'] = [start, end]
+    return selection
+
+
+def update_selection(current: Optional[Dict[str, Any]], **changes) -> Dict[str, Any]:
+    """
+    Nouvelle sélection après application des changements
+
+    Choisir un district efface le PDQ (le district est la zone plus large).
+    """
+    selection = normalize_selection(current)
+    unknown = set(changes) - set(SELECTION_FIELDS)
+    if unknown:
+        raise ValueError(f"Champs de sélection inconnus: {sorted(unknown)}")
+    if 'district' in changes and 'pdq' not in changes and not _is_all(changes['district']):
+        changes['pdq'] = None
+    selection.update(changes)
+    return normalize_selection(selection)
+
+
+def selection_key(selection: Optional[Dict[str, Any]]) -> tuple:
+    """Clé hachable d'une sélection (cache de figures)"""
+    selection = normalize_selection(selection)
+    years = tuple(selection['years']) if selection['years'] else None
+    return selection['pdq'], selection['district'], selection['category'], years
+
+
+def control_value(value):
+    """Valeur d'un contrôle pour un champ de sélection (None -> « All »)"""
+    return "All" if value is None else value
+
+
+@lru_cache(maxsize=1)
+def district_pdqs() -> Dict[str, List[int]]:
+    """Mapping district SPVM -> numéros de PDQ (table de référence de viz4)"""
+    from visualizations.viz4 import create_pdq_dimension_table
+
+    pdq_dim = create_pdq_dimension_table()
+    return {d: sorted(group['PDQ'].tolist()) for d, group in pdq_dim.groupby('district')}
+
+
+def pdq_district(pdq: int) -> Optional[str]:
+    """District SPVM d'un PDQ, None s'il n'est pas répertorié"""
+    for district, pdqs in district_pdqs().items():
+        if pdq in pdqs:
+            return district
+    return None
+
+
+def selected_pdqs(selection: Optional[Dict[str, Any]]) -> Optional[List[int]]:
+    """Numéros de PDQ retenus par la sélection (None = tous)"""
+    selection = normalize_selection(selection)
+    if selection['pdq'] is not None:
+        return [selection['pdq']]
+    if selection['district'] is not None:
+        return district_pdqs().get(selection['district'], [])
+    return None
+
+
+def pdq_codes(pdq_labels: Sequence[int], selection: Optional[Dict[str, Any]]) -> Optional[List[int]]:
+    """Codes d'axe PDQ (index dans pdq_labels) de la sélection (None = tous)"""
+    pdqs = selected_pdqs(selection)
+    if pdqs is None:
+        return None
+    wanted = set(pdqs)
+    return [i for i, p in enumerate(pdq_labels) if p in wanted]
+
+
+def describe_selection(selection: Optional[Dict[str, Any]]) -> str:
+    """Résumé lisible de la sélection (bandeau au-dessus des onglets)"""
+    from data_manager import data_manager
+
+    selection = normalize_selection(selection)
+    parts = []
+    if selection['pdq'] is not None:
+        parts.append(f"PDQ {selection['pdq']}")
+    elif selection['district'] is not None:
+        parts.append(f"{selection['district']} district")
+    if selection['category'] is not None:
+        labels = data_manager.get_labels('category', 'en')
+        if 0 <= selection['category'] < len(labels):
+            parts.append(labels[selection['category']])
+    if selection['years'] is not None:
+        start, end = selection['years']
+        parts.append(str(start) if start == end else f"{start}–{end}")
+    return " · ".join(parts) if parts else "All data"
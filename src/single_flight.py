@@ -0,0 +1,123 @@
+"""
+Calcul unique des résultats demandés simultanément (single-flight)
+
+Au chargement de la page, plusieurs navigateurs ou threads demandent souvent
+le même résultat froid au même moment: premier chargement du CSV, jointure
+spatiale de viz3, agrégats des marqueurs de la carte, figures. Avec SingleFlight.do(),
+un seul appel calcule le résultat d'une clé; les appels concurrents pour la
+même clé attendent et partagent ce résultat (ou son exception).
+
+Les statistiques par nom (calculs, appels partagés, attente, temps de calcul
+économisé) sont retournées par stats() et incluses dans
+DataManager.get_cache_info().
+"""
+
+import threading
+import time
+from typing import Any, Callable, Dict, Hashable
+
+
+class _Flight:
+    """Calcul en cours pour une clé"""
+    __slots__ = ('done', 'result', 'error', 'duration')
+
+    def __init__(self):
+        self.done = threading.Event()
+        self.result = None
+        self.error = None
+        self.duration = 0.0
+
+
+def _empty_stats() -> Dict[str, float]:
+    return {'calls': 0, 'computed': 0, 'shared': 0, 'errors': 0,
+            'compute_s': 0.0, 'wait_s': 0.0, 'saved_s': 0.0}
+
+
+class SingleFlight:
+    """
+    Regroupe les calculs concurrents d'une même clé
+
+    Le calcul ne doit pas redemander sa propre clé (interblocage); des clés
+    différentes peuvent être imbriquées.
+    """
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._flights: Dict[Hashable, _Flight] = {}
+        self._stats: Dict[str, Dict[str, float]] = {}
+
+    def do(self, name: str, key: Hashable, compute: Callable[[], Any]) -> Any:
+        """
+        Résultat de compute() pour (name, key), calculé une seule fois pour
+        tous les appels concurrents
+
+        Args:
+            name: Nom du calcul (regroupement des statistiques)
+            key: Clé du résultat (ex: identifiant de génération, paramètres)
+            compute: Calcul à exécuter par le premier appelant
+
+        Returns:
+            Le résultat, partagé entre les appelants concurrents (ne pas le modifier)
+        """
+        flight_key = (name, key)
+        with self._lock:
+            flight = self._flights.get(flight_key)
+            leader = flight is None
+            if leader:
+                flight = _Flight()
+                self._flights[flight_key] = flight
+
+        if not leader:
+            started = time.perf_counter()
+            flight.done.wait()
+            self._record(name, shared=True, wait=time.perf_counter() - started,
+                         saved=flight.duration, error=flight.error is not None)
+            if flight.error is not None:
+                raise flight.error
+            return flight.result
+
+        started = time.perf_counter()
+        try:
+            flight.result = compute()
+            return flight.result
+        except BaseException as e:
+            flight.error = e
+            raise
+        finally:
+            flight.duration = time.perf_counter() - started
+            with self._lock:
+                self._flights.pop(flight_key, None)
+            flight.done.set()
+            self._record(name, shared=False, compute=flight.duration, error=flight.error is not None)
+
+    def _record(self, name: str, shared: bool, compute: float = 0.0, wait: float = 0.0,
+                saved: float = 0.0, error: bool = False):
+        with self._lock:
+            stats = self._stats.setdefault(name, _empty_stats())
+            stats['calls'] += 1
+            stats['shared' if shared else 'computed'] += 1
+            stats['errors'] += int(error)
+            stats['compute_s'] += compute
+            stats['wait_s'] += wait
+            if not error:
+                stats['saved_s'] += saved
+
+    def in_flight(self) -> int:
+        """Nombre de calculs en cours"""
+        with self._lock:
+            return len(self._flights)
+
+    def stats(self) -> Dict[str, Dict[str, float]]:
+        """Statistiques par nom de calcul (durées en secondes)"""
+        with self._lock:
+            return {
+                name: {k: round(v, 4) if isinstance(v, float) else v for k, v in stats.items()}
+                for name, stats in sorted(self._stats.items())
+            }
+
+    def reset_stats(self):
+        with self._lock:
+            self._stats.clear()
+
+
+single_flight = SingleFlight()
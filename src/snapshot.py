@@ -0,0 +1,604 @@
+"""
+Instantané statique des réponses des callbacks (mode « snapshot »)
+
+Les entrées des callbacks viennent de contrôles à valeurs finies (menus,
+boutons radio, curseurs, onglets) et de la sélection partagée. `build`
+démarre l'application dans le processus, lit /_dash-dependencies et la mise
+en page de chaque onglet, énumère toutes les combinaisons d'entrées
+atteignables depuis les contrôles pour un ensemble de sélections, et
+enregistre le corps exact de chaque réponse:
+
+    snapshot/
+        manifest.json     version, empreintes des données, options, tailles
+        index.json        clé de requête -> (position, longueur, statut)
+        responses.bin     réponses compressées (zlib, dictionnaire commun)
+        dictionary.bin    dictionnaire zlib (gabarit plotly des figures)
+
+La clé d'une requête est l'empreinte de la sortie et des valeurs de ses
+entrées et états; la sélection est normalisée, et les propriétés sans effet
+sur la réponse (largeur du graphique, compteur de clics) sont ignorées.
+
+Deux façons de servir l'instantané:
+
+- DASH_SNAPSHOT=<répertoire> dans l'application complète: les requêtes
+  présentes sont servies depuis l'instantané (aucun calcul), les autres
+  (zoom, superpositions, sélections non énumérées) par les callbacks. Ignoré
+  si les données ne correspondent plus à celles de l'instantané.
+- `python snapshot.py serve`: serveur autonome sans pandas, geopandas ni
+  données. La mise en page, les dépendances et les réponses viennent de
+  l'instantané; les contrôles de la sélection (menus PDQ / type de crime /
+  district, curseurs d'années, bouton d'effacement) sont appliqués avec
+  selection.update_selection. Les requêtes absentes (zoom, clics sur les
+  graphiques, sélections non énumérées) ne changent rien (204).
+
+Sélections énumérées: tous les PDQ (et « tous »), sur toute la période et sur
+la plage complète du curseur d'années; --categories ajoute chaque type de
+crime, --year-ranges all chaque plage d'années, --overlays chaque
+combinaison de superpositions de viz1 / viz2.
+
+Usage (depuis src/):
+    python snapshot.py build [--output DIR] [--categories] [--year-ranges {none,full,all}] [--overlays]
+    python snapshot.py serve [--snapshot DIR] [--port 8050]
+"""
+
+import argparse
+import hashlib
+import itertools
+import json
+import logging
+import mmap
+import os
+import shutil
+import sys
+import threading
+import time
+import zlib
+from typing import Any, Dict, Iterator, List, Optional, Tuple
+
+import selection as shared_selection
+
+logger = logging.getLogger(__name__)
+
+SNAPSHOT_FORMAT = 1
+SRC_DIR = os.path.dirname(os.path.abspath(__file__))
+DEFAULT_DIR = os.path.join(SRC_DIR, "snapshot")
+
+UPDATE_PATH = "/_dash-update-component"
+LAYOUT_PATH = "/_dash-layout"
+DEPENDENCIES_PATH = "/_dash-dependencies"
+LAYOUT_KEY = "GET " + LAYOUT_PATH
+DEPENDENCIES_KEY = "GET " + DEPENDENCIES_PATH
+
+STORE_PROP = f"{shared_selection.SELECTION_STORE}.data"
+# Sans effet sur la réponse: largeur mesurée du graphique (réduction LTTB à la
+# largeur par défaut), zoom hors déclenchement, compteur du bouton d'effacement
+IGNORED_PROPS = {"viz1-graph-width.data", "viz1-graph.relayoutData", "selection-clear.n_clicks"}
+# Déclencheurs jamais servis par l'instantané (zoom: réduction LTTB à la plage visible)
+LIVE_TRIGGERS = {"viz1-graph.relayoutData"}
+# Effacement de la sélection: render_tab utilise alors la sélection vide
+CLEAR_TRIGGER = "selection-clear.n_clicks"
+# Listes dont l'ordre (ordre des clics) ne change pas la réponse
+SET_PROPS = {"viz1-overlays.value", "viz2-overlays.value"}
+
+# Contrôles qui écrivent un champ de la sélection partagée (callbacks select_from_*)
+SELECTION_CONTROLS = {
+    "viz1-pdq-dropdown.value": "pdq",
+    "viz1-category-dropdown.value": "category",
+    "pdq-dropdown.value": "pdq",
+    "year-slider.value": "years",
+    "viz5-pdq-dropdown.value": "pdq",
+    "viz5-district-dropdown.value": "district",
+    "viz5-year-slider.value": "years",
+    "viz6-pdq-dropdown.value": "pdq",
+    "viz6-category-dropdown.value": "category",
+}
+# Contrôle remis à jour quand un autre contrôle du même callback change (select_from_viz5)
+CONTROL_RESETS = {"viz5-district-dropdown.value": "viz5-pdq-dropdown.value"}
+
+NO_CONTENT = 204
+
+
+def _prop_id(item: Dict[str, Any]) -> str:
+    component_id = item["id"]
+    if isinstance(component_id, dict):
+        component_id = json.dumps(component_id, sort_keys=True, separators=(",", ":"))
+    return f"{component_id}.{item['property']}"
+
+
+def _canonical(value: Any) -> str:
+    return json.dumps(value, sort_keys=True, separators=(",", ":"), ensure_ascii=False)
+
+
+def request_key(body: Dict[str, Any]) -> Optional[str]:
+    """
+    Clé d'instantané d'une requête /_dash-update-component
+
+    Returns:
+        Empreinte hexadécimale, None si la requête ne peut pas venir de
+        l'instantané (déclencheur de LIVE_TRIGGERS)
+    """
+    changed = set(body.get("changedPropIds") or ())
+    if changed & LIVE_TRIGGERS:
+        return None
+    cleared = CLEAR_TRIGGER in changed
+
+    values = []
+    for item in list(body.get("inputs") or ()) + list(body.get("state") or ()):
+        if isinstance(item, list):
+            return None  # entrées à motif (ALL / MATCH): non énumérées
+        prop = _prop_id(item)
+        if prop in IGNORED_PROPS:
+            continue
+        value = item.get("value")
+        if prop == STORE_PROP:
+            value = shared_selection.normalize_selection(None if cleared else value)
+        elif prop in SET_PROPS and isinstance(value, list):
+            value = sorted(value, key=_canonical)
+        values.append((prop, value))
+    values.sort(key=lambda pair: pair[0])
+    digest = hashlib.blake2b(_canonical([body.get("output"), values]).encode("utf-8"), digest_size=16)
+    return digest.hexdigest()
+
+
+def _outputs_spec(output: str) -> Any:
+    """Spécification "outputs" d'une requête à partir de la chaîne de sortie des dépendances"""
+    def spec(part):
+        component_id, prop = part.split(".", 1)
+        return {"id": component_id, "property": prop}
+
+    if output.startswith(".."):
+        return [spec(part) for part in output[2:-2].split("...")]
+    return spec(output)
+
+
+def _output_props(output: str) -> List[str]:
+    specs = _outputs_spec(output)
+    specs = specs if isinstance(specs, list) else [specs]
+    return [_prop_id(spec).split("@", 1)[0] for spec in specs]
+
+
+def _json_bytes(value: Any) -> bytes:
+    return json.dumps(value, separators=(",", ":"), ensure_ascii=False).encode("utf-8")
+
+
+class Snapshot:
+    """
+    Instantané ouvert en lecture: index en mémoire, réponses projetées (mmap)
+
+    Args:
+        path: Répertoire écrit par build_snapshot()
+    """
+
+    def __init__(self, path: str):
+        self.path = path
+        with open(os.path.join(path, "manifest.json")) as f:
+            self.manifest = json.load(f)
+        if self.manifest.get("format") != SNAPSHOT_FORMAT:
+            raise ValueError(f"Format d'instantané {self.manifest.get('format')} (attendu {SNAPSHOT_FORMAT})")
+        with open(os.path.join(path, "index.json")) as f:
+            self.index: Dict[str, List[int]] = json.load(f)
+        with open(os.path.join(path, "dictionary.bin"), "rb") as f:
+            self.dictionary = f.read()
+        self._file = open(os.path.join(path, "responses.bin"), "rb")
+        size = os.fstat(self._file.fileno()).st_size
+        self._data = mmap.mmap(self._file.fileno(), 0, access=mmap.ACCESS_READ) if size else b""
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+
+    def get(self, key: Optional[str]) -> Optional[Tuple[int, bytes]]:
+        """(statut, corps) de la réponse enregistrée, None si absente"""
+        entry = self.index.get(key) if key is not None else None
+        with self._lock:
+            if entry is None:
+                self.misses += 1
+                return None
+            self.hits += 1
+        offset, length, status = entry
+        decompressor = zlib.decompressobj(zdict=self.dictionary)
+        body = decompressor.decompress(self._data[offset:offset + length]) + decompressor.flush()
+        return status, body
+
+    def lookup(self, body: Dict[str, Any]) -> Optional[Tuple[int, bytes]]:
+        return self.get(request_key(body))
+
+    def info(self) -> Dict[str, Any]:
+        with self._lock:
+            return {"path": self.path, "entries": len(self.index), "hits": self.hits, "misses": self.misses,
+                    "created": self.manifest.get("created"), "selections": self.manifest.get("selections")}
+
+    def close(self):
+        if isinstance(self._data, mmap.mmap):
+            self._data.close()
+        self._file.close()
+
+
+def selection_response(body: Dict[str, Any]) -> Optional[bytes]:
+    """
+    Réponse d'un callback select_from_* / clear_selection sans les données
+
+    Les valeurs des contrôles de SELECTION_CONTROLS sont appliquées à la
+    sélection courante comme dans callbacks.py (un district choisi efface le
+    PDQ, et le menu PDQ du même callback est remis à jour: CONTROL_RESETS).
+
+    Returns:
+        Corps JSON de la réponse, None si le callback n'écrit pas la sélection
+        ou s'il est déclenché par un clic sur un graphique ou un tableau
+    """
+    outputs = _output_props(body.get("output", ""))
+    if STORE_PROP not in outputs:
+        return None
+    changed = list(body.get("changedPropIds") or ())
+    inputs = {_prop_id(item): item.get("value") for item in body.get("inputs") or ()}
+    current = next((item.get("value") for item in body.get("state") or () if _prop_id(item) == STORE_PROP), None)
+
+    if CLEAR_TRIGGER in changed:
+        updated = shared_selection.empty_selection()
+    elif changed and all(prop in SELECTION_CONTROLS for prop in changed):
+        changes = {SELECTION_CONTROLS[prop]: value for prop, value in inputs.items() if prop in SELECTION_CONTROLS}
+        if any(SELECTION_CONTROLS[prop] == "district" for prop in changed):
+            changes.pop("pdq", None)
+        updated = shared_selection.update_selection(current, **changes)
+    else:
+        return None
+
+    response = {shared_selection.SELECTION_STORE: {"data": updated}}
+    for prop in changed:
+        reset = CONTROL_RESETS.get(prop)
+        if reset in outputs:
+            component_id, name = reset.rsplit(".", 1)
+            response[component_id] = {name: shared_selection.control_value(updated[SELECTION_CONTROLS[reset]])}
+    return _json_bytes({"multi": True, "response": response})
+
+
+def load_snapshot(environ=None) -> Optional[Snapshot]:
+    """Instantané de DASH_SNAPSHOT, None s'il n'est pas configuré ou illisible"""
+    environ = os.environ if environ is None else environ
+    path = environ.get("DASH_SNAPSHOT")
+    if not path:
+        return None
+    try:
+        return Snapshot(path)
+    except (OSError, ValueError) as e:
+        logger.warning(f"Instantané {path} illisible ({e}): callbacks calculés")
+        return None
+
+
+def install_snapshot(server, environ=None, snapshot: Optional[Snapshot] = None, standalone: bool = False) -> bool:
+    """
+    Sert les réponses des callbacks depuis l'instantané si configuré
+
+    Args:
+        server: Serveur Flask de l'application
+        environ: Variables d'environnement (DASH_SNAPSHOT)
+        snapshot: Instantané déjà ouvert (sinon DASH_SNAPSHOT)
+        standalone: Serveur sans données: mise en page et dépendances de
+            l'instantané, sélection appliquée sans callbacks, 204 sinon
+
+    Returns:
+        True si le hook a été installé
+    """
+    snapshot = snapshot or load_snapshot(environ)
+    if snapshot is None:
+        return False
+
+    current_version = None
+    if not standalone:
+        from artifacts import input_digests
+        from data_manager import data_manager
+
+        if input_digests() != snapshot.manifest.get("inputs"):
+            logger.warning(f"Instantané {snapshot.path} construit sur d'autres données: callbacks calculés")
+            return False
+        current_version = data_manager.dataset_version
+
+    from flask import request
+
+    @server.before_request
+    def _serve_snapshot():
+        if standalone and request.method == "GET" and request.path in (LAYOUT_PATH, DEPENDENCIES_PATH):
+            found = snapshot.get(LAYOUT_KEY if request.path == LAYOUT_PATH else DEPENDENCIES_KEY)
+            return server.response_class(found[1], status=found[0], mimetype="application/json")
+        if request.path != UPDATE_PATH or request.method != "POST":
+            return None
+        if current_version is not None and current_version() != snapshot.manifest["inputs"]["csv"]:
+            return None  # données rechargées depuis la construction de l'instantané
+        body = request.get_json(silent=True) or {}
+        found = snapshot.lookup(body)
+        if found is not None:
+            status, data = found
+            return server.response_class(data, status=status, mimetype="application/json")
+        if standalone:
+            data = selection_response(body)
+            if data is not None:
+                return server.response_class(data, mimetype="application/json")
+            return server.response_class(status=NO_CONTENT)
+        return None
+
+    logger.info(f"Instantané {snapshot.path}: {len(snapshot.index)} réponses "
+                f"({'autonome' if standalone else 'callbacks en repli'})")
+    return True
+
+
+# --- Construction ------------------------------------------------------------------
+
+def _collect_components(tree: Any, components: Dict[str, Tuple[str, Dict[str, Any]]]):
+    """Composants avec id d'une mise en page sérialisée: id -> (type, props)"""
+    if isinstance(tree, list):
+        for child in tree:
+            _collect_components(child, components)
+    elif isinstance(tree, dict):
+        props = tree.get("props")
+        if isinstance(props, dict):
+            if props.get("id") is not None and not isinstance(props["id"], dict):
+                components.setdefault(str(props["id"]), (tree.get("type", ""), props))
+            _collect_components(props.get("children"), components)
+        else:
+            _collect_components(list(tree.values()), components)
+
+
+def _option_values(options: Any) -> List[Any]:
+    if isinstance(options, dict):
+        return list(options)
+    return [option["value"] if isinstance(option, dict) else option for option in options or ()]
+
+
+def control_domain(prop: str, components: Dict[str, Tuple[str, Dict[str, Any]]],
+                   overlays: bool = False) -> List[Any]:
+    """
+    Valeurs atteignables d'une propriété d'entrée depuis les contrôles
+
+    Onglets, menus et boutons radio: toutes les options (menus à choix
+    multiples: valeur initiale et chaque option seule); curseurs: chaque
+    pas; cases à cocher: la valeur initiale (ou toutes les combinaisons avec
+    overlays); autres propriétés (dates, pagination...): valeur initiale.
+    """
+    component_id, name = prop.rsplit(".", 1)
+    kind, props = components.get(component_id, ("", {}))
+    if kind == "Tabs" and name == "value":
+        children = props.get("children") or []
+        children = children if isinstance(children, list) else [children]
+        return [child["props"]["value"] for child in children if isinstance(child, dict)]
+    if name == "value" and kind == "Checklist":
+        if not overlays:
+            return [props.get("value")]
+        values = _option_values(props.get("options"))
+        return [list(combo) for size in range(len(values) + 1) for combo in itertools.combinations(values, size)]
+    if name == "value" and props.get("multi"):
+        return [props.get("value")] + [[value] for value in _option_values(props.get("options"))]
+    if name == "value" and "options" in props:
+        return _option_values(props["options"])
+    if name == "value" and kind == "Slider":
+        step = props.get("step") or 1
+        return list(range(int(props["min"]), int(props["max"]) + 1, int(step)))
+    return [props.get(name)]
+
+
+def selection_variants(components: Dict[str, Tuple[str, Dict[str, Any]]], categories: bool = False,
+                       year_ranges: str = "full") -> List[Dict[str, Any]]:
+    """
+    Sélections énumérées, à partir des options des menus de viz1 et du curseur de viz2
+
+    Args:
+        categories: Chaque type de crime en plus de « tous »
+        year_ranges: "none" (toute la période), "full" (et la plage complète
+            du curseur, écrite par viz2) ou "all" (chaque plage d'années)
+    """
+    pdqs = control_domain("viz1-pdq-dropdown.value", components)
+    category_values = control_domain("viz1-category-dropdown.value", components) if categories else ["All"]
+    _, slider = components.get("year-slider", ("", {}))
+    years: List[Optional[List[int]]] = [None]
+    if slider and year_ranges != "none":
+        low, high = int(slider["min"]), int(slider["max"])
+        if year_ranges == "all":
+            years += [[start, end] for start in range(low, high + 1) for end in range(start, high + 1)]
+        else:
+            years.append([low, high])
+    variants = []
+    for pdq, category, span in itertools.product(pdqs, category_values, years):
+        selection = shared_selection.update_selection(None, pdq=pdq, category=category, years=span)
+        if selection not in variants:
+            variants.append(selection)
+    return variants
+
+
+def enumerate_requests(dependencies: List[Dict[str, Any]], components: Dict[str, Tuple[str, Dict[str, Any]]],
+                       selections: List[Dict[str, Any]], overlays: bool = False
+                       ) -> Iterator[Tuple[str, Dict[str, Any]]]:
+    """
+    Requêtes de toutes les combinaisons d'entrées atteignables
+
+    Callbacks serveur seulement, sauf ceux qui écrivent la sélection (servis
+    par selection_response en mode autonome).
+    """
+    for dependency in dependencies:
+        if dependency.get("clientside_function") or STORE_PROP in _output_props(dependency["output"]):
+            continue
+        items = [("inputs", item) for item in dependency["inputs"]] + [("state", item) for item in dependency["state"]]
+        if any(isinstance(item, list) for _, item in items):
+            continue
+        domains = []
+        for _, item in items:
+            prop = _prop_id(item)
+            if prop == STORE_PROP:
+                domains.append(selections)
+            elif prop in SET_PROPS or prop not in IGNORED_PROPS:
+                domains.append(control_domain(prop, components, overlays and prop in SET_PROPS))
+            else:
+                domains.append([control_domain(prop, components)[0]])
+        for values in itertools.product(*domains):
+            body = {"output": dependency["output"], "outputs": _outputs_spec(dependency["output"]),
+                    "inputs": [], "state": [], "changedPropIds": [_prop_id(dependency["inputs"][0])]}
+            for (group, item), value in zip(items, values):
+                body[group].append({"id": item["id"], "property": item["property"], "value": value})
+            yield dependency["output"], body
+
+
+class _BundleWriter:
+    """Écriture de responses.bin et de l'index (compression zlib avec dictionnaire)"""
+
+    def __init__(self, path: str, dictionary: bytes):
+        self.dictionary = dictionary
+        self.index: Dict[str, List[int]] = {}
+        self.raw_bytes = 0
+        self._file = open(os.path.join(path, "responses.bin"), "wb")
+        self._offset = 0
+
+    def add(self, key: str, status: int, body: bytes):
+        compressor = zlib.compressobj(level=9, zdict=self.dictionary)
+        data = compressor.compress(body) + compressor.flush()
+        self._file.write(data)
+        self.index[key] = [self._offset, len(data), status]
+        self._offset += len(data)
+        self.raw_bytes += len(body)
+
+    def close(self) -> int:
+        self._file.close()
+        return self._offset
+
+
+def build_snapshot(output: Optional[str] = None, categories: bool = False, year_ranges: str = "full",
+                   overlays: bool = False) -> Dict[str, Any]:
+    """
+    Énumère et enregistre les réponses de l'application
+
+    Écrit dans un répertoire temporaire renommé à la fin (pas d'instantané
+    partiel). Les réponses en erreur ne sont pas enregistrées.
+
+    Returns:
+        Le manifeste écrit
+    """
+    import dash
+    import app
+    import figure_builder
+    from artifacts import input_digests
+
+    output = output or DEFAULT_DIR
+    started = time.perf_counter()
+    client = app.server.test_client()
+    tmp = f"{output.rstrip(os.sep)}.tmp-{os.getpid()}"
+    shutil.rmtree(tmp, ignore_errors=True)
+    os.makedirs(tmp)
+
+    dictionary = figure_builder.to_json(figure_builder.default_template())
+    with open(os.path.join(tmp, "dictionary.bin"), "wb") as f:
+        f.write(dictionary)
+    writer = _BundleWriter(tmp, dictionary)
+
+    layout = client.get(LAYOUT_PATH)
+    dependencies = client.get(DEPENDENCIES_PATH)
+    writer.add(LAYOUT_KEY, layout.status_code, layout.get_data())
+    writer.add(DEPENDENCIES_KEY, dependencies.status_code, dependencies.get_data())
+
+    # Contrôles de la page et de chaque onglet (sélection vide)
+    components: Dict[str, Tuple[str, Dict[str, Any]]] = {}
+    _collect_components(layout.get_json(), components)
+    for tab in control_domain("tabs.value", components):
+        response = client.post(UPDATE_PATH, json={
+            "output": "tab-content.children", "outputs": {"id": "tab-content", "property": "children"},
+            "inputs": [{"id": "tabs", "property": "value", "value": tab},
+                       {"id": "selection-clear", "property": "n_clicks", "value": 0}],
+            "changedPropIds": ["tabs.value"], "state": [{"id": shared_selection.SELECTION_STORE,
+                                                         "property": "data", "value": None}]})
+        _collect_components(response.get_json()["response"], components)
+
+    selections = selection_variants(components, categories, year_ranges)
+    counts: Dict[str, int] = {}
+    errors: Dict[str, int] = {}
+    for name, body in enumerate_requests(dependencies.get_json(), components, selections, overlays):
+        key = request_key(body)
+        if key is None or key in writer.index:
+            continue
+        response = client.post(UPDATE_PATH, json=body)
+        if response.status_code not in (200, NO_CONTENT):
+            errors[name] = errors.get(name, 0) + 1
+            continue
+        writer.add(key, response.status_code, response.get_data())
+        counts[name] = counts.get(name, 0) + 1
+    compressed = writer.close()
+
+    with open(os.path.join(tmp, "index.json"), "w") as f:
+        json.dump(writer.index, f, separators=(",", ":"))
+    manifest = {
+        "format": SNAPSHOT_FORMAT,
+        "created": time.strftime("%Y-%m-%dT%H:%M:%S%z"),
+        "dash": dash.__version__,
+        "inputs": input_digests(),
+        "options": {"categories": categories, "year_ranges": year_ranges, "overlays": overlays},
+        "selections": len(selections),
+        "responses": counts,
+        "errors": errors,
+        "raw_bytes": writer.raw_bytes,
+        "compressed_bytes": compressed,
+        "build_s": round(time.perf_counter() - started, 1),
+        "index_string": app.app.index_string,
+        "title": app.app.title,
+    }
+    with open(os.path.join(tmp, "manifest.json"), "w") as f:
+        json.dump(manifest, f, indent=2, ensure_ascii=False)
+
+    if os.path.exists(output):
+        shutil.rmtree(output)
+    os.replace(tmp, output)
+    logger.info(f"Instantané écrit dans {output}: {len(writer.index)} réponses")
+    return manifest
+
+
+# --- Serveur autonome -----------------------------------------------------------------
+
+def create_snapshot_app(path: Optional[str] = None):
+    """
+    Application Dash servie uniquement depuis l'instantané (sans pandas ni données)
+
+    Même page (index_string, assets) que app.py; la mise en page et les
+    dépendances sont celles enregistrées.
+    """
+    from dash import Dash, html
+
+    snapshot = Snapshot(path or os.environ.get("DASH_SNAPSHOT") or DEFAULT_DIR)
+    app = Dash(__name__, assets_folder=os.path.join(SRC_DIR, "assets"), suppress_callback_exceptions=True,
+               title=snapshot.manifest.get("title") or "Dash")
+    app.index_string = snapshot.manifest["index_string"]
+    app.layout = html.Div()
+    install_snapshot(app.server, snapshot=snapshot, standalone=True)
+
+    @app.server.route("/api/snapshot")
+    def _snapshot_info():
+        return app.server.response_class(_json_bytes(snapshot.info()), mimetype="application/json")
+
+    return app
+
+
+def main(argv=None) -> int:
+    parser = argparse.ArgumentParser(description="Instantané statique des réponses des callbacks")
+    commands = parser.add_subparsers(dest="command", required=True)
+    build = commands.add_parser("build", help="Énumère les entrées et enregistre les réponses")
+    build.add_argument("--output", default=None, help="Répertoire de l'instantané (défaut: src/snapshot)")
+    build.add_argument("--categories", action="store_true", help="Chaque type de crime dans les sélections")
+    build.add_argument("--year-ranges", choices=("none", "full", "all"), default="full",
+                       help="Plages d'années des sélections (défaut: toute la période et plage complète)")
+    build.add_argument("--overlays", action="store_true", help="Chaque combinaison de superpositions")
+    serve = commands.add_parser("serve", help="Serveur autonome (sans pandas)")
+    serve.add_argument("--snapshot", default=None, help="Répertoire de l'instantané (défaut: DASH_SNAPSHOT ou src/snapshot)")
+    serve.add_argument("--host", default="127.0.0.1")
+    serve.add_argument("--port", type=int, default=8050)
+    args = parser.parse_args(argv)
+
+    logging.basicConfig(level=logging.INFO)
+    if args.command == "build":
+        manifest = build_snapshot(args.output, args.categories, args.year_ranges, args.overlays)
+        total = sum(manifest["responses"].values())
+        print(f"Instantané: {total} réponses pour {manifest['selections']} sélections en {manifest['build_s']:.0f}s, "
+              f"{manifest['raw_bytes'] / 1e6:.1f} Mo -> {manifest['compressed_bytes'] / 1e6:.1f} Mo")
+        for name, count in sorted(manifest["responses"].items(), key=lambda item: -item[1]):
+            print(f"  {count:>7}  {name}")
+        for name, count in manifest["errors"].items():
+            print(f"  erreurs: {count} pour {name}")
+        return 1 if manifest["errors"] else 0
+
+    create_snapshot_app(args.snapshot).run(host=args.host, port=args.port)
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,395 @@
+"""
+Moteur SQL embarqué optionnel pour DataManager (SQLite ou DuckDB)
+
+Par défaut, chaque worker garde tous les incidents dans un DataFrame. Avec
+DASH_DATA_BACKEND=sqlite ou duckdb, le CSV est ingéré par tranches dans un
+fichier de base de données local et DataManager y pousse ses filtres
+(get_filtered_data) et ses regroupements (cube de comptes, comptes
+quotidiens): seuls des résultats de petite taille reviennent en mémoire.
+
+Variables d'environnement:
+    DASH_DATA_BACKEND=pandas|sqlite|duckdb   Moteur (défaut: pandas, tout en mémoire)
+    DASH_DATA_DB_DIR=<répertoire>            Emplacement des bases (défaut: celui du CSV)
+
+Chaque version du CSV a son propre fichier (<nom>.<empreinte>.<moteur>),
+écrit à côté puis renommé: une génération publiée lit toujours la même base.
+La jointure spatiale de viz3 ne lit que ses colonnes (select) et les
+statistiques de viz4 viennent du cube de comptes; seuls les consommateurs qui
+ont besoin de lignes complètes (export des incidents) matérialisent la table
+à leur première utilisation.
+
+DuckDB (stockage en colonnes) est optionnel: pip install duckdb.
+"""
+
+import logging
+import os
+import sqlite3
+from abc import ABC, abstractmethod
+from typing import Any, Dict, Iterator, List, Optional, Sequence, Tuple
+
+import numpy as np
+import pandas as pd
+
+from aggregates import CountCube, DailyCounts, build_count_cube, build_daily_counts
+from data_manager import _file_digest, _normalize_categories, _normalize_shifts, _prepare_table
+
+logger = logging.getLogger(__name__)
+
+INGEST_CHUNK_ROWS = 100_000
+# Colonnes du CSV d'origine, dans leur ordre, reconstruites par rows()
+SOURCE_COLUMNS = ('CATEGORIE', 'DATE', 'QUART', 'PDQ', 'X', 'Y', 'LONGITUDE', 'LATITUDE')
+# Colonnes numériques: même type quel que soit le contenu d'une tranche (NULL seuls)
+NUMERIC_COLUMNS = ('PDQ', 'X', 'Y', 'LONGITUDE', 'LATITUDE')
+TABLE = "incidents"
+
+
+def incident_rows(chunk: pd.DataFrame, first_row: int) -> pd.DataFrame:
+    """
+    Lignes à insérer pour une tranche du CSV: colonnes d'origine + colonnes
+    de filtrage et de regroupement (YEAR, MONTH, DOW, SHIFT_CODE)
+    """
+    frame = pd.DataFrame({'ROW_ID': np.arange(first_row, first_row + len(chunk), dtype=np.int64)})
+    dates = pd.to_datetime(chunk['DATE'], errors='coerce')
+    for column in SOURCE_COLUMNS:
+        if column == 'DATE':
+            frame['DATE'] = dates.dt.strftime('%Y-%m-%d').to_numpy()
+        elif column in chunk.columns:
+            frame[column] = chunk[column].to_numpy()
+    frame['YEAR'] = dates.dt.year.to_numpy()
+    frame['MONTH'] = dates.dt.month.to_numpy()
+    frame['DOW'] = dates.dt.dayofweek.to_numpy()
+    if 'QUART' in chunk.columns:
+        frame['SHIFT_CODE'] = _normalize_shifts(chunk['QUART'])
+    else:
+        frame['SHIFT_CODE'] = np.full(len(chunk), -1, dtype=np.int8)
+    return frame
+
+
+class SQLBackend(ABC):
+    """
+    Table des incidents dans une base locale, interrogée en lecture seule
+
+    Une connexion est ouverte par requête: l'objet peut être partagé entre
+    threads. Un moteur implémente connect, _fetch et _append (une classe
+    incomplète ne peut pas être instanciée).
+
+    Args:
+        path: Fichier de la base
+    """
+    engine = None
+    extension = None
+
+    def __init__(self, path: str):
+        self.path = path
+        self._categories = None
+        self._columns = None
+
+    @classmethod
+    def check_available(cls):
+        """Lève ImportError si le moteur n'est pas installé"""
+
+    @abstractmethod
+    def connect(self, read_only: bool = True):
+        """Connexion à la base (lecture seule par défaut)"""
+
+    @abstractmethod
+    def _fetch(self, con, sql: str, params: Sequence[Any]) -> pd.DataFrame:
+        """Résultat d'une requête en DataFrame"""
+
+    @abstractmethod
+    def _append(self, con, frame: pd.DataFrame, create: bool):
+        """Ajoute une tranche d'incidents (création de la table à la première)"""
+
+    def _finish(self, con):
+        """Index et statistiques après l'ingestion"""
+
+    def query(self, sql: str, params: Sequence[Any] = ()) -> pd.DataFrame:
+        con = self.connect()
+        try:
+            return self._fetch(con, sql, list(params))
+        finally:
+            con.close()
+
+    @classmethod
+    def ingest(cls, csv_path: str, path: str, chunk_rows: int = INGEST_CHUNK_ROWS) -> "SQLBackend":
+        """
+        Ingère le CSV par tranches dans une nouvelle base
+
+        La base est écrite dans un fichier temporaire renommé à la fin: une
+        ingestion interrompue ne laisse jamais de base partielle.
+        """
+        tmp = f"{path}.tmp-{os.getpid()}"
+        if os.path.exists(tmp):
+            os.remove(tmp)
+        backend = cls(tmp)
+        con = backend.connect(read_only=False)
+        rows = 0
+        try:
+            for chunk in pd.read_csv(csv_path, chunksize=chunk_rows):
+                backend._append(con, incident_rows(chunk, rows), create=rows == 0)
+                rows += len(chunk)
+            if rows == 0:
+                raise ValueError(f"{csv_path}: aucune ligne à ingérer")
+            backend._finish(con)
+        except Exception:
+            con.close()
+            if os.path.exists(tmp):
+                os.remove(tmp)
+            raise
+        con.close()
+        os.replace(tmp, path)
+        logger.info(f"{rows} incidents ingérés dans {path} ({cls.engine})")
+        return cls(path)
+
+    @property
+    def columns(self) -> List[str]:
+        """Colonnes d'origine présentes dans la base"""
+        if self._columns is None:
+            present = set(self.query(f"SELECT * FROM {TABLE} LIMIT 0").columns)
+            self._columns = [c for c in SOURCE_COLUMNS if c in present]
+        return self._columns
+
+    def row_count(self) -> int:
+        return int(self.query(f"SELECT COUNT(*) AS n FROM {TABLE}")['n'].iloc[0])
+
+    def categories(self) -> List[str]:
+        """Valeurs brutes distinctes de CATEGORIE, triées comme pd.Categorical"""
+        if self._categories is None:
+            values = self.query(f"SELECT DISTINCT CATEGORIE FROM {TABLE} WHERE CATEGORIE IS NOT NULL")
+            self._categories = sorted(str(v) for v in values['CATEGORIE'])
+        return self._categories
+
+    def category_labels(self) -> Dict[str, List[str]]:
+        """Libellés des catégories, identiques à ceux du chargement en mémoire"""
+        return _normalize_categories(pd.Series(self.categories()), self.categories())[1]
+
+    def category_codes(self, values: pd.Series) -> np.ndarray:
+        return _normalize_categories(values, self.categories())[0]
+
+    def _prepared(self, frame: pd.DataFrame) -> pd.DataFrame:
+        frame['DATE'] = pd.to_datetime(frame['DATE'])
+        _prepare_table(frame, self.categories())
+        return frame
+
+    def rows(self, where: str = "", params: Sequence[Any] = ()) -> pd.DataFrame:
+        """
+        Lignes filtrées, préparées comme la table en mémoire (_prepare_table)
+        """
+        columns = ", ".join(self.columns)
+        return self._prepared(self.query(f"SELECT {columns} FROM {TABLE} {where} ORDER BY ROW_ID", params))
+
+    def iter_rows(self, where: str = "", params: Sequence[Any] = (),
+                  chunk_rows: int = INGEST_CHUNK_ROWS) -> Iterator[pd.DataFrame]:
+        """
+        Lignes filtrées par tranches de chunk_rows (fetchmany sur un seul
+        curseur), préparées comme rows(): la mémoire ne dépend pas du nombre
+        de lignes retenues
+        """
+        columns = ", ".join(self.columns)
+        con = self.connect()
+        try:
+            cursor = con.execute(f"SELECT {columns} FROM {TABLE} {where} ORDER BY ROW_ID", list(params))
+            names = [description[0] for description in cursor.description]
+            while True:
+                records = cursor.fetchmany(chunk_rows)
+                if not records:
+                    break
+                frame = pd.DataFrame.from_records(records, columns=names)
+                for column in NUMERIC_COLUMNS:
+                    if column in frame.columns:
+                        frame[column] = pd.to_numeric(frame[column]).astype(np.float64)
+                yield self._prepared(frame)
+        finally:
+            con.close()
+
+    def incident_where(self, years: Optional[Sequence[int]] = None, pdqs: Optional[Sequence[int]] = None,
+                       category: Optional[int] = None,
+                       bbox: Optional[Sequence[float]] = None) -> Tuple[str, List[Any]]:
+        """
+        Clause WHERE (et paramètres) des filtres d'incidents
+
+        Args:
+            years: Première et dernière année incluses
+            pdqs: PDQ retenus
+            category: Code de catégorie (CATEGORY_CODE)
+            bbox: lon_min, lat_min, lon_max, lat_max
+        """
+        clauses, params = [], []
+        if years is not None:
+            clauses.append("YEAR BETWEEN ? AND ?")
+            params.extend(int(year) for year in years)
+        if pdqs is not None:
+            clauses.append(f"PDQ IN ({', '.join('?' * len(pdqs))})" if len(pdqs) else "1 = 0")
+            params.extend(float(pdq) for pdq in pdqs)
+        if category is not None:
+            codes = self.category_codes(pd.Series(self.categories()))
+            raw = [value for value, code in zip(self.categories(), codes) if code == category]
+            clauses.append(f"CATEGORIE IN ({', '.join('?' * len(raw))})" if raw else "1 = 0")
+            params.extend(raw)
+        if bbox is not None:
+            clauses.append("LONGITUDE BETWEEN ? AND ? AND LATITUDE BETWEEN ? AND ?")
+            params.extend(float(bbox[i]) for i in (0, 2, 1, 3))
+        return (f"WHERE {' AND '.join(clauses)}" if clauses else ""), params
+
+    def select(self, columns: Sequence[str]) -> pd.DataFrame:
+        """
+        Quelques colonnes de toutes les lignes, dans l'ordre de la table
+
+        Args:
+            columns: Colonnes stockées (YEAR, MONTH, PDQ, LONGITUDE, ...) ou
+                CATEGORY_CODE, calculé à partir de CATEGORIE comme à la préparation
+        """
+        stored = ['CATEGORIE' if column == 'CATEGORY_CODE' else column for column in columns]
+        frame = self.query(f"SELECT {', '.join(dict.fromkeys(stored))} FROM {TABLE} ORDER BY ROW_ID")
+        if 'CATEGORY_CODE' in columns:
+            frame['CATEGORY_CODE'] = self.category_codes(frame['CATEGORIE'])
+        return frame[list(columns)]
+
+    def filtered(self, start_year: Optional[int] = None, end_year: Optional[int] = None,
+                 pdq: Optional[int] = None, category: Optional[str] = None) -> pd.DataFrame:
+        """
+        Filtres de DataManager.get_filtered_data() exécutés par le moteur
+
+        Args:
+            category: Libellé français de la catégorie (comme la colonne CATEGORIE préparée)
+        """
+        clauses, params = [], []
+        if start_year is not None:
+            clauses.append("YEAR >= ?")
+            params.append(int(start_year))
+        if end_year is not None:
+            clauses.append("YEAR <= ?")
+            params.append(int(end_year))
+        if pdq is not None:
+            clauses.append("PDQ = ?")
+            params.append(float(pdq))
+        if category is not None:
+            labels = self.category_labels()['fr']
+            codes = self.category_codes(pd.Series(self.categories()))
+            raw = [value for value, code in zip(self.categories(), codes) if labels[code] == category]
+            if not raw:
+                clauses.append("1 = 0")
+            else:
+                clauses.append(f"CATEGORIE IN ({', '.join('?' * len(raw))})")
+                params.extend(raw)
+        where = f"WHERE {' AND '.join(clauses)}" if clauses else ""
+        return self.rows(where, params)
+
+    def count_cube(self, category_labels: List[str]) -> CountCube:
+        """Cube de comptes à partir d'un GROUP BY sur les axes du cube"""
+        grouped = self.query(
+            f"SELECT PDQ, YEAR, MONTH, DOW AS DayOfWeek, CATEGORIE, SHIFT_CODE, COUNT(*) AS n "
+            f"FROM {TABLE} GROUP BY PDQ, YEAR, MONTH, DOW, CATEGORIE, SHIFT_CODE"
+        )
+        grouped['CATEGORY_CODE'] = self.category_codes(grouped['CATEGORIE'])
+        logger.info(f"Cube de comptes ({self.engine}): {len(grouped)} groupes")
+        return build_count_cube(grouped, category_labels, weights=grouped['n'].to_numpy())
+
+    def daily_counts(self, category_labels: List[str]) -> DailyCounts:
+        """Comptes quotidiens à partir d'un GROUP BY jour, PDQ, catégorie"""
+        grouped = self.query(
+            f"SELECT DATE, PDQ, CATEGORIE, COUNT(*) AS n FROM {TABLE} "
+            f"WHERE DATE IS NOT NULL GROUP BY DATE, PDQ, CATEGORIE"
+        )
+        grouped['DATE'] = pd.to_datetime(grouped['DATE'])
+        grouped['CATEGORY_CODE'] = self.category_codes(grouped['CATEGORIE'])
+        return build_daily_counts(grouped, category_labels, weights=grouped['n'].to_numpy())
+
+
+class SQLiteBackend(SQLBackend):
+    """SQLite (bibliothèque standard), index sur les colonnes filtrées"""
+    engine = "sqlite"
+    extension = "sqlite"
+
+    def connect(self, read_only: bool = True):
+        if read_only:
+            return sqlite3.connect(f"file:{self.path}?mode=ro", uri=True, check_same_thread=False)
+        return sqlite3.connect(self.path)
+
+    def _fetch(self, con, sql, params):
+        return pd.read_sql_query(sql, con, params=params)
+
+    def _append(self, con, frame, create):
+        frame.to_sql(TABLE, con, if_exists='append', index=False)
+
+    def _finish(self, con):
+        for column in ('YEAR', 'PDQ', 'CATEGORIE'):
+            con.execute(f"CREATE INDEX idx_{TABLE}_{column.lower()} ON {TABLE} ({column})")
+        con.execute("ANALYZE")
+        con.commit()
+
+
+class DuckDBBackend(SQLBackend):
+    """DuckDB: stockage en colonnes, regroupements vectorisés"""
+    engine = "duckdb"
+    extension = "duckdb"
+
+    @classmethod
+    def check_available(cls):
+        import duckdb  # noqa: F401
+
+    def connect(self, read_only: bool = True):
+        import duckdb
+        return duckdb.connect(self.path, read_only=read_only)
+
+    def _fetch(self, con, sql, params):
+        return con.execute(sql, params).df()
+
+    def _append(self, con, frame, create):
+        con.register("chunk", frame)
+        if create:
+            con.execute(f"CREATE TABLE {TABLE} AS SELECT * FROM chunk")
+        else:
+            con.execute(f"INSERT INTO {TABLE} SELECT * FROM chunk")
+        con.unregister("chunk")
+
+
+BACKENDS = {backend.engine: backend for backend in (SQLiteBackend, DuckDBBackend)}
+
+
+def _prune_databases(directory: str, stem: str, extension: str, current: str, keep: int = 2):
+    """Supprime les bases des anciennes versions du CSV (garde les `keep` plus récentes)"""
+    suffix = f".{extension}"
+    paths = [
+        os.path.join(directory, name) for name in os.listdir(directory)
+        if name.startswith(f"{stem}.") and name.endswith(suffix)
+    ]
+    paths.sort(key=os.path.getmtime, reverse=True)
+    for path in paths[max(keep, 1):]:
+        if path != current:
+            os.remove(path)
+            logger.info(f"Ancienne base supprimée: {path}")
+
+
+def open_backend(engine: str, csv_path: str, directory: Optional[str] = None) -> Tuple[SQLBackend, str]:
+    """
+    Base correspondant au contenu actuel du CSV, ingérée si nécessaire
+
+    Args:
+        engine: 'sqlite' ou 'duckdb'
+        csv_path: CSV des incidents
+        directory: Répertoire des bases (défaut: celui du CSV)
+
+    Returns:
+        (moteur, empreinte SHA-256 du CSV)
+
+    Raises:
+        ValueError: moteur inconnu
+        ImportError: moteur non installé
+    """
+    backend_class = BACKENDS.get(engine)
+    if backend_class is None:
+        raise ValueError(f"Moteur inconnu: {engine} (pandas, {', '.join(BACKENDS)})")
+    backend_class.check_available()
+
+    digest = _file_digest(csv_path)
+    directory = directory or os.path.dirname(os.path.abspath(csv_path))
+    os.makedirs(directory, exist_ok=True)
+    stem = os.path.splitext(os.path.basename(csv_path))[0]
+    path = os.path.join(directory, f"{stem}.{digest[:16]}.{backend_class.extension}")
+    if os.path.exists(path):
+        return backend_class(path), digest
+
+    backend = backend_class.ingest(csv_path, path)
+    _prune_databases(directory, stem, backend_class.extension, current=path)
+    return backend, digest
@@ -0,0 +1,287 @@
+"""
+Temps de démarrage d'un worker: imports, premier octet servi, onglets chauds
+
+Chaque mesure part d'un processus neuf, comme un worker gunicorn qui démarre
+ou une instance ajoutée par l'autoscaling:
+
+- imports: `python -X importtime -c "import app"`, durée cumulée des paquets
+  suivis (TRACKED_MODULES), modules les plus lents en temps propre, et
+  modules qui ne doivent pas être chargés au démarrage (BOOT_DEFERRED:
+  importés à la première utilisation seulement);
+- premier octet: gunicorn lancé comme sur Render (render.yaml), délai
+  jusqu'à la première réponse complète de "/";
+- onglets: sur ce même serveur, chaque onglet puis ses callbacks (requêtes de
+  payload_inspector.scenario_payloads), dans l'ordre: durée à froid, durée
+  au deuxième passage et instant où l'onglet est chaud depuis le lancement.
+
+Chaque mesure est répétée (--repeat) et la médiane est retenue. Budgets en
+secondes (DEFAULT_BUDGETS, motifs fnmatch, complétés par
+DASH_STARTUP_BUDGETS=<json ou chemin>, consultés en premier): code de sortie 1 si un budget est
+dépassé, si un module différé est chargé ou si une requête échoue.
+
+Usage (depuis src/, avec les artefacts de build comme en production):
+    python startup_bench.py [--repeat 3] [--top 15] [--json rapport.json]
+"""
+
+import argparse
+import json
+import re
+import socket
+import statistics
+import subprocess
+import sys
+import time
+import urllib.request
+from typing import Any, Dict, List, Optional, Tuple
+
+import budget_patterns
+from budget_patterns import budget_for
+from loadtest import SRC_DIR, UPDATE_PATH, post_json, stop_server
+
+# Budgets (secondes), environ le double des durées mesurées avec les artefacts
+DEFAULT_BUDGETS: Dict[str, float] = {
+    "import.app": 4.0,
+    "first_byte": 5.0,
+    "tab.*.cold": 1.0,
+    "tab.*.warm": 0.25,
+}
+
+TRACKED_MODULES = ("dash", "flask", "plotly", "numpy", "pandas", "pyarrow", "scipy",
+                   "data_manager", "artifacts", "callbacks", "figure_builder")
+# Importés à la première utilisation: le démarrage ne doit pas les charger
+BOOT_DEFERRED = ("geopandas", "shapely", "pyproj", "pyogrio", "fiona", "plotly.express")
+
+TABS = ("viz1", "viz2", "viz3", "viz4", "viz5", "viz6", "viz7")
+_IMPORT_LINE = re.compile(r"import time:\s+(\d+) \|\s+(\d+) \|( *)(\S+)")
+
+
+def load_budgets(environ=None) -> Dict[str, float]:
+    """Budgets par défaut complétés par DASH_STARTUP_BUDGETS (prioritaires, voir budget_patterns)"""
+    return budget_patterns.load_budgets("DASH_STARTUP_BUDGETS", DEFAULT_BUDGETS, float, environ)
+
+
+# --- Imports ----------------------------------------------------------------------
+
+def parse_importtime(output: str) -> List[Tuple[str, int, float, float]]:
+    """Lignes de -X importtime: (module, profondeur, temps propre, temps cumulé) en secondes"""
+    modules = []
+    for line in output.splitlines():
+        match = _IMPORT_LINE.match(line)
+        if match:
+            self_us, cumulative_us, indent, name = match.groups()
+            modules.append((name, len(indent) // 2, int(self_us) / 1e6, int(cumulative_us) / 1e6))
+    return modules
+
+
+def measure_imports(module: str = "app") -> Dict[str, Any]:
+    """
+    Importe module dans un interpréteur neuf avec -X importtime
+
+    Returns:
+        dict avec wall_s (processus complet), modules (durée cumulée du premier
+        import de chaque module) et self (temps propre par module)
+    """
+    started = time.perf_counter()
+    result = subprocess.run([sys.executable, "-X", "importtime", "-c", f"import {module}"],
+                            cwd=SRC_DIR, capture_output=True, text=True)
+    wall = time.perf_counter() - started
+    if result.returncode != 0:
+        raise RuntimeError(f"import {module} a échoué: {result.stderr[-2000:]}")
+    cumulative, own = {}, {}
+    for name, _, self_s, cumulative_s in parse_importtime(result.stderr):
+        cumulative.setdefault(name, cumulative_s)
+        own[name] = own.get(name, 0.0) + self_s
+    return {"wall_s": wall, "modules": cumulative, "self": own}
+
+
+def deferred_loaded(modules: Dict[str, float]) -> List[str]:
+    """Modules de BOOT_DEFERRED (ou sous-modules) chargés par l'import"""
+    return sorted(name for name in BOOT_DEFERRED
+                  if any(loaded == name or loaded.startswith(name + ".") for loaded in modules))
+
+
+# --- Premier octet et onglets -------------------------------------------------------
+
+def _free_port() -> int:
+    with socket.socket() as sock:
+        sock.bind(("127.0.0.1", 0))
+        return sock.getsockname()[1]
+
+
+def start_server(port: int, timeout: float = 120.0) -> Tuple[subprocess.Popen, float]:
+    """
+    Lance gunicorn (un worker, comme render.yaml) et attend la première réponse de "/"
+
+    Returns:
+        (processus, délai en secondes jusqu'au premier octet servi)
+    """
+    cmd = [sys.executable, "-m", "gunicorn", "--chdir", SRC_DIR, "app:server",
+           "--bind", f"127.0.0.1:{port}", "--workers", "1", "--timeout", "300"]
+    started = time.perf_counter()
+    proc = subprocess.Popen(cmd, stdout=subprocess.DEVNULL, stderr=subprocess.PIPE, start_new_session=True)
+    while time.perf_counter() - started < timeout:
+        if proc.poll() is not None:
+            raise RuntimeError(f"gunicorn s'est arrêté: {proc.stderr.read().decode(errors='replace')[-2000:]}")
+        try:
+            with urllib.request.urlopen(f"http://127.0.0.1:{port}/", timeout=timeout) as response:
+                response.read()
+                return proc, time.perf_counter() - started
+        except OSError:
+            time.sleep(0.02)
+    stop_server(proc)
+    raise RuntimeError(f"Le serveur n'a pas répondu en {timeout:.0f}s")
+
+
+def tab_requests() -> Dict[str, List[Tuple[str, Dict[str, Any]]]]:
+    """Requêtes de chaque onglet: l'onglet puis ses callbacks (scenario_payloads)"""
+    from payload_inspector import scenario_payloads
+
+    requests: Dict[str, List[Tuple[str, Dict[str, Any]]]] = {tab: [] for tab in TABS}
+    for name, payload in scenario_payloads():
+        words = name.split()
+        tab = words[1] if words[0] == "tab" else words[0]
+        requests.setdefault(tab, []).append((name, payload))
+    return requests
+
+
+def _replay(url: str, payloads: List[Tuple[str, Dict[str, Any]]], timeout: float,
+            errors: List[Dict[str, Any]]) -> float:
+    """Envoie les requêtes dans l'ordre, retourne la durée totale (erreurs ajoutées à errors)"""
+    started = time.perf_counter()
+    for name, payload in payloads:
+        status, _ = post_json(url, payload, timeout)
+        if status not in (200, 204):
+            errors.append({"request": name, "status": status})
+    return time.perf_counter() - started
+
+
+def measure_server(timeout: float = 120.0) -> Dict[str, Any]:
+    """
+    Premier octet puis chaque onglet à froid et à chaud sur un gunicorn neuf
+
+    Returns:
+        dict avec first_byte_s, tabs (cold_s, warm_s, warm_at_s par onglet) et
+        errors (requêtes en erreur)
+    """
+    requests = tab_requests()
+    port = _free_port()
+    url = f"http://127.0.0.1:{port}{UPDATE_PATH}"
+    started = time.perf_counter()
+    proc, first_byte = start_server(port, timeout)
+    tabs, errors = {}, []
+    try:
+        for tab, payloads in requests.items():
+            cold = _replay(url, payloads, timeout, errors)
+            warm_at = time.perf_counter() - started
+            warm = _replay(url, payloads, timeout, errors)
+            tabs[tab] = {"cold_s": cold, "warm_s": warm, "warm_at_s": warm_at, "requests": len(payloads)}
+    finally:
+        stop_server(proc)
+    return {"first_byte_s": first_byte, "tabs": tabs, "errors": errors}
+
+
+# --- Rapport ---------------------------------------------------------------------
+
+def run_benchmark(repeat: int = 3, budgets: Optional[Dict[str, float]] = None,
+                  timeout: float = 120.0) -> Dict[str, Any]:
+    """
+    Mesures répétées (médianes) et vérification des budgets
+
+    Returns:
+        dict avec metrics (nom -> secondes), imports (dernière mesure),
+        deferred_loaded, violations et errors
+    """
+    budgets = load_budgets() if budgets is None else budgets
+    samples: Dict[str, List[float]] = {}
+    imports, errors, deferred = None, [], set()
+
+    def add(metric: str, value: float):
+        samples.setdefault(metric, []).append(value)
+
+    for _ in range(max(repeat, 1)):
+        imports = measure_imports()
+        deferred.update(deferred_loaded(imports["modules"]))
+        add("import.wall", imports["wall_s"])
+        for name in ("app",) + TRACKED_MODULES:
+            if name in imports["modules"]:
+                add(f"import.{name}", imports["modules"][name])
+        add("import.app.self", imports["self"].get("app", 0.0))
+
+        server = measure_server(timeout)
+        errors += server["errors"]
+        add("first_byte", server["first_byte_s"])
+        for tab, timings in server["tabs"].items():
+            add(f"tab.{tab}.cold", timings["cold_s"])
+            add(f"tab.{tab}.warm", timings["warm_s"])
+            add(f"tab.{tab}.warm_at", timings["warm_at_s"])
+
+    metrics = {metric: statistics.median(values) for metric, values in samples.items()}
+    violations = [
+        {"metric": metric, "seconds": value, "budget": budget_for(metric, budgets)}
+        for metric, value in metrics.items()
+        if budget_for(metric, budgets) is not None and value > budget_for(metric, budgets)
+    ]
+    return {"repeat": max(repeat, 1), "metrics": metrics, "budgets": budgets, "imports": imports,
+            "deferred_loaded": sorted(deferred), "violations": violations, "errors": errors}
+
+
+def print_report(report: Dict[str, Any], top: int = 15):
+    metrics, budgets = report["metrics"], report["budgets"]
+
+    def line(label: str, metric: str):
+        if metric not in metrics:
+            return
+        budget = budget_for(metric, budgets)
+        flag = " !" if budget is not None and metrics[metric] > budget else ""
+        limit = f"{budget:>8.2f}" if budget is not None else f"{'':>8}"
+        print(f"  {label:<28} {metrics[metric]:>8.3f} {limit}{flag}")
+
+    print(f"Démarrage (médiane de {report['repeat']} mesure(s), secondes)   budget")
+    line("processus import app", "import.wall")
+    line("import app (cumulé)", "import.app")
+    line("  dont module app (propre)", "import.app.self")
+    for name in TRACKED_MODULES:
+        line(f"  {name}", f"import.{name}")
+    line("premier octet (gunicorn)", "first_byte")
+
+    print(f"\n  {'Onglet':<10} {'froid':>8} {'chaud':>8} {'chaud à':>9}")
+    for tab in TABS:
+        if f"tab.{tab}.cold" in metrics:
+            print(f"  {tab:<10} {metrics[f'tab.{tab}.cold']:>8.3f} {metrics[f'tab.{tab}.warm']:>8.3f} "
+                  f"{metrics[f'tab.{tab}.warm_at']:>9.2f}")
+
+    if report["imports"] and top:
+        print("\nModules les plus lents (temps propre, dernière mesure):")
+        slowest = sorted(report["imports"]["self"].items(), key=lambda item: -item[1])[:top]
+        for name, seconds in slowest:
+            print(f"  {name:<48} {seconds:>8.3f}")
+
+    for module in report["deferred_loaded"]:
+        print(f"Module différé chargé au démarrage: {module}")
+    for error in report["errors"]:
+        print(f"Erreur: {error['request']} (statut {error['status']})")
+    if report["violations"]:
+        print(f"\n{len(report['violations'])} dépassement(s) de budget:")
+        for v in report["violations"]:
+            print(f"  {v['metric']}: {v['seconds']:.3f}s > {v['budget']:.2f}s")
+
+
+def main(argv=None) -> int:
+    parser = argparse.ArgumentParser(description="Temps de démarrage (imports, premier octet, onglets) et budgets")
+    parser.add_argument("--repeat", type=int, default=3, help="Nombre de mesures (médiane)")
+    parser.add_argument("--top", type=int, default=15, help="Modules les plus lents affichés")
+    parser.add_argument("--timeout", type=float, default=120.0, help="Délai maximal par requête (s)")
+    parser.add_argument("--json", help="Écrit le rapport complet dans ce fichier")
+    args = parser.parse_args(argv)
+
+    report = run_benchmark(args.repeat, timeout=args.timeout)
+    print_report(report, args.top)
+    if args.json:
+        with open(args.json, "w") as f:
+            json.dump(report, f, indent=2)
+        print(f"Rapport écrit dans {args.json}")
+    return 1 if report["violations"] or report["deferred_loaded"] or report["errors"] else 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
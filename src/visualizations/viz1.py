@@ -1,7 +1,10 @@
-from dash import html, dcc
-import pandas as pd
-import plotly.graph_objects as go
+from dash import html, dcc, dash_table
+import numpy as np
 from data_manager import data_manager
+import figure_builder as fb
+from aggregates import lttb_indices, month_to_season_matrix, weekly_totals
+from analytics import ANOMALY_WINDOW, ANOMALY_Z, SeriesAnalytics, series_columns, week_of_year_buckets
+import selection as shared_selection
 
 # Utilisation du gestionnaire de données centralisé au lieu de charger le CSV directement
 # df = pd.read_csv("data/actes-criminels.csv", parse_dates=["DATE"])  # ANCIEN CODE - SUPPRIMÉ
@@ -11,7 +14,35 @@ from data_manager import data_manager
 # season_map = {1: "Winter", 2: "Spring", 3: "Summer", 4: "Autumn"}  # ANCIEN CODE - SUPPRIMÉ
 # df["SEASON"] = df["SEASON"].map(season_map)  # ANCIEN CODE - SUPPRIMÉ
 
-def layout():
+# Les vues sont calculées à partir des agrégats de DataManager (cube de comptes
+# et comptes quotidiens) au lieu de regrouper les lignes à chaque appel.
+
+TIME_SERIES_VIEWS = ("Weekly", "Daily")
+DEFAULT_GRAPH_WIDTH = 1000
+
+ROLLING_DAYS = 28
+ROLLING_WEEKS = 4
+FORECAST_DAYS = 90
+FORECAST_WEEKS = 13
+
+ANOMALY_COLUMNS = [
+    {"name": "Date", "id": "date"},
+    {"name": "PDQ", "id": "pdq", "type": "numeric"},
+    {"name": "Crime type", "id": "category"},
+    {"name": "Crimes", "id": "count", "type": "numeric"},
+    {"name": "Baseline", "id": "baseline", "type": "numeric"},
+    {"name": "z", "id": "z", "type": "numeric"},
+]
+ANOMALY_PAGE_SIZE = 10
+
+_SEASON_MATRIX = month_to_season_matrix()
+
+
+def layout(selection=None):
+    cube = data_manager.get_count_cube()
+    selection = shared_selection.normalize_selection(selection)
+    pdq_value = selection["pdq"] if selection["pdq"] in cube.labels["pdq"] else None
+
     return html.Div([
         html.Label("Select view"),
         dcc.Dropdown(
@@ -19,12 +50,50 @@ def layout():
             options=[
                 {"label": "Yearly", "value": "Yearly"},
                 {"label": "Seasonal", "value": "Seasonal"},
-                {"label": "Monthly", "value": "Monthly"}
+                {"label": "Monthly", "value": "Monthly"},
+                {"label": "Weekly", "value": "Weekly"},
+                {"label": "Daily", "value": "Daily"}
             ],
             value="Yearly",
             clearable=False
         ),
 
+        html.Div([
+            html.Div([
+                html.Label("PDQ"),
+                dcc.Dropdown(
+                    id="viz1-pdq-dropdown",
+                    options=[{"label": "All PDQs", "value": "All"}] +
+                            [{"label": f"PDQ {p}", "value": p} for p in cube.labels["pdq"]],
+                    value=shared_selection.control_value(pdq_value),
+                    clearable=False
+                )
+            ], style={"width": "48%", "display": "inline-block"}),
+            html.Div([
+                html.Label("Crime type"),
+                dcc.Dropdown(
+                    id="viz1-category-dropdown",
+                    options=[{"label": "All crime types", "value": "All"}] +
+                            [{"label": c, "value": i} for i, c in enumerate(cube.labels["category"])],
+                    value=shared_selection.control_value(selection["category"]),
+                    clearable=False
+                )
+            ], style={"width": "48%", "display": "inline-block", "marginLeft": "4%"})
+        ], style={"marginTop": 10}),
+
+        html.Label("Overlays (weekly and daily views)"),
+        dcc.Checklist(
+            id="viz1-overlays",
+            options=[
+                {"label": "Rolling mean", "value": "rolling"},
+                {"label": "Seasonal baseline", "value": "baseline"},
+                {"label": "Forecast", "value": "forecast"},
+                {"label": "Anomalies", "value": "anomalies"}
+            ],
+            value=[],
+            inline=True
+        ),
+
         html.Label("Chart type"),
         dcc.RadioItems(
             id="viz1-chart-type",
@@ -36,53 +105,272 @@ def layout():
             inline=True
         ),
 
-        dcc.Graph(id="viz1-graph")
+        dcc.Store(id="viz1-graph-width"),
+        dcc.Graph(id="viz1-graph"),
+
+        html.H4("Flagged events"),
+        html.P("Days on which a PDQ's count of a crime type is well above its baseline "
+               f"(median of the previous {ANOMALY_WINDOW} days, robust z ≥ {ANOMALY_Z:g})."),
+        dash_table.DataTable(
+            id="viz1-anomaly-table",
+            columns=ANOMALY_COLUMNS,
+            data=[],
+            page_size=ANOMALY_PAGE_SIZE,
+            sort_action="native",
+            style_table={"overflowX": "auto"},
+            style_header={"padding": "10px", "border": "1px solid #ddd", "backgroundColor": "#f2f2f2",
+                          "fontWeight": "bold"},
+            style_cell={"padding": "8px", "border": "1px solid #ddd", "textAlign": "left"}
+        )
     ])
 
-def update_graph(view_option, chart_type):
-    # Utilisation du gestionnaire de données centralisé
-    df = data_manager.get_data_for_viz1()
-    
+
+def _selection(labels, selection):
+    """Codes PDQ / catégorie pour les agrégats (None = tous)"""
+    selection = shared_selection.normalize_selection(selection)
+    pdq_codes = shared_selection.pdq_codes(labels["pdq"], selection)
+    category_codes = None if selection["category"] is None else [selection["category"]]
+    return pdq_codes, category_codes
+
+
+def _year_codes(years, selection):
+    """Tranche de l'axe des années pour la plage sélectionnée (None = toutes)"""
+    selected = shared_selection.normalize_selection(selection)["years"]
+    if selected is None or not years:
+        return None
+    start = min(max(selected[0] - years[0], 0), len(years))
+    end = min(max(selected[1] - years[0] + 1, 0), len(years))
+    return slice(start, max(start, end))
+
+
+def parse_zoom_range(relayout_data):
+    """Plage de dates zoomée d'un relayoutData plotly, None si autorange"""
+    if not relayout_data:
+        return None
+    if "xaxis.range[0]" in relayout_data and "xaxis.range[1]" in relayout_data:
+        start, end = relayout_data["xaxis.range[0]"], relayout_data["xaxis.range[1]"]
+    elif "xaxis.range" in relayout_data:
+        start, end = relayout_data["xaxis.range"]
+    else:
+        return None
+    try:
+        return np.datetime64(str(start)[:10], "D"), np.datetime64(str(end)[:10], "D")
+    except ValueError:
+        return None
+
+
+def get_period_counts(view_option, selection=None):
+    """Totaux par année, saison ou mois à partir du cube de comptes"""
+    cube = data_manager.get_count_cube()
+    pdq_codes, category_codes = _selection(cube.labels, selection)
+    year_codes = _year_codes(cube.labels["year"], selection)
+
     if view_option == "Yearly":
-        df_view = df.groupby("YEAR").size().reset_index(name="Crimes")
-        df_view = df_view[df_view["YEAR"].between(2015, 2025)]
-        x_col = "YEAR"
-        chart_title = "Annual Crime Numbers"
-    elif view_option == "Seasonal":
-        df_view = df.groupby("SEASON").size().reset_index(name="Crimes")
-        season_order = ["Winter", "Spring", "Summer", "Autumn"]
-        df_view["SEASON"] = pd.Categorical(df_view["SEASON"], categories=season_order, ordered=True)
-        df_view = df_view.sort_values("SEASON")
-        x_col = "SEASON"
-        chart_title = "Seasonal Crime Numbers"
+        counts = cube.sum(keep=("year",), pdq=pdq_codes, category=category_codes)
+        years = np.asarray(cube.labels["year"])
+        in_range = (years >= 2015) & (years <= 2025)
+        selected_years = shared_selection.normalize_selection(selection)["years"]
+        if selected_years is not None:
+            in_range &= (years >= selected_years[0]) & (years <= selected_years[1])
+        return years[in_range], counts[in_range]
+    counts = cube.sum(keep=("month",), pdq=pdq_codes, category=category_codes, year=year_codes)
+    if view_option == "Seasonal":
+        return np.asarray(data_manager.get_labels("season", "en")), counts @ _SEASON_MATRIX
+    return np.asarray(cube.labels["month"]), counts
+
+
+def _overlays(view_option, dates, values, pdq_codes, category_codes, overlays):
+    """
+    Superpositions analytiques (pleine résolution) pour la série affichée
+
+    Returns:
+        dict nom -> tableau aligné sur dates ('anomalies': booléens), et
+        'forecast' -> (dates, moyenne, basse, haute)
+    """
+    if not overlays:
+        return {}
+
+    if view_option == "Daily":
+        daily = data_manager.get_daily_counts()
+        columns = series_columns(daily, pdq_codes, category_codes)
+        series = data_manager.get_series_analytics().select(columns)
+        step, horizon, window = np.timedelta64(1, "D"), FORECAST_DAYS, ROLLING_DAYS
     else:
-        df_view = df.groupby("MONTH").size().reset_index(name="Crimes")
-        x_col = "MONTH"
-        chart_title = "Monthly Crime Numbers"
+        series = SeriesAnalytics(values, week_of_year_buckets(dates), level_window=ROLLING_WEEKS)
+        step, horizon, window = np.timedelta64(7, "D"), FORECAST_WEEKS, ROLLING_WEEKS
+
+    result = {}
+    if "anomalies" in overlays:
+        # Jours où au moins une série PDQ x catégorie sélectionnée est signalée
+        daily = data_manager.get_daily_counts()
+        flagged = data_manager.get_anomaly_flags(pdq_codes, category_codes)
+        if view_option == "Weekly":
+            flagged = weekly_totals(daily.dates, flagged.astype(np.int64))[1] > 0
+        result["anomalies"] = flagged
+    if "rolling" in overlays:
+        result["rolling"] = series.rolling_mean(window)[:, 0]
+    if "baseline" in overlays:
+        result["baseline"] = series.baseline()[:, 0]
+    if "forecast" in overlays and len(dates):
+        future = dates[-1] + step * np.arange(1, horizon + 1)
+        mean, lower, upper = series.forecast(week_of_year_buckets(future))
+        result["forecast"] = (future, mean[:, 0], lower[:, 0], upper[:, 0])
+    return result
+
+
+def get_time_series(view_option, selection=None, zoom=None, width=None, overlays=()):
+    """
+    Série quotidienne ou hebdomadaire, réduite par LTTB à la largeur du graphique
+
+    Returns:
+        dict avec x, y (points affichés), median (plage visible), total_points
+        et overlays (séries analytiques alignées sur x, prévision)
+    """
+    daily = data_manager.get_daily_counts()
+    pdq_codes, category_codes = _selection(daily.labels, selection)
+
+    dates = daily.dates
+    values = daily.series(pdq_codes, category_codes)
+    if view_option == "Weekly":
+        dates, values = weekly_totals(dates, values)
+
+    extra = _overlays(view_option, dates, values, pdq_codes, category_codes, overlays)
+    forecast = extra.pop("forecast", None)
+
+    years = shared_selection.normalize_selection(selection)["years"]
+    if years is not None:
+        window = (np.datetime64(f"{years[0]}-01-01", "D"), np.datetime64(f"{years[1]}-12-31", "D"))
+        zoom = window if zoom is None else (max(zoom[0], window[0]), min(zoom[1], window[1]))
+
+    if zoom is not None:
+        visible = (dates >= zoom[0]) & (dates <= zoom[1])
+        dates, values = dates[visible], values[visible]
+        extra = {name: series[visible] for name, series in extra.items()}
+
+    # Les jours signalés restent affichés même si LTTB les écarte de la courbe
+    flagged = extra.pop("anomalies", None)
+    markers = None if flagged is None else (dates[flagged], values[flagged])
+
+    median_crimes = float(np.median(values)) if len(values) else 0.0
+    total_points = len(values)
+
+    threshold = int(width or DEFAULT_GRAPH_WIDTH)
+    if total_points > threshold:
+        keep = lttb_indices(values, threshold)
+        dates, values = dates[keep], values[keep]
+        extra = {name: series[keep] for name, series in extra.items()}
 
-    median_crimes = df_view["Crimes"].median()
+    if forecast is not None:
+        extra["forecast"] = forecast
+    if markers is not None:
+        extra["anomalies"] = markers
 
-    fig = go.Figure()
+    return {
+        "x": dates,
+        "y": values,
+        "median": median_crimes,
+        "total_points": total_points,
+        "overlays": extra
+    }
+
+
+def add_overlay_traces(fig, overlays, x, view_option):
+    """Ajoute les moyennes glissantes, la référence, la prévision et les anomalies au graphique"""
+    if "rolling" in overlays:
+        window = f"{ROLLING_DAYS}-day" if view_option == "Daily" else f"{ROLLING_WEEKS}-week"
+        fb.add_trace(fig, fb.trace("scatter", x=x, y=overlays["rolling"], mode="lines",
+                                   name=f"{window} rolling mean", line=dict(color="#2c3e50", width=2)))
+    if "baseline" in overlays:
+        fb.add_trace(fig, fb.trace("scatter", x=x, y=overlays["baseline"], mode="lines",
+                                   name="Seasonal baseline", line=dict(color="#27ae60", dash="dot")))
+    if "forecast" in overlays:
+        future, mean, lower, upper = overlays["forecast"]
+        fb.add_trace(fig, fb.trace(
+            "scatter",
+            x=np.concatenate([future, future[::-1]]),
+            y=np.concatenate([upper, lower[::-1]]),
+            fill="toself", fillcolor="rgba(142,68,173,0.15)", line=dict(width=0),
+            hoverinfo="skip", name="95% band"
+        ))
+        fb.add_trace(fig, fb.trace("scatter", x=future, y=mean, mode="lines", name="Forecast",
+                                   line=dict(color="#8e44ad", width=2)))
+    if "anomalies" in overlays:
+        marker_x, marker_y = overlays["anomalies"]
+        period = "Day" if view_option == "Daily" else "Week"
+        fb.add_trace(fig, fb.trace(
+            "scatter",
+            x=marker_x, y=marker_y, mode="markers", name="Anomalies",
+            marker=dict(color="#e74c3c", size=9, symbol="x"),
+            hovertemplate=f"<b>{period} with flagged events</b><br>%{{x}}: %{{y}} crimes<extra></extra>"
+        ))
+
+
+def get_anomaly_records(selection=None):
+    """Jours signalés pour la sélection partagée (lignes du tableau, plus récents d'abord)"""
+    daily = data_manager.get_daily_counts()
+    pdq_codes, category_codes = _selection(daily.labels, selection)
+    years = shared_selection.normalize_selection(selection)["years"]
+    events = data_manager.get_anomaly_events(pdq_codes, category_codes, years)
+    return [
+        {"date": str(date)[:10], "pdq": int(pdq), "category": category, "count": int(count),
+         "baseline": float(baseline), "z": float(z)}
+        for date, pdq, category, count, baseline, z in zip(
+            events["DATE"], events["PDQ"], events["CATEGORY"], events["COUNT"],
+            events["BASELINE"], events["Z"])
+    ]
+
+
+def update_graph(view_option, chart_type, selection=None, zoom=None, width=None, overlays=()):
+    total_points = None
+    series = None
+    if view_option in TIME_SERIES_VIEWS:
+        series = get_time_series(view_option, selection, zoom, width, overlays)
+        x, y, median_crimes, total_points = series["x"], series["y"], series["median"], series["total_points"]
+        chart_title = f"{view_option} Crime Numbers"
+    else:
+        x, y = get_period_counts(view_option, selection)
+        median_crimes = float(np.median(y)) if len(y) else 0.0
+        chart_title = {
+            "Yearly": "Annual Crime Numbers",
+            "Seasonal": "Seasonal Crime Numbers",
+            "Monthly": "Monthly Crime Numbers"
+        }[view_option]
+
+    if total_points is not None and total_points > len(x):
+        chart_title += f" ({len(x)} of {total_points} points shown, zoom in for full resolution)"
+
+    # Figure construite en dictionnaire (figure_builder): pas de validation plotly
+    # et colonnes encodées en tableaux typés
+    main_mode = "lines" if view_option in TIME_SERIES_VIEWS and len(x) > 1000 else "lines+markers"
+    fig = fb.figure()
     if chart_type == "Line":
-        fig.add_trace(go.Scatter(x=df_view[x_col], y=df_view["Crimes"], mode="lines+markers", name="Crimes"))
+        fb.add_trace(fig, fb.trace("scatter", x=x, y=y, mode=main_mode, name="Crimes"))
     else:
-        fig.add_trace(go.Bar(x=df_view[x_col], y=df_view["Crimes"], name="Crimes"))
+        fb.add_trace(fig, fb.trace("bar", x=x, y=y, name="Crimes"))
 
-    fig.add_trace(go.Scatter(
-        x=df_view[x_col],
-        y=[median_crimes] * len(df_view),
+    fb.add_trace(fig, fb.trace(
+        "scatter",
+        x=x,
+        y=np.full(len(x), median_crimes),
         mode="lines",
         name=f"Median: {median_crimes:.0f}",
         line=dict(color="red", dash="dash")
     ))
 
-    fig.update_layout(
-        title=chart_title,
-        xaxis_title=view_option,
-        yaxis_title="Number of Crimes",
+    if series is not None:
+        add_overlay_traces(fig, series["overlays"], x, view_option)
+
+    fb.update_layout(
+        fig,
+        title=dict(text=chart_title),
+        xaxis=dict(title=dict(text=view_option)),
+        yaxis=dict(title=dict(text="Number of Crimes")),
         hovermode="x",
-        legend_title="Legend"
+        legend=dict(title=dict(text="Legend"))
     )
 
-    return fig
+    if view_option in TIME_SERIES_VIEWS:
+        # Conserve le zoom de l'utilisateur tant que la sélection ne change pas
+        fb.update_layout(fig, uirevision=f"{view_option}-{shared_selection.selection_key(selection)}")
 
+    return fig
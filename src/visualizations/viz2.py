@@ -1,8 +1,10 @@
 from dash import dcc, html, Input, Output
+import numpy as np
 import pandas as pd
-import plotly.express as px
-import plotly.graph_objects as go
 from data_manager import data_manager
+import figure_builder as fb
+from analytics import SeriesAnalytics
+import selection as shared_selection
 
 # Utilisation du gestionnaire de données centralisé au lieu de charger le CSV directement
 # ANCIEN CODE SUPPRIMÉ:
@@ -60,82 +62,182 @@ pdq_names = {
     55: "Aéroport Montréal-Trudeau (Unité aéroportuaire)"
 }
 
-def filter_data(start_year, end_year, pdq=None):
+TIME_OF_DAY_LABELS = [
+    'Day (09:01–16:00)',
+    'Evening (16:01–00:00)',
+    'Night (00:01–08:00)'
+]
+DAY_TYPE_LABELS = ['Weekday', 'Weekend']
+NIGHT_SHIFT = 2
+TREND_WINDOW = 3
+
+
+def get_range_summary(selection=None):
     """
-    Filtre les données en utilisant le gestionnaire centralisé
+    Comptes nécessaires aux trois graphiques pour la sélection partagée
+
+    Calculés à partir des comptes cumulés par année de DataManager: la plage
+    d'années sélectionnée (toutes par défaut) est la différence de deux lignes
+    cumulées; PDQ / district et type de crime sont des index dans ces lignes.
+
+    Returns:
+        dict avec 'time_of_day' (Series), 'day_type' (Series) et
+        'night_trend' (DataFrame YEAR / Crimes)
     """
-    # Utilisation du gestionnaire de données avec cache
-    return data_manager.get_filtered_data(
-        start_year=start_year,
-        end_year=end_year,
-        pdq=pdq
-    )
+    prefix = data_manager.get_year_prefix_counts()
+    selection = shared_selection.normalize_selection(selection)
+    start_year, end_year = selection['years'] or (prefix.years[0], prefix.years[-1])
 
-import plotly.express as px
+    pdq_code = shared_selection.pdq_codes(prefix.labels['pdq'], selection)
+    if pdq_code is not None and not pdq_code:
+        # PDQ inconnu: aucune ligne (case « manquant » exclue)
+        return {
+            'time_of_day': pd.Series(dtype='int64'),
+            'day_type': pd.Series(dtype='int64'),
+            'night_trend': pd.DataFrame({'YEAR': [], 'Crimes': []})
+        }
+    if pdq_code is not None and len(pdq_code) == 1:
+        pdq_code = pdq_code[0]
+    category_code = selection['category']
 
-def create_bar_chart(df):
-    quart_counts = (
-        df["Time of Day"]
-          .value_counts()
-          .rename_axis("Time of Day")
-          .reset_index(name="Crimes")
-    )
+    counts = prefix.range_counts(start_year, end_year, pdq_code, category_code)
+    time_of_day = pd.Series(counts[:3].sum(axis=1), index=TIME_OF_DAY_LABELS)
+    day_type = pd.Series(counts[:, :2].sum(axis=0), index=DAY_TYPE_LABELS)
 
-    fig = px.bar(
-        quart_counts,
-        x="Time of Day",
-        y="Crimes",
-        color="Time of Day",
-        text="Crimes",
-        color_discrete_map=cute_colors,
-        title="Crime by Time of Day",
-    )
+    years, by_year = prefix.yearly(start_year, end_year, pdq_code, category_code)
+    night = by_year[:, NIGHT_SHIFT, :].sum(axis=1) if len(years) else np.array([], dtype=np.int64)
+    night_trend = pd.DataFrame({'YEAR': years, 'Crimes': night})
 
-    fig.update_traces(
-        texttemplate="%{text}",
-        textposition="outside",
-    )
+    # Même convention que value_counts / groupby: catégories absentes retirées, tri décroissant
+    return {
+        'time_of_day': time_of_day[time_of_day > 0].sort_values(ascending=False, kind='stable'),
+        'day_type': day_type[day_type > 0].sort_values(ascending=False, kind='stable'),
+        'night_trend': night_trend[night_trend['Crimes'] > 0].reset_index(drop=True)
+    }
 
-    fig.update_layout(
-        xaxis_title="Time of Day",
-        yaxis_title="Number of Crimes",
+def get_anomaly_years(selection=None):
+    """
+    Nombre de jours signalés par la détection d'anomalies, par année, pour la sélection
+
+    Returns:
+        Series année -> jours avec au moins une série PDQ x catégorie signalée
+    """
+    daily = data_manager.get_daily_counts()
+    selection = shared_selection.normalize_selection(selection)
+    pdq_codes = shared_selection.pdq_codes(daily.labels['pdq'], selection)
+    category_codes = None if selection['category'] is None else [selection['category']]
+    flagged = data_manager.get_anomaly_flags(pdq_codes, category_codes)
+    years = daily.dates[flagged].astype('datetime64[Y]').astype(np.int64) + 1970
+    return pd.Series(years).value_counts().sort_index()
+
+def create_bar_chart(time_of_day_counts):
+    # Même figure que px.bar(x="Time of Day", y="Crimes", color="Time of Day",
+    # text="Crimes"): une trace par moment de la journée, construite en
+    # dictionnaire (figure_builder) sans passer par plotly express
+    labels = [str(label) for label in time_of_day_counts.index]
+    counts = time_of_day_counts.to_numpy()
+    if not labels:
+        return _empty_bar_chart()
+
+    fig = fb.figure([
+        fb.trace(
+            "bar",
+            alignmentgroup="True",
+            hovertemplate="Time of Day=%{x}<br>Crimes=%{text}<extra></extra>",
+            legendgroup=label,
+            marker=dict(color=cute_colors[label], pattern=dict(shape="")),
+            name=label,
+            offsetgroup=label,
+            orientation="v",
+            showlegend=True,
+            text=[float(count)],
+            textposition="outside",
+            texttemplate="%{text}",
+            x=[label],
+            xaxis="x",
+            y=[int(count)],
+            yaxis="y",
+        )
+        for label, count in zip(labels, counts)
+    ])
+
+    fb.update_layout(
+        fig,
+        title=dict(text="Crime by Time of Day"),
+        xaxis=dict(anchor="y", domain=[0.0, 1.0], title=dict(text="Time of Day"),
+                   categoryorder="array", categoryarray=labels, ticklabeloverflow="allow"),
+        yaxis=dict(anchor="x", domain=[0.0, 1.0], title=dict(text="Number of Crimes"),
+                   range=[0, float(counts.max()) * 1.10], automargin=True),
+        legend=dict(title=dict(text="Time of Day"), tracegroupgap=0),
+        barmode="relative",
         hovermode="x",
-        legend_title_text="Time of Day",
     )
+    return fig
 
-    y_max = quart_counts["Crimes"].max()
-    fig.update_yaxes(range=[0, y_max * 1.10], automargin=True)
-    fig.update_xaxes(ticklabeloverflow="allow")
+
+def _empty_bar_chart():
+    """Figure de px.bar sans aucune ligne (PDQ sans crime): une trace vide sur l'axe de couleur"""
+    fig = fb.figure([fb.trace(
+        "bar",
+        alignmentgroup="True",
+        hovertemplate="Time of Day=%{marker.color}<br>Crimes=%{text}<extra></extra>",
+        legendgroup="",
+        marker=dict(color=[], coloraxis="coloraxis", pattern=dict(shape="")),
+        name="",
+        offsetgroup="",
+        orientation="v",
+        showlegend=False,
+        text=[],
+        textposition="outside",
+        texttemplate="%{text}",
+        x=[],
+        xaxis="x",
+        y=[],
+        yaxis="y",
+    )])
+    fb.update_layout(
+        fig,
+        title=dict(text="Crime by Time of Day"),
+        xaxis=dict(anchor="y", domain=[0.0, 1.0], title=dict(text="Time of Day"), ticklabeloverflow="allow"),
+        yaxis=dict(anchor="x", domain=[0.0, 1.0], title=dict(text="Number of Crimes"),
+                   range=[0, None], automargin=True),
+        coloraxis=dict(colorbar=dict(title=dict(text="Time of Day")),
+                       colorscale=fb.default_template()["layout"]["colorscale"]["sequential"]),
+        legend=dict(tracegroupgap=0, title=dict(text="Time of Day")),
+        barmode="relative",
+        hovermode="x",
+    )
     return fig
 
 
-def create_pie_chart(df):
-    day_counts = df['Day Type'].value_counts().reset_index()
-    day_counts.columns = ['Day Type', 'Crimes']
-    fig = go.Figure(go.Pie(
-        labels=day_counts['Day Type'],
-        values=day_counts['Crimes'],
+def create_pie_chart(day_type_counts):
+    labels = [str(label) for label in day_type_counts.index]
+    fig = fb.figure([fb.trace(
+        "pie",
+        labels=labels,
+        values=day_type_counts.to_numpy(),
         name='Day Type',
         hole=0.5,
-        marker=dict(colors=[cute_colors[k] for k in day_counts['Day Type']]),
+        marker=dict(colors=[cute_colors[k] for k in labels]),
         textinfo='label+percent',
         hoverinfo='label+percent+value'
-    ))
-    fig.update_layout(
-        title='Crimes: Weekday vs Weekend',
-        legend_title_text='Day Type'
+    )])
+    fb.update_layout(
+        fig,
+        title=dict(text='Crimes: Weekday vs Weekend'),
+        legend=dict(title=dict(text='Day Type'))
     )
     return fig
 
-def create_line_chart(df: pd.DataFrame):
-    night_df = df[df["Time of Day"] == "Night (00:01–08:00)"]
-    night_trend = night_df.groupby("YEAR").size().reset_index(name="Crimes")
+def create_line_chart(night_trend: pd.DataFrame, overlays=(), anomaly_years=None):
+    night_trend = night_trend.copy()
     night_trend["YoY Change (%)"] = night_trend["Crimes"].pct_change().fillna(0) * 100
 
     night_trend["YEAR"] = night_trend["YEAR"].astype(str)
 
-    fig = go.Figure(
-        go.Scatter(
+    fig = fb.figure([
+        fb.trace(
+            "scatter",
             x=night_trend["YEAR"],
             y=night_trend["Crimes"],
             mode="lines+markers",
@@ -146,33 +248,91 @@ def create_line_chart(df: pd.DataFrame):
             hovertemplate="<b>Year:</b> %{x}<br><b>Night Crimes:</b> %{y}"
                           "<br><b>YoY Change:</b> %{customdata[0]:.1f}%",
         )
-    )
+    ])
 
-    fig.update_layout(
-        title="Night-Time Crime Trends",
-        xaxis_title="Year",
-        yaxis_title="Number of Crimes",
+    fb.update_layout(
+        fig,
+        title=dict(text="Night-Time Crime Trends"),
+        xaxis=dict(title=dict(text="Year"), type="category"),
+        yaxis=dict(title=dict(text="Number of Crimes")),
         hovermode="x unified",
         showlegend=False,
     )
 
-    fig.update_xaxes(type="category")
+    if overlays and len(night_trend):
+        add_trend_overlays(fig, night_trend, overlays, anomaly_years)
     return fig
 
 
-def layout():
-    # Utilisation du gestionnaire de données pour obtenir les années disponibles
-    df_raw = data_manager.get_data_for_viz2()
-    available_years = sorted(df_raw['YEAR'].dropna().unique())
+def add_trend_overlays(fig, night_trend, overlays, anomaly_years=None):
+    """
+    Moyenne glissante sur 3 ans, prévision de l'année suivante (bande à 95 %)
+    et années comptant des jours signalés par la détection d'anomalies
+    """
+    series = SeriesAnalytics(night_trend["Crimes"].to_numpy(),
+                             np.zeros(len(night_trend), dtype=np.int64),
+                             n_buckets=1, level_window=TREND_WINDOW)
+    color = "#2c3e50"
+
+    if "rolling" in overlays:
+        fb.add_trace(fig, fb.trace(
+            "scatter",
+            x=night_trend["YEAR"],
+            y=series.rolling_mean(TREND_WINDOW)[:, 0],
+            mode="lines",
+            name=f"{TREND_WINDOW}-year rolling mean",
+            line=dict(width=2, dash="dash", color=color),
+            hovertemplate="<b>Rolling mean:</b> %{y:.0f}<extra></extra>"
+        ))
+
+    if "forecast" in overlays:
+        mean, lower, upper = series.forecast(np.zeros(1, dtype=np.int64))
+        next_year = str(int(night_trend["YEAR"].iloc[-1]) + 1)
+        fb.add_trace(fig, fb.trace(
+            "scatter",
+            x=[next_year],
+            y=mean[:, 0],
+            mode="markers",
+            name="Forecast",
+            marker=dict(size=12, symbol="diamond", color="#8e44ad"),
+            error_y=dict(type="data", symmetric=False,
+                         array=upper[:, 0] - mean[:, 0], arrayminus=mean[:, 0] - lower[:, 0]),
+            hovertemplate="<b>Forecast:</b> %{y:.0f}<extra></extra>"
+        ))
+
+    if "anomalies" in overlays and anomaly_years is not None:
+        flagged = anomaly_years.reindex(night_trend["YEAR"].astype(int)).fillna(0).to_numpy()
+        marked = flagged > 0
+        fb.add_trace(fig, fb.trace(
+            "scatter",
+            x=night_trend["YEAR"][marked],
+            y=night_trend["Crimes"][marked],
+            mode="markers",
+            name="Years with anomalies",
+            marker=dict(size=16, symbol="circle-open", color="#e74c3c", line=dict(width=2)),
+            customdata=flagged[marked],
+            hovertemplate="<b>Flagged days:</b> %{customdata:.0f}<extra></extra>"
+        ))
+
+    fb.update_layout(fig, showlegend=True)
+
+
+def layout(selection=None):
+    # Années et PDQ disponibles lus dans les agrégats (sans copie des données)
+    prefix = data_manager.get_year_prefix_counts()
+    available_years = prefix.years
     start_year = int(min(available_years))
     end_year = int(max(available_years))
 
+    selection = shared_selection.normalize_selection(selection)
+    pdq_value = selection['pdq'] if selection['pdq'] in prefix.labels['pdq'] else None
+    year_value = selection['years'] or [start_year, end_year]
+
     pdq_options = [{'label': 'All PDQs', 'value': 'All'}]
-    if 'PDQ' in df_raw.columns:
-        pdq_options += [
-            {'label': f"{p} – {pdq_names.get(p, f'PDQ {p}')}", 'value': p}
-            for p in sorted(df_raw['PDQ'].dropna().unique())
-        ]
+    pdq_options += [
+        {'label': f"{p} – {pdq_names.get(p, f'PDQ {p}')}", 'value': p}
+        for p in prefix.labels['pdq']
+    ]
 
     return html.Div([
         html.H3("Crime Analysis by Time and Day Type (2015–2025)"),
@@ -180,7 +340,8 @@ def layout():
 
         html.Div([
             html.Label("Select PDQ:"),
-            dcc.Dropdown(id='pdq-dropdown', options=pdq_options, value='All', clearable=False)
+            dcc.Dropdown(id='pdq-dropdown', options=pdq_options,
+                         value=shared_selection.control_value(pdq_value), clearable=False)
         ], style={'width': '40%', 'display': 'inline-block'}),
 
         html.Div([
@@ -190,13 +351,25 @@ def layout():
                 min=start_year,
                 max=end_year,
                 step=1,
-                value=[start_year, end_year],
+                value=year_value,
                 marks={year: str(year) for year in range(start_year, end_year + 1)}
             )
         ], style={'marginTop': 20}),
 
         dcc.Graph(id="bar-chart"),
         dcc.Graph(id="pie-chart"),
+
+        dcc.Checklist(
+            id="viz2-overlays",
+            options=[
+                {'label': 'Rolling mean', 'value': 'rolling'},
+                {'label': 'Forecast', 'value': 'forecast'},
+                {'label': 'Anomalies', 'value': 'anomalies'}
+            ],
+            value=[],
+            inline=True,
+            style={'marginTop': 20}
+        ),
         dcc.Graph(id="line-chart")
     ])
 
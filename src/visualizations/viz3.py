@@ -1,17 +1,44 @@
 from dash import html, dcc, callback, Input, Output, Patch
 import pandas as pd
-import geopandas as gpd
-import plotly.graph_objects as go
 import json
-from shapely.geometry import Point
 import numpy as np
 import os
 from data_manager import data_manager
+from figure_cache import cached_figure
+import figure_builder as fb
+import memory_accounting
+import precompute
+import selection as shared_selection
 
 _cached_figure = None
-_cached_data = None
-_cached_reduced_data = {}  
 _cached_geojson_path = None
+_cached_neighbourhoods = None
+
+# The spatial join, marker aggregates and neighbourhood districts live in the
+# dataset generation caches ('viz3.' keys): a reload never mixes generations.
+# geopandas is only imported by the join itself: serving the map needs the
+# marker aggregates and the geojson names, so a worker started from the build
+# artifacts (which leave out the join) never loads geopandas or shapely.
+MAP_DATA_KEY = "viz3.map_data"
+MARKERS_KEY = "viz3.markers"
+NEIGHBOURHOODS_KEY = "viz3.neighbourhood_districts"
+# Columns of the joined points used by the marker aggregates
+MAP_COLUMNS = ["Latitude", "Longitude", "PDQ", "YEAR", "CATEGORY_CODE", "District"]
+# Precompute task: joined points without geometries, passed to the aggregate tasks
+MAP_POINTS_TASK = "viz3.map_points"
+# Missing PDQ / year in the marker aggregates (never matches a selection)
+UNKNOWN = -1
+
+
+def evict_data_cache():
+    """Drop the joined GeoDataFrame and marker aggregates (rebuilt on next use)"""
+    data_manager.evict_generation_caches("viz3.")
+
+
+memory_accounting.register_cache("viz3.cached_markers", lambda: data_manager.generation_caches(MARKERS_KEY),
+                                 evict=lambda: data_manager.evict_generation_caches(MARKERS_KEY), priority=20)
+memory_accounting.register_cache("viz3.cached_data", lambda: data_manager.generation_caches(MAP_DATA_KEY),
+                                 evict=evict_data_cache, priority=30)
 
 def crime_hover_template(crime_type):
     return (
@@ -52,40 +79,38 @@ def _get_montreal_json_path():
     return _cached_geojson_path
 
 
-def load_and_process_data():
-    """OPTIMIZATION 2: Load data once with minimal processing"""
-    global _cached_data
+def get_neighbourhood_names():
+    """Neighbourhood names (NOM) in geojson feature order, read without geopandas"""
+    global _cached_neighbourhoods
+    if _cached_neighbourhoods is None:
+        with open(_get_montreal_json_path(), encoding="utf-8") as f:
+            features = json.load(f)["features"]
+        _cached_neighbourhoods = [feature["properties"]["NOM"] for feature in features]
+    return _cached_neighbourhoods
 
-    if _cached_data is not None:
-        return _cached_data
 
-    print("Loading and preprocessing data for optimal performance...")
+def load_and_process_data(generation=None):
+    """OPTIMIZATION 2: Load data once per dataset generation with minimal processing"""
+    generation = generation or data_manager.generation()
+    return generation.cached(MAP_DATA_KEY, lambda: _join_districts(generation))
 
-    CRIME_TRANSLATION = {
-        "Vol De Véhicule À Moteur": "Motor Vehicle Theft",
-        "Méfait": "Mischief",
-        "Vol Dans / Sur Véhicule À Moteur": "Theft From/In Motor Vehicle",
-        "Introduction": "Breaking And Entering",
-        "Vols Qualifiés": "Robbery",
-        "Infractions Entrainant La Mort": "Offences Causing Death"
-    }
+
+def _join_districts(generation):
+    import geopandas as gpd
+
+    print("Loading and preprocessing data for optimal performance...")
 
     montreal_json_path = _get_montreal_json_path()
     gdf_districts = gpd.read_file(montreal_json_path)
     
-    df = data_manager.get_data_for_viz3()
+    df = data_manager.get_data_for_viz3(generation)
 
     df = df.rename(columns={
-        "CATEGORIE": "CrimeType",
         "LONGITUDE": "Longitude",
         "LATITUDE": "Latitude",
         "PDQ": "PDQ"
     }).dropna(subset=["Longitude", "Latitude"])
 
-    df["CrimeType"] = df["CrimeType"].str.strip().str.lower().str.title()
-    df["CrimeType"] = df["CrimeType"].map(CRIME_TRANSLATION).fillna(df["CrimeType"])
-    df["PDQ"] = df["PDQ"].astype(str)
-
     df = df[
         (df["Latitude"].between(45.40, 45.70)) &
         (df["Longitude"].between(-73.95, -73.45))
@@ -97,74 +122,88 @@ def load_and_process_data():
     gdf_joined = gpd.sjoin(gdf_crimes, gdf_districts, how="left", predicate="within")
     gdf_joined["District"] = gdf_joined["NOM"]
 
-    _cached_data = {
+    print(f"Data optimized and cached: {len(gdf_joined)} crime records")
+    return {
         'gdf_joined': gdf_joined,
         'districts': gdf_districts
     }
 
-    print(f"Data optimized and cached: {len(gdf_joined)} crime records")
-    return _cached_data
 
+def _map_points(generation):
+    """Joined crime points without geometries (MAP_COLUMNS), input of the precompute tasks"""
+    return _join_districts(generation)['gdf_joined'][MAP_COLUMNS]
+
+
+def get_marker_aggregates(generation=None):
+    """Marker counts and positions of a dataset generation (see _marker_aggregates)"""
+    generation = generation or data_manager.generation()
+    return generation.cached(
+        MARKERS_KEY, lambda: _marker_aggregates(load_and_process_data(generation)['gdf_joined'][MAP_COLUMNS])
+    )
+
+
+def _marker_aggregates(points):
+    """OPTIMIZATION 6: Precompute what the markers need for any selection
+
+    Returns:
+        {'counts': crimes per (District, PDQ, YEAR, CATEGORY_CODE),
+         'positions': representative point of each (District, PDQ, CATEGORY_CODE)}
+        with UNKNOWN for a missing PDQ or year
+    """
+    points = points.dropna(subset=['District'])
+    points = pd.DataFrame({
+        'District': points['District'].astype(str).to_numpy(),
+        'PDQ': points['PDQ'].fillna(UNKNOWN).to_numpy().astype(np.int64),
+        'YEAR': points['YEAR'].fillna(UNKNOWN).to_numpy().astype(np.int64),
+        'CATEGORY_CODE': points['CATEGORY_CODE'].to_numpy().astype(np.int64),
+        'Latitude': points['Latitude'].to_numpy(),
+        'Longitude': points['Longitude'].to_numpy(),
+    })
+    points = points[points['CATEGORY_CODE'] >= 0]
+
+    counts = (points.groupby(['District', 'PDQ', 'YEAR', 'CATEGORY_CODE'], sort=True)
+                    .size().reset_index(name='count'))
+
+    # Middle point (in data order) of each group stays on the map for every selection
+    groups = points.groupby(['District', 'PDQ', 'CATEGORY_CODE'], sort=True).indices
+    keys = list(groups)
+    middle = np.array([groups[key][len(groups[key]) // 2] for key in keys], dtype=np.int64)
+    positions = pd.DataFrame(keys, columns=['District', 'PDQ', 'CATEGORY_CODE'])
+    positions['Latitude'] = points['Latitude'].to_numpy()[middle]
+    positions['Longitude'] = points['Longitude'].to_numpy()[middle]
+
+    print(f"Cached marker aggregates: {len(counts)} counts, {len(positions)} positions")
+    return {'counts': counts, 'positions': positions}
 
-def precompute_reduced_data(gdf_joined, max_points_per_district):
-    """OPTIMIZATION 6: Precompute and cache different reduction levels"""
-    global _cached_reduced_data
-    
-    cache_key = f"reduced_{max_points_per_district}"
-    if cache_key in _cached_reduced_data:
-        return _cached_reduced_data[cache_key]
-    
-    print(f"Precomputing reduced dataset for {max_points_per_district} points per district...")
-    
-    district_groups = gdf_joined.dropna(subset=['District']).groupby('District')
-    reduced_data = []
-    
-    for district, district_data in district_groups:
-        crime_counts = district_data['CrimeType'].value_counts()
-        top_crimes = crime_counts.head(max_points_per_district)
-        
-        for crime_type, count in top_crimes.items():
-            crime_subset = district_data[district_data['CrimeType'] == crime_type]
-            representative_idx = len(crime_subset) // 2
-            representative = crime_subset.iloc[representative_idx].copy()
-            representative['crime_count'] = count
-            reduced_data.append(representative)
-    
-    result = pd.DataFrame(reduced_data)
-    _cached_reduced_data[cache_key] = result
-    print(f"Cached reduced dataset: {len(result)} points")
-    return result
 
 def create_initial_figure():
-    """OPTIMIZATION 8: Create base figure using browser-cached geojson"""
+    """OPTIMIZATION 8: Create base figure using browser-cached geojson (plain figure dict, see figure_builder)"""
     print("Creating optimized base figure with browser-cached geojson...")
 
-    data = load_and_process_data()
-    districts = data['districts']
-
-    neighborhoods = districts["NOM"].tolist()
+    neighborhoods = get_neighbourhood_names()
     z_vals = [1] * len(neighborhoods)
 
-    fig = go.Figure()
-
-    fig.add_choroplethmapbox(
-        geojson="assets/montreal.json", 
+    fig = fb.figure([fb.trace(
+        "choroplethmapbox",
+        geojson="assets/montreal.json",
         locations=neighborhoods,
-        z=z_vals,
+        z=np.asarray(z_vals),
         featureidkey="properties.NOM",
         colorscale=[[0, "lightgrey"], [1, "lightgrey"]],
         showscale=False,
-        marker_opacity=0.2,
-        marker_line=dict(width=1.5, color="black"),
+        marker=dict(opacity=0.2, line=dict(width=1.5, color="black")),
         hovertemplate=base_hover_template(),
         name="Districts"
-    )
-
-    fig.update_layout(
-        mapbox_style="white-bg",
-        mapbox_zoom=8.5,
-        mapbox_center={"lat": 45.55, "lon": -73.6},
-        mapbox_bounds={"west": -74.1, "east": -73.3, "south": 45.35, "north": 45.75},
+    )])
+
+    fb.update_layout(
+        fig,
+        mapbox=dict(
+            style="white-bg",
+            zoom=8.5,
+            center={"lat": 45.55, "lon": -73.6},
+            bounds={"west": -74.1, "east": -73.3, "south": 45.35, "north": 45.75}
+        ),
         height=700,
         margin=dict(t=60, r=10, l=10, b=10),
         legend=dict(
@@ -188,11 +227,80 @@ def create_initial_figure():
     return fig
 
 
-def update_crime_traces(fig, max_points):
+def get_neighbourhood_districts(generation=None):
+    """SPVM district of each map neighbourhood (district of its most frequent PDQ)"""
+    generation = generation or data_manager.generation()
+    return generation.cached(NEIGHBOURHOODS_KEY, lambda: _neighbourhood_districts(generation))
+
+
+def _neighbourhood_districts(generation):
+    return _districts_of_neighbourhoods(load_and_process_data(generation)['gdf_joined'])
+
+
+def _districts_of_neighbourhoods(gdf_joined):
+    pairs = gdf_joined.dropna(subset=['District', 'PDQ']).groupby(['District', 'PDQ']).size()
+    dominant = pairs.sort_values(ascending=False, kind='stable').reset_index().drop_duplicates('District')
+    return {
+        name: shared_selection.pdq_district(int(pdq)) for name, pdq in zip(dominant['District'], dominant['PDQ'])
+    }
+
+
+# Spatial join once, then the marker aggregates and the neighbourhood districts
+# in parallel (see precompute.py); the join itself is not kept in the generation
+precompute.register_task(MAP_POINTS_TASK, lambda generation, inputs: _map_points(generation), kind=None)
+precompute.register_task(MARKERS_KEY, lambda generation, inputs: _marker_aggregates(inputs[MAP_POINTS_TASK]),
+                         deps=(MAP_POINTS_TASK,))
+precompute.register_task(NEIGHBOURHOODS_KEY,
+                         lambda generation, inputs: _districts_of_neighbourhoods(inputs[MAP_POINTS_TASK]),
+                         deps=(MAP_POINTS_TASK,))
+
+
+def filter_marker_counts(counts, selection=None):
+    """Marker counts matching the shared selection (crime type, PDQ / district, years)"""
+    selection = shared_selection.normalize_selection(selection)
+    mask = np.ones(len(counts), dtype=bool)
+    if selection['category'] is not None:
+        mask &= counts['CATEGORY_CODE'].to_numpy() == selection['category']
+    pdqs = shared_selection.selected_pdqs(selection)
+    if pdqs is not None:
+        mask &= np.isin(counts['PDQ'].to_numpy(), np.asarray(pdqs, dtype=np.int64))
+    if selection['years'] is not None:
+        years = counts['YEAR'].to_numpy()
+        mask &= (years >= selection['years'][0]) & (years <= selection['years'][1])
+    return counts[mask]
+
+
+def marker_points(max_points, selection=None, generation=None):
+    """Top crime types of each neighbourhood for the shared selection, one marker each
+
+    A marker counts the selected crimes of its neighbourhood and type; it sits
+    in the neighbourhood's busiest selected PDQ for that type (the PDQ shown
+    on hover and selected by a click).
+    """
+    generation = generation or data_manager.generation()
+    aggregates = get_marker_aggregates(generation)
+    counts = filter_marker_counts(aggregates['counts'], selection)
+
+    by_pdq = counts.groupby(['District', 'CATEGORY_CODE', 'PDQ'], sort=True)['count'].sum().reset_index()
+    by_pdq['crime_count'] = by_pdq.groupby(['District', 'CATEGORY_CODE'])['count'].transform('sum')
+    by_pdq['known_pdq'] = by_pdq['PDQ'] != UNKNOWN
+    markers = (by_pdq.sort_values(['District', 'CATEGORY_CODE', 'known_pdq', 'count', 'PDQ'],
+                                  ascending=[True, True, False, False, True], kind='stable')
+                     .drop_duplicates(['District', 'CATEGORY_CODE']))
+    markers = markers.sort_values(['District', 'crime_count', 'CATEGORY_CODE'],
+                                  ascending=[True, False, True], kind='stable')
+    markers = markers[markers.groupby('District').cumcount() < max_points]
+    markers = markers.merge(aggregates['positions'], on=['District', 'PDQ', 'CATEGORY_CODE'], how='left')
+
+    labels = data_manager.get_labels("category", "en", generation)
+    markers['CrimeType'] = [labels[code] for code in markers['CATEGORY_CODE']]
+    return markers[['Latitude', 'Longitude', 'PDQ', 'CATEGORY_CODE', 'CrimeType', 'District', 'crime_count']]
+
+
+def update_crime_traces(fig, max_points, selection=None):
     """OPTIMIZATION 10: Update only crime traces, not entire figure"""
-    data = load_and_process_data()
-    gdf_joined = data['gdf_joined']
-    reduced_gdf = precompute_reduced_data(gdf_joined, max_points)
+    generation = data_manager.generation()
+    markers = marker_points(max_points, selection, generation)
     
     COLOR_MAP = {
         "Motor Vehicle Theft": "#626ff5",
@@ -204,37 +312,68 @@ def update_crime_traces(fig, max_points):
     }
 
 
-    fig.data = fig.data[:1]
-    
+    fig["data"] = fig["data"][:1]
 
     for crime_type, color in COLOR_MAP.items():
-        crime_data = reduced_gdf[reduced_gdf["CrimeType"] == crime_type]
+        crime_data = markers[markers["CrimeType"] == crime_type]
         
         if not crime_data.empty:
             base_size = 8
-            sizes = np.minimum(20, base_size + (crime_data['crime_count'].fillna(0) / 10))
+            sizes = np.minimum(20, base_size + (crime_data['crime_count'] / 10))
+            # Hover and click data; a marker without a known PDQ selects nothing
+            pdqs = crime_data["PDQ"].astype(object).where(crime_data["PDQ"] != UNKNOWN, None)
 
-            fig.add_trace(go.Scattermapbox(
+            fb.add_trace(fig, fb.trace(
+                "scattermapbox",
                 lat=crime_data["Latitude"].values,
                 lon=crime_data["Longitude"].values,
                 mode="markers",
                 marker=dict(
-                    size=sizes.tolist(),
+                    size=sizes.values,
                     color=color,
                     opacity=0.8
                 ),
                 name=crime_type,
-                customdata=crime_data[["PDQ", "District", "crime_count"]].values,
+                customdata=np.column_stack([pdqs, crime_data["District"], crime_data["crime_count"],
+                                            crime_data["CATEGORY_CODE"]]),
                 hovertemplate=crime_hover_template(crime_type)
             ))
 
 
-    fig.update_layout(
-        title_text=f"Montreal Crime Map - Top {max_points} Crime Types per District"
+    district = shared_selection.normalize_selection(selection)['district']
+    if district is not None:
+        # Highlight the neighbourhoods of the selected SPVM district
+        districts = get_neighbourhood_districts(generation)
+        base = dict(fig["data"][0])
+        base["z"] = fb.array(np.array([int(districts.get(name) == district) for name in base["locations"]]))
+        base["colorscale"] = [[0, "lightgrey"], [1, "#00a4e4"]]
+        fig["data"][0] = base
+
+    fb.update_layout(
+        fig,
+        title=dict(text=f"Montreal Crime Map - Top {max_points} Crime Types per District")
     )
     
     return fig
 
+
+def selection_from_click(click_data):
+    """Selection changes for a map click: a crime marker (PDQ, crime type) or a neighbourhood (district)"""
+    if not click_data or not click_data.get('points'):
+        return {}
+    point = click_data['points'][0]
+    customdata = point.get('customdata')
+    if customdata and len(customdata) >= 4:
+        try:
+            return {'pdq': int(float(customdata[0])), 'category': int(customdata[3])}
+        except (TypeError, ValueError):
+            return {}
+    location = point.get('location')
+    if location is not None:
+        district = get_neighbourhood_districts().get(location)
+        return {'district': district} if district else {}
+    return {}
+
 def layout():
     """OPTIMIZATION 11: Simplified layout with faster initial load"""
     return html.Div([
@@ -281,27 +420,25 @@ def layout():
 
 def clear_cache():
     """Enhanced cache clearing"""
-    global _cached_figure, _cached_data, _cached_reduced_data, _cached_geojson_path
+    global _cached_figure, _cached_geojson_path, _cached_neighbourhoods
     _cached_figure = None
-    _cached_data = None
-    _cached_reduced_data = {}
     _cached_geojson_path = None
+    _cached_neighbourhoods = None
+    evict_data_cache()
     data_manager.clear_cache()
     print("All caches cleared")
     
 @callback(
     Output('crime-map', 'figure'),
-    [Input('max-points-slider', 'value')]
+    [Input('max-points-slider', 'value'),
+     Input(shared_selection.SELECTION_STORE, 'data')]
 )
-def update_map(max_points):
-    """Fast update using optimized trace management"""
-    if max_points == 3: 
-        return update_crime_traces(create_initial_figure(), max_points)
-    
+def update_map(max_points, selection=None):
+    """Fast update using optimized trace management (cached per selection)"""
+    key = (max_points, shared_selection.selection_key(selection))
     try:
-        current_fig = create_initial_figure()
-        return update_crime_traces(current_fig, max_points)
+        return cached_figure("viz3", key, lambda: update_crime_traces(create_initial_figure(), max_points, selection))
     except Exception as e:
         print(f"Update error: {e}")
-        return update_crime_traces(create_initial_figure(), max_points)
+        return update_crime_traces(create_initial_figure(), max_points, selection)
 
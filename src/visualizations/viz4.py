@@ -1,8 +1,16 @@
-from dash import html, dcc
+from dash import html, dcc, dash_table
+import numpy as np
 import pandas as pd
-import plotly.express as px
 import plotly.graph_objects as go
 from data_manager import data_manager
+import memory_accounting
+import precompute
+import selection as shared_selection
+
+# Statistics, PDQ table and base figure live in the dataset generation caches
+# ('viz4.' keys): a reload never mixes them with another dataset
+memory_accounting.register_cache("viz4.cached_stats", lambda: data_manager.generation_caches("viz4."),
+                                 evict=lambda: clear_cache(), priority=40)
 
 def create_pdq_dimension_table():
     """
@@ -55,173 +63,250 @@ def create_pdq_dimension_table():
     return pd.DataFrame.from_dict(pdq_data, orient='index').reset_index().\
            rename(columns={'index': 'PDQ'})
 
-def layout():
+def layout(selection=None):
     """
     Returns the layout for visualization 2 - Crime Scatter Plot
     """
     # Create the figure and PDQ table
-    fig = create_scatter_plot()
-    pdq_table = create_pdq_table()
+    selection = shared_selection.normalize_selection(selection)
+    fig = create_selection_figure(selection)
+    pdq_table = create_pdq_table([selection['district']] if selection['district'] else None)
     
     return html.Div([
         html.H3("Crime Scatter Plot Analysis"),
         html.P("This visualization shows the relationship between years, PDQs, and crime patterns in Montreal."),
         
-        # Original graph
-        dcc.Graph(figure=fig),
+        # Original graph (click a bubble to select its PDQ in every tab)
+        dcc.Graph(id='viz4-scatter', figure=fig),
         
         # PDQ Information Table
         html.Div([
             html.H4("PDQ (Police District) Reference Guide", style={'margin-top': '40px'}),
-            html.P("PDQ = Poste de quartier (Neighborhood Police Station). Use this table to understand what area each PDQ number represents:"),
+            html.P("PDQ = Poste de quartier (Neighborhood Police Station). Use this table to understand what area each PDQ number represents. Sort by clicking a column header and narrow the list by district or area type:"),
             pdq_table
         ])
     ])
 
-def create_pdq_table():
+PDQ_TABLE_COLUMNS = [
+    {'name': 'PDQ', 'id': 'PDQ', 'type': 'numeric'},
+    {'name': 'District', 'id': 'district'},
+    {'name': 'Area/Neighborhood', 'id': 'area'},
+    {'name': 'Type', 'id': 'type'},
+    {'name': 'Description', 'id': 'description'},
+    {'name': 'Total Crimes', 'id': 'total_crimes', 'type': 'numeric'},
+    {'name': 'Crimes Last Year', 'id': 'crimes_last_year', 'type': 'numeric'},
+    {'name': 'Change vs Previous Year (%)', 'id': 'change_last_year_pct', 'type': 'numeric'},
+]
+
+PDQ_TABLE_PAGE_SIZE = 10
+
+
+def get_pdq_table_data(generation=None):
     """
-    Create a formatted table showing PDQ information
+    PDQ metadata joined with precomputed crime totals (cached per dataset)
     """
+    generation = generation or data_manager.generation()
+    return generation.cached('viz4.table', lambda: _build_pdq_table(generation))
+
+
+def _build_pdq_table(generation):
     pdq_dim = create_pdq_dimension_table()
-    
-    # Sort by PDQ number for easy reference
-    pdq_dim = pdq_dim.sort_values('PDQ')
-    
+    stats = get_pdq_year_stats(generation)
+
+    totals = stats.groupby('PDQ')['crimes_this_year'].sum()
+    last_year = stats['YEAR'].max()
+    last = stats[stats['YEAR'] == last_year].set_index('PDQ')
+
+    table = pdq_dim.sort_values('PDQ').reset_index(drop=True)
+    table['total_crimes'] = table['PDQ'].map(totals).fillna(0).astype(int)
+    table['crimes_last_year'] = table['PDQ'].map(last['crimes_this_year']).fillna(0).astype(int)
+    table['change_last_year_pct'] = table['PDQ'].map(last['yoy_change_pct']).round(1)
+    return table
+
+
+def query_pdq_table(page_current=0, page_size=PDQ_TABLE_PAGE_SIZE, sort_by=None,
+                    districts=None, area_types=None):
+    """
+    Server-side filter, sort and pagination of the PDQ reference table
+
+    Returns:
+        (records for the requested page, total page count)
+    """
+    table = get_pdq_table_data()
+
+    if districts:
+        table = table[table['district'].isin(districts)]
+    if area_types:
+        table = table[table['type'].isin(area_types)]
+
+    # Sort entries come from the browser: unknown columns are ignored
+    known_columns = {column['id'] for column in PDQ_TABLE_COLUMNS}
+    sort_by = [s for s in sort_by or [] if isinstance(s, dict) and s.get('column_id') in known_columns]
+    if sort_by:
+        table = table.sort_values(
+            [s['column_id'] for s in sort_by],
+            ascending=[s.get('direction') == 'asc' for s in sort_by],
+            kind='stable'
+        )
+
+    page_size = page_size if page_size and page_size > 0 else PDQ_TABLE_PAGE_SIZE
+    page_count = max(1, -(-len(table) // page_size))
+    page_current = min(max(0, page_current or 0), page_count - 1)
+    page = table.iloc[page_current * page_size:(page_current + 1) * page_size]
+
+    return page.astype(object).where(page.notna(), None).to_dict('records'), page_count
+
+
+def create_pdq_table(districts=None):
+    """
+    Create the server-paginated PDQ reference table with district/type filters
+
+    Only the first page is embedded in the layout; the other pages are served by
+    the pdq-table callback as the user pages, sorts or filters.
+    """
+    pdq_dim = create_pdq_dimension_table()
+    first_page, page_count = query_pdq_table(districts=districts)
+
     return html.Div([
-        html.Table([
-            html.Thead([
-                html.Tr([
-                    html.Th("PDQ", style={'padding': '10px', 'border': '1px solid #ddd', 'background-color': '#f2f2f2'}),
-                    html.Th("District", style={'padding': '10px', 'border': '1px solid #ddd', 'background-color': '#f2f2f2'}),
-                    html.Th("Area/Neighborhood", style={'padding': '10px', 'border': '1px solid #ddd', 'background-color': '#f2f2f2'}),
-                    html.Th("Type", style={'padding': '10px', 'border': '1px solid #ddd', 'background-color': '#f2f2f2'}),
-                    html.Th("Description", style={'padding': '10px', 'border': '1px solid #ddd', 'background-color': '#f2f2f2'})
-                ])
-            ]),
-            html.Tbody([
-                html.Tr([
-                    html.Td(str(row['PDQ']), style={'padding': '8px', 'border': '1px solid #ddd'}),
-                    html.Td(row['district'], style={'padding': '8px', 'border': '1px solid #ddd'}),
-                    html.Td(row['area'], style={'padding': '8px', 'border': '1px solid #ddd'}),
-                    html.Td(row['type'], style={'padding': '8px', 'border': '1px solid #ddd'}),
-                    html.Td(row['description'], style={'padding': '8px', 'border': '1px solid #ddd'})
-                ]) for _, row in pdq_dim.iterrows()
-            ])
-        ], style={'border-collapse': 'collapse', 'width': '100%', 'margin-top': '20px'})
+        html.Div([
+            html.Div([
+                html.Label("District:"),
+                dcc.Dropdown(
+                    id='pdq-table-district',
+                    options=[{'label': d, 'value': d} for d in sorted(pdq_dim['district'].unique())],
+                    value=districts,
+                    multi=True,
+                    placeholder="All districts"
+                )
+            ], style={'width': '48%', 'display': 'inline-block'}),
+            html.Div([
+                html.Label("Type:"),
+                dcc.Dropdown(
+                    id='pdq-table-type',
+                    options=[{'label': t, 'value': t} for t in sorted(pdq_dim['type'].unique())],
+                    multi=True,
+                    placeholder="All types"
+                )
+            ], style={'width': '48%', 'display': 'inline-block', 'marginLeft': '4%'})
+        ], style={'margin-top': '20px'}),
+
+        dash_table.DataTable(
+            id='pdq-table',
+            columns=PDQ_TABLE_COLUMNS,
+            data=first_page,
+            page_current=0,
+            page_size=PDQ_TABLE_PAGE_SIZE,
+            page_count=page_count,
+            page_action='custom',
+            sort_action='custom',
+            sort_mode='multi',
+            sort_by=[],
+            style_table={'margin-top': '20px', 'overflowX': 'auto'},
+            style_header={'padding': '10px', 'border': '1px solid #ddd', 'backgroundColor': '#f2f2f2',
+                          'fontWeight': 'bold'},
+            style_cell={'padding': '8px', 'border': '1px solid #ddd', 'textAlign': 'left',
+                        'whiteSpace': 'normal', 'height': 'auto'}
+        )
     ])
 
-def create_scatter_plot():
+def pdq_year_counts(cube, category_labels):
+    """
+    Crimes per (PDQ, YEAR, CATEGORIE) from the count cube, with the dtypes of the
+    prepared table (PDQ float, YEAR int32, CATEGORIE categorical of the French labels)
+    """
+    counts = cube.sum(keep=('pdq', 'year', 'category'))
+    pdq, year, category = np.nonzero(counts)
+    return pd.DataFrame({
+        'PDQ': np.asarray(cube.labels['pdq'], dtype=np.float64)[pdq],
+        'YEAR': np.asarray(cube.labels['year'], dtype=np.int32)[year],
+        'CATEGORIE': pd.Categorical.from_codes(category, categories=category_labels),
+        'count': counts[pdq, year, category].astype(np.int64),
+    })
+
+
+def rank_pdq_year_counts(counts, pdq_dim=None):
+    """
+    Per-(PDQ, YEAR) crime statistics from (PDQ, YEAR, CATEGORIE, count) rows
+
+    Categories are ranked within each PDQ-year and PDQ metadata is joined once
+    on the small result.
+
+    Returns:
+        DataFrame with one row per PDQ-year: crimes_this_year, dominant_crime,
+        dominant_count, dominant_share, second_crime, second_count, second_share,
+        yoy_change_pct and PDQ_Info
+    """
+    if pdq_dim is None:
+        pdq_dim = create_pdq_dimension_table()
+
+    counts = counts[counts['count'] > 0]
+    # Rank categories within each PDQ-year (ties broken by category name)
+    counts = counts.sort_values(['PDQ', 'YEAR', 'count', 'CATEGORIE'],
+                                ascending=[True, True, False, True])
+    counts['rank'] = counts.groupby(['PDQ', 'YEAR']).cumcount()
+
+    keys = ['PDQ', 'YEAR']
+    totals = counts.groupby(keys)['count'].sum().rename('crimes_this_year')
+    first = counts[counts['rank'] == 0].set_index(keys)
+    second = counts[counts['rank'] == 1].set_index(keys)
+
+    stats = totals.to_frame()
+    stats['dominant_crime'] = first['CATEGORIE'].astype(str)
+    stats['dominant_count'] = first['count']
+    stats['second_crime'] = second['CATEGORIE'].astype(object).reindex(stats.index)
+    stats['second_count'] = second['count'].reindex(stats.index).fillna(0).astype(int)
+    stats['dominant_share'] = stats['dominant_count'] / stats['crimes_this_year']
+    stats['second_share'] = stats['second_count'] / stats['crimes_this_year']
+    stats = stats.reset_index()
+
+    stats['yoy_change_pct'] = stats.groupby('PDQ')['crimes_this_year'].pct_change() * 100
+
+    # Join PDQ metadata once on the aggregated rows
+    info = pdq_dim.set_index('PDQ')
+    info = ("PDQ " + info.index.astype(str) + " - " + info['area'] + " (" + info['type'] + "): "
+            + info['description'])
+    stats['PDQ_Info'] = stats['PDQ'].map(info).fillna("PDQ " + stats['PDQ'].astype(str))
+
+    return stats
+
+
+def get_pdq_year_stats(generation=None):
+    """
+    Cached PDQ-year statistics (computed once per dataset generation)
+
+    Counts come from the count cube: the prepared table is never read, so a
+    SQL backend does not materialize it.
+    """
+    generation = generation or data_manager.generation()
+    return generation.cached(
+        'viz4.stats', lambda: rank_pdq_year_counts(pdq_year_counts(
+            data_manager.get_count_cube(generation), data_manager.get_labels('category', 'fr', generation)
+        ))
+    )
+
+
+# Count cube, statistics, then the PDQ table and the base figure (see precompute.py)
+precompute.register_task('viz4.stats', lambda generation, inputs: get_pdq_year_stats(generation),
+                         deps=('count_cube',))
+precompute.register_task('viz4.table', lambda generation, inputs: get_pdq_table_data(generation),
+                         deps=('viz4.stats',))
+precompute.register_task('viz4.figure', lambda generation, inputs: create_scatter_plot(generation),
+                         deps=('viz4.stats',))
+
+
+def clear_cache():
+    """Drop cached statistics, figure and PDQ table"""
+    data_manager.evict_generation_caches("viz4.")
+
+
+def create_scatter_plot(generation=None):
     """
     Create the scatter plot figure with enhanced PDQ information
     """
     try:
-        # OPTIMISATION: Utilisation du gestionnaire de données centralisé
-        df = data_manager.get_data_for_viz4()
-        df['YEAR'] = df['DATE'].dt.year
-        
-        # Load PDQ dimension table
-        pdq_dim = create_pdq_dimension_table()
-        
-        # Create data points for each PDQ-Year combination
-        scatter_data = []
-        
-        # Create PDQ dimension table for tooltips
-        pdq_dim = create_pdq_dimension_table()
-        
-        for pdq in df['PDQ'].unique():
-            pdq_data = df[df['PDQ'] == pdq]
-            
-            # Get PDQ information for tooltip
-            pdq_info = pdq_dim[pdq_dim['PDQ'] == pdq]
-            if not pdq_info.empty:
-                area = pdq_info.iloc[0]['area']
-                area_type = pdq_info.iloc[0]['type']
-                description = pdq_info.iloc[0]['description']
-                pdq_tooltip = f"PDQ {pdq} - {area} ({area_type}): {description}"
-            else:
-                pdq_tooltip = f"PDQ {pdq}"
-            
-            # Get data for each year this PDQ had crimes
-            for year in pdq_data['YEAR'].unique():
-                year_data = pdq_data[pdq_data['YEAR'] == year]
-                
-                # Find dominant crime type for this PDQ-year
-                crime_counts = year_data['CATEGORIE'].value_counts()
-                dominant_crime = crime_counts.index[0] if len(crime_counts) > 0 else 'Unknown'
-                crimes_this_year = len(year_data)
-                
-                scatter_data.append({
-                    'YEAR': year,
-                    'PDQ': pdq,
-                    'PDQ_Info': pdq_tooltip,  # Add tooltip info
-                    'crimes_this_year': crimes_this_year,
-                    'dominant_crime': dominant_crime
-                })
-        
-        scatter_df = pd.DataFrame(scatter_data)
-        
-        # Create the scatter plot (keeping original design)
-        fig = px.scatter(
-            scatter_df,
-            x='YEAR',
-            y='PDQ',
-            color='dominant_crime',  # Back to original coloring
-            size='crimes_this_year',
-            hover_data={
-                'PDQ': True,
-                'YEAR': True,
-                'crimes_this_year': True,
-                'dominant_crime': True,
-                'PDQ_Info': True  # Add PDQ information to hover
-            },
-            title='Montreal Crime Analysis: Years vs PDQs',
-            labels={
-                'YEAR': 'Year',
-                'PDQ': 'Police District (PDQ)',
-                'dominant_crime': 'Crime Type',
-                'crimes_this_year': 'Crimes This Year',
-                'PDQ_Info': 'PDQ Information'
-            }
-        )
-        
-        # Customize the plot
-        fig.update_traces(
-            marker=dict(
-                opacity=0.7,
-                line=dict(width=1, color='white')
-            )
-        )
-        
-        fig.update_layout(
-            width=1000,
-            height=700,
-            plot_bgcolor='white',
-            xaxis=dict(
-                title='Year',
-                showgrid=True,
-                gridwidth=1,
-                gridcolor='lightgray',
-                zeroline=False
-            ),
-            yaxis=dict(
-                title='Police District (PDQ)',
-                showgrid=True,
-                gridwidth=1,
-                gridcolor='lightgray',
-                zeroline=False
-            ),
-            legend=dict(
-                title='Dominant Crime Type',
-                orientation="v",
-                yanchor="top",
-                y=1,
-                xanchor="left",
-                x=1.02
-            )
-        )
-        
-        return fig
-        
+        generation = generation or data_manager.generation()
+        return generation.cached('viz4.figure', lambda: _build_scatter_plot(generation))
+
     except Exception as e:
         # Return a simple error plot if data can't be loaded
         fig = go.Figure()
@@ -238,4 +323,123 @@ def create_scatter_plot():
             yaxis=dict(visible=False),
             height=400
         )
-        return fig
\ No newline at end of file
+        return fig
+
+
+def _build_scatter_plot(generation):
+    """Base scatter figure of a dataset generation (cached by create_scatter_plot)"""
+    # plotly.express is slow to import and only needed here (cold start without artifacts)
+    import plotly.express as px
+
+    scatter_df = get_pdq_year_stats(generation)
+
+    # Create the scatter plot (keeping original design)
+    fig = px.scatter(
+        scatter_df,
+        x='YEAR',
+        y='PDQ',
+        color='dominant_crime',  # Back to original coloring
+        size='crimes_this_year',
+        hover_data={
+            'PDQ': True,
+            'YEAR': True,
+            'crimes_this_year': True,
+            'dominant_crime': True,
+            'dominant_share': ':.0%',
+            'second_crime': True,
+            'yoy_change_pct': ':+.1f',
+            'PDQ_Info': True  # Add PDQ information to hover
+        },
+        title='Montreal Crime Analysis: Years vs PDQs',
+        labels={
+            'YEAR': 'Year',
+            'PDQ': 'Police District (PDQ)',
+            'dominant_crime': 'Crime Type',
+            'crimes_this_year': 'Crimes This Year',
+            'dominant_share': 'Share Of Dominant Type',
+            'second_crime': 'Second Crime Type',
+            'yoy_change_pct': 'Change vs Previous Year (%)',
+            'PDQ_Info': 'PDQ Information'
+        }
+    )
+
+    # Customize the plot
+    fig.update_traces(
+        marker=dict(
+            opacity=0.7,
+            line=dict(width=1, color='white')
+        )
+    )
+
+    fig.update_layout(
+        width=1000,
+        height=700,
+        plot_bgcolor='white',
+        xaxis=dict(
+            title='Year',
+            showgrid=True,
+            gridwidth=1,
+            gridcolor='lightgray',
+            zeroline=False
+        ),
+        yaxis=dict(
+            title='Police District (PDQ)',
+            showgrid=True,
+            gridwidth=1,
+            gridcolor='lightgray',
+            zeroline=False
+        ),
+        legend=dict(
+            title='Dominant Crime Type',
+            orientation="v",
+            yanchor="top",
+            y=1,
+            xanchor="left",
+            x=1.02
+        )
+    )
+
+    return fig
+
+
+def create_selection_figure(selection=None):
+    """
+    Scatter plot with the shared selection highlighted
+
+    Points outside the selected PDQs / district, year range or dominant crime
+    type are dimmed; the cached base figure is reused and never modified.
+    """
+    base = create_scatter_plot()
+    selection = shared_selection.normalize_selection(selection)
+    if selection == shared_selection.empty_selection():
+        return base
+
+    pdqs = shared_selection.selected_pdqs(selection)
+    years = selection['years']
+    crime = None
+    if selection['category'] is not None:
+        crime = data_manager.get_labels('category', 'fr')[selection['category']]
+
+    fig = go.Figure(base)
+    for trace in fig.data:
+        if trace.x is None or trace.y is None:
+            continue
+        x, y = np.asarray(trace.x), np.asarray(trace.y)
+        mask = np.ones(len(x), dtype=bool)
+        if pdqs is not None:
+            mask &= np.isin(y, pdqs)
+        if years is not None:
+            mask &= (x >= years[0]) & (x <= years[1])
+        if crime is not None and trace.name != crime:
+            mask[:] = False
+        trace.selectedpoints = np.flatnonzero(mask).tolist()
+        trace.unselected = dict(marker=dict(opacity=0.15))
+    return fig
+
+
+def selection_from_click(click_data):
+    """Selection changes for a click on a scatter bubble (its PDQ)"""
+    if not click_data or not click_data.get('points'):
+        return {}
+    pdq = click_data['points'][0].get('y')
+    return {'pdq': int(pdq)} if pdq is not None else {}
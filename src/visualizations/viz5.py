@@ -1,106 +1,102 @@
+import numpy as np
 import pandas as pd
 import plotly.graph_objects as go
 from dash import html, dcc
 from data_manager import data_manager
+from aggregates import month_to_season_matrix
+import selection as shared_selection
 
 # OPTIMISATION: Utilisation du gestionnaire de données centralisé au lieu de charger le CSV
 # ANCIEN CODE SUPPRIMÉ:
 # df = pd.read_csv("data/actes-criminels.csv")
 # Variables globales supprimées pour éviter les problèmes de performance
 
-def get_season(m):
-    return (
-        "Winter" if m in [12, 1, 2] else
-        "Spring" if m in [3, 4, 5] else
-        "Summer" if m in [6, 7, 8] else
-        "Fall"
-    )
+# Les heatmaps sont servies à partir du cube de comptes de DataManager:
+# chaque filtre est un découpage + somme, sans regroupement des lignes.
+
+HEATMAP_VIEWS = {
+    "time": ("By Time of Day", "Time"),
+    "season": ("By Season", "Season"),
+    "year": ("By Year", "Year"),
+}
+
+_SEASON_MATRIX = month_to_season_matrix()
+
+
+def _pdq_selection(cube, pdq=None, district=None):
+    """Codes de PDQ du cube pour le filtre PDQ / district (None = tous)"""
+    if pdq not in (None, "All"):
+        return cube.index_of('pdq', [int(pdq)])
+    if district not in (None, "All"):
+        return cube.index_of('pdq', shared_selection.district_pdqs().get(district, []))
+    return None
+
+
+def get_heatmap_data(pdq=None, district=None, years=None):
+    """
+    Matrices des heatmaps (catégorie x quart, saison, année) pour un filtre donné
+
+    Args:
+        pdq: Numéro de PDQ ou None/"All"
+        district: District SPVM (West, North, ...) ou None/"All"
+        years: [début, fin] inclus, ou None pour toutes les années
+
+    Returns:
+        (heat_time, heat_season, heat_year) sous forme de DataFrames
+    """
+    cube = data_manager.get_count_cube()
+    pdq_codes = _pdq_selection(cube, pdq, district)
+
+    all_years = cube.labels['year']
+    if years is not None and all_years:
+        start = max(int(years[0]), all_years[0]) - all_years[0]
+        end = min(int(years[1]), all_years[-1]) - all_years[0]
+        year_codes = slice(start, end + 1)
+        year_labels = all_years[start:end + 1]
+    else:
+        year_codes = None
+        year_labels = all_years
+
+    # Catégories observées dans l'ensemble des données: axe stable entre filtres
+    category_totals = cube.sum(keep=('category',))
+    categories = [c for c, total in zip(cube.labels['category'], category_totals) if total > 0]
+    rows = np.flatnonzero(category_totals > 0)
+
+    # Une seule sélection commune, puis trois sommes sur le petit sous-cube
+    # (catégorie, année, mois, quart); les quarts inconnus comptent hors vue horaire
+    sub = cube.sum(keep=('category', 'year', 'month', 'shift'), drop_missing=False,
+                   pdq=pdq_codes, year=year_codes)[rows]
+    if year_codes is None:
+        sub = sub[:, :len(all_years)]
+    by_month = sub[:, :, :12]
+
+    heat_time = pd.DataFrame(by_month[:, :, :, :3].sum(axis=(1, 2)), index=categories,
+                             columns=data_manager.get_labels('shift', 'en'))
+    heat_season = pd.DataFrame(by_month.sum(axis=(1, 3)) @ _SEASON_MATRIX, index=categories,
+                               columns=data_manager.get_labels('season', 'en'))
+    heat_year = pd.DataFrame(by_month.sum(axis=(2, 3)), index=categories, columns=year_labels)
 
-def get_processed_data():
-    """Obtient et traite les données pour viz5 avec mise en cache"""
-    df = data_manager.get_data_for_viz5()
-    
-    # Renommage des colonnes
-    df = df.rename(columns={
-        "CATEGORIE": "CrimeType",
-        "LONGITUDE": "Longitude",
-        "LATITUDE": "Latitude"
-    })
-    
-    # Nettoyage des données
-    df = df.dropna(subset=["DATE"])
-    df["Month"] = df["DATE"].dt.month
-    df["Season"] = df["Month"].apply(get_season)
-    df["CrimeType"] = df["CrimeType"].str.strip().str.lower().str.title()
-
-    # Traductions
-    time_translation = {
-        "Jour": "Day",
-        "Soir": "Evening",
-        "Nuit": "Night"
-    }
-
-    crime_translation = {
-        "Vol De Véhicule À Moteur": "Motor Vehicle Theft",
-        "Méfait": "Mischief",
-        "Vol Dans / Sur Véhicule À Moteur": "Theft From/In Motor Vehicle",
-        "Introduction": "Breaking And Entering",
-        "Vols Qualifiés": "Robbery",
-        "Infractions Entrainant La Mort": "Offences Causing Death"
-    }
-
-    df["QUART"] = df["QUART"].str.strip().str.capitalize().map(time_translation)
-    df["CrimeType"] = df["CrimeType"].map(crime_translation).fillna(df["CrimeType"])
-    
-    return df
-
-def get_heatmap_data():
-    """Calcule les données pour les heatmaps avec mise en cache"""
-    df = get_processed_data()
-    
-    heat_time = df.groupby(["CrimeType", "QUART"]).size().unstack(fill_value=0)
-    heat_season = df.groupby(["CrimeType", "Season"]).size().unstack(fill_value=0)
-    heat_year = df.groupby(["CrimeType", "YEAR"]).size().unstack(fill_value=0)
-    
     return heat_time, heat_season, heat_year
 
-def layout():
-    # Obtenir les données des heatmaps
-    heat_time, heat_season, heat_year = get_heatmap_data()
-    
-    fig = go.Figure()
 
-    fig.add_trace(go.Heatmap(
-        z=heat_time.values,
-        x=heat_time.columns,
-        y=heat_time.index,
-        colorscale="YlOrRd",
-        colorbar_title="Number of Crimes",
-        visible=True,
-        name="Time of Day",
-        hovertemplate="<b>Crime Type:</b> %{y}<br><b>Time:</b> %{x}<br><b>Count:</b> %{z}<extra></extra>"
-    ))
+def create_heatmap_figure(view="time", pdq=None, district=None, years=None, category=None):
+    """
+    Heatmap de la vue choisie pour le filtre donné
 
-    fig.add_trace(go.Heatmap(
-        z=heat_season.values,
-        x=heat_season.columns,
-        y=heat_season.index,
-        colorscale="YlOrRd",
-        colorbar_title="Number of Crimes",
-        visible=False,
-        name="Season",
-        hovertemplate="<b>Crime Type:</b> %{y}<br><b>Season:</b> %{x}<br><b>Count:</b> %{z}<extra></extra>"
-    ))
+    category: code du type de crime sélectionné, encadré dans la heatmap
+    """
+    heat_time, heat_season, heat_year = get_heatmap_data(pdq, district, years)
+    heat = {"time": heat_time, "season": heat_season, "year": heat_year}[view]
+    x_name = HEATMAP_VIEWS[view][1]
 
-    fig.add_trace(go.Heatmap(
-        z=heat_year.values,
-        x=heat_year.columns,
-        y=heat_year.index,
+    fig = go.Figure(go.Heatmap(
+        z=heat.values,
+        x=heat.columns,
+        y=heat.index,
         colorscale="YlOrRd",
         colorbar_title="Number of Crimes",
-        visible=False,
-        name="Year",
-        hovertemplate="<b>Crime Type:</b> %{y}<br><b>Year:</b> %{x}<br><b>Count:</b> %{z}<extra></extra>"
+        name=x_name,
+        hovertemplate=f"<b>Crime Type:</b> %{{y}}<br><b>{x_name}:</b> %{{x}}<br><b>Count:</b> %{{z}}<extra></extra>"
     ))
 
     fig.update_layout(
@@ -108,40 +104,78 @@ def layout():
         xaxis_title="Time Period",
         yaxis_title="Crime Type",
         height=600,
-        updatemenus=[
-            dict(
-                type="buttons",
-                direction="left",
-                buttons=list([
-                    dict(
-                        args=[{"visible": [True, False, False]}],
-                        label="By Time of Day",
-                        method="restyle"
-                    ),
-                    dict(
-                        args=[{"visible": [False, True, False]}],
-                        label="By Season",
-                        method="restyle"
-                    ),
-                    dict(
-                        args=[{"visible": [False, False, True]}],
-                        label="By Year",
-                        method="restyle"
-                    )
-                ]),
-                pad={"r": 10, "t": 10},
-                showactive=True,
-                x=0.01,
-                xanchor="left",
-                y=1.02,
-                yanchor="top"
-            ),
-        ]
     )
+    if view == "year":
+        fig.update_xaxes(type="category")
+
+    if category is not None:
+        labels = data_manager.get_labels('category', 'en')
+        if 0 <= category < len(labels) and labels[category] in heat.index:
+            row = list(heat.index).index(labels[category])
+            fig.add_shape(type="rect", xref="paper", yref="y", x0=0, x1=1,
+                          y0=row - 0.5, y1=row + 0.5, line=dict(color="#2c3e50", width=3))
+
+    return fig
+
+
+def selection_from_click(click_data):
+    """Changements de sélection pour un clic sur une cellule (type de crime)"""
+    if not click_data or not click_data.get('points'):
+        return {}
+    label = click_data['points'][0].get('y')
+    labels = data_manager.get_labels('category', 'en')
+    return {'category': labels.index(label)} if label in labels else {}
+
+
+def layout(selection=None):
+    cube = data_manager.get_count_cube()
+    years = cube.labels['year']
+    start_year, end_year = (years[0], years[-1]) if years else (2015, 2025)
+    selection = shared_selection.normalize_selection(selection)
+    pdq_value = selection['pdq'] if selection['pdq'] in cube.labels['pdq'] else None
+
+    pdq_options = [{'label': 'All PDQs', 'value': 'All'}] + [
+        {'label': f"PDQ {p}", 'value': p} for p in cube.labels['pdq']
+    ]
+    district_options = [{'label': 'All districts', 'value': 'All'}] + [
+        {'label': d, 'value': d} for d in sorted(shared_selection.district_pdqs())
+    ]
 
     return html.Div([
         html.H3("Crime Heatmap Analysis"),
-        html.P("Interactive heatmaps showing crime patterns across different time dimensions. Use the buttons above the chart to switch between views."),
-        dcc.Graph(figure=fig)
-    ])
+        html.P("Interactive heatmaps showing crime patterns across different time dimensions. Choose a view and narrow the data to a PDQ, a district or a range of years."),
+
+        dcc.RadioItems(
+            id="viz5-view",
+            options=[{"label": label, "value": value} for value, (label, _) in HEATMAP_VIEWS.items()],
+            value="time",
+            inline=True
+        ),
 
+        html.Div([
+            html.Div([
+                html.Label("Select PDQ:"),
+                dcc.Dropdown(id="viz5-pdq-dropdown", options=pdq_options,
+                             value=shared_selection.control_value(pdq_value), clearable=False)
+            ], style={'width': '48%', 'display': 'inline-block'}),
+            html.Div([
+                html.Label("Select District:"),
+                dcc.Dropdown(id="viz5-district-dropdown", options=district_options,
+                             value=shared_selection.control_value(selection['district']), clearable=False)
+            ], style={'width': '48%', 'display': 'inline-block', 'marginLeft': '4%'})
+        ], style={'marginTop': 20}),
+
+        html.Div([
+            html.Label("Select Year Range:"),
+            dcc.RangeSlider(
+                id="viz5-year-slider",
+                min=start_year,
+                max=end_year,
+                step=1,
+                value=selection['years'] or [start_year, end_year],
+                marks={year: str(year) for year in range(start_year, end_year + 1)}
+            )
+        ], style={'marginTop': 20}),
+
+        dcc.Graph(id="viz5-heatmap")
+    ])
@@ -0,0 +1,140 @@
+from dash import html, dcc
+import numpy as np
+import plotly.graph_objects as go
+from data_manager import data_manager
+import selection as shared_selection
+
+# Le calendrier est servi à partir des comptes quotidiens de DataManager
+# (jour x PDQ x catégorie, un seul np.bincount sur DATE): chaque filtre est un
+# découpage + somme de ce tableau, puis un placement vectorisé des jours dans
+# la grille semaines x jours de la semaine de chaque année.
+
+WEEKDAY_LABELS = ["Mon", "Tue", "Wed", "Thu", "Fri", "Sat", "Sun"]
+WEEKS_PER_YEAR = 54
+MONTH_LABELS = ["Jan", "Feb", "Mar", "Apr", "May", "Jun", "Jul", "Aug", "Sep", "Oct", "Nov", "Dec"]
+
+
+def get_daily_series(selection=None):
+    """
+    Série quotidienne (dates, comptes) pour la sélection partagée
+
+    Returns:
+        (dates datetime64[D], comptes int) sur toute la période couverte
+    """
+    daily = data_manager.get_daily_counts()
+    selection = shared_selection.normalize_selection(selection)
+    pdq_codes = shared_selection.pdq_codes(daily.labels["pdq"], selection)
+    category_codes = None if selection["category"] is None else [selection["category"]]
+    return daily.dates, daily.series(pdq_codes, category_codes)
+
+
+def calendar_grid(dates, counts, years=None):
+    """
+    Place une série quotidienne dans une grille calendrier
+
+    Chaque année occupe 7 lignes (lundi à dimanche) suivies d'une ligne vide;
+    la colonne est la semaine de l'année (la semaine 0 contient le 1er janvier).
+
+    Args:
+        dates: Jours de la série (datetime64[D])
+        counts: Comptes par jour
+        years: [début, fin] inclus, ou None pour toutes les années de la série
+
+    Returns:
+        (z, dates_par_case, années) où z est float (NaN hors période)
+    """
+    if len(dates) == 0:
+        return np.full((0, WEEKS_PER_YEAR), np.nan), np.empty((0, WEEKS_PER_YEAR), dtype=object), []
+
+    day_years = dates.astype("datetime64[Y]").astype(np.int64) + 1970
+    if years is not None:
+        keep = (day_years >= years[0]) & (day_years <= years[1])
+        dates, counts, day_years = dates[keep], counts[keep], day_years[keep]
+    year_list = list(range(int(day_years.min()), int(day_years.max()) + 1)) if len(dates) else []
+
+    # 1970-01-01 était un jeudi (3 avec lundi = 0)
+    weekday = (dates.astype(np.int64) + 3) % 7
+    jan_first = dates.astype("datetime64[Y]").astype("datetime64[D]")
+    jan_first_weekday = (jan_first.astype(np.int64) + 3) % 7
+    day_of_year = (dates - jan_first).astype(np.int64)
+    week = (day_of_year + jan_first_weekday) // 7
+
+    rows = (day_years - (year_list[0] if year_list else 0)) * 8 + weekday
+    shape = (max(len(year_list) * 8 - 1, 0), WEEKS_PER_YEAR)
+    z = np.full(shape, np.nan)
+    z[rows, week] = counts
+    labels = np.full(shape, None, dtype=object)
+    labels[rows, week] = np.datetime_as_string(dates, unit="D")
+    return z, labels, year_list
+
+
+def create_calendar_figure(selection=None):
+    """Heatmap calendrier (semaines x jours de la semaine, une bande par année)"""
+    selection = shared_selection.normalize_selection(selection)
+    dates, counts = get_daily_series(selection)
+    z, day_labels, years = calendar_grid(dates, counts, selection["years"])
+
+    fig = go.Figure(go.Heatmap(
+        z=z,
+        customdata=day_labels,
+        colorscale="YlOrRd",
+        colorbar_title="Incidents",
+        hoverongaps=False,
+        xgap=1,
+        ygap=1,
+        hovertemplate="<b>%{customdata}</b><br>Incidents: %{z}<extra></extra>"
+    ))
+
+    # Jours de la semaine à gauche de chaque bande, année sur le lundi
+    tickvals, ticktext = [], []
+    for i, year in enumerate(years):
+        for day in (0, 2, 4, 6):
+            tickvals.append(i * 8 + day)
+            ticktext.append(f"{year}  {WEEKDAY_LABELS[day]}" if day == 0 else WEEKDAY_LABELS[day])
+
+    # Mois: semaine du 1er de chaque mois (année non bissextile commençant un lundi)
+    month_starts = np.cumsum([0, 31, 28, 31, 30, 31, 30, 31, 31, 30, 31, 30])
+    fig.update_layout(
+        title=f"Daily Crime Calendar – {shared_selection.describe_selection(selection)}",
+        height=max(300, 24 + len(years) * 105),
+        margin=dict(l=90, r=20, t=60, b=30),
+        plot_bgcolor="rgba(0,0,0,0)",
+        yaxis=dict(autorange="reversed", tickvals=tickvals, ticktext=ticktext,
+                   showgrid=False, zeroline=False),
+        xaxis=dict(tickvals=(month_starts // 7).tolist(), ticktext=MONTH_LABELS,
+                   side="top", showgrid=False, zeroline=False),
+    )
+    return fig
+
+
+def layout(selection=None):
+    daily = data_manager.get_daily_counts()
+    selection = shared_selection.normalize_selection(selection)
+    pdq_value = selection["pdq"] if selection["pdq"] in daily.labels["pdq"] else None
+
+    return html.Div([
+        html.Div([
+            html.Div([
+                html.Label("PDQ"),
+                dcc.Dropdown(
+                    id="viz6-pdq-dropdown",
+                    options=[{"label": "All PDQs", "value": "All"}] +
+                            [{"label": f"PDQ {p}", "value": p} for p in daily.labels["pdq"]],
+                    value=shared_selection.control_value(pdq_value),
+                    clearable=False
+                )
+            ], style={"width": "48%", "display": "inline-block"}),
+            html.Div([
+                html.Label("Crime type"),
+                dcc.Dropdown(
+                    id="viz6-category-dropdown",
+                    options=[{"label": "All crime types", "value": "All"}] +
+                            [{"label": c, "value": i} for i, c in enumerate(daily.labels["category"])],
+                    value=shared_selection.control_value(selection["category"]),
+                    clearable=False
+                )
+            ], style={"width": "48%", "display": "inline-block", "marginLeft": "4%"})
+        ], style={"marginTop": 10}),
+
+        dcc.Loading(dcc.Graph(id="viz6-calendar"), type="circle")
+    ])
@@ -0,0 +1,191 @@
+from dash import html, dcc, dash_table
+import numpy as np
+import pandas as pd
+import plotly.graph_objects as go
+from data_manager import data_manager
+from analytics import compare_periods
+import selection as shared_selection
+
+# Comparaison de deux périodes pour toute la matrice PDQ x catégorie: les
+# comptes de chaque période sont une différence de deux lignes des comptes
+# quotidiens cumulés, et la variation, le z et la p-valeur sont calculés en
+# opérations sur la matrice entière (aucune boucle par PDQ).
+
+COMPARISON_COLUMNS = [
+    {"name": "PDQ", "id": "pdq", "type": "numeric"},
+    {"name": "Crime type", "id": "category"},
+    {"name": "Period A", "id": "count_a", "type": "numeric"},
+    {"name": "Period B", "id": "count_b", "type": "numeric"},
+    {"name": "Change", "id": "change", "type": "numeric"},
+    {"name": "Change (%)", "id": "pct_change", "type": "numeric"},
+    {"name": "z", "id": "z", "type": "numeric"},
+    {"name": "p-value", "id": "p_value", "type": "numeric"},
+    {"name": "Significant", "id": "significant"},
+]
+COMPARISON_PAGE_SIZE = 15
+
+
+def default_periods():
+    """Last full year of data (period B) and the year before (period A)"""
+    daily = data_manager.get_daily_counts()
+    dates = daily.dates
+    if len(dates) == 0:
+        return ["2023-01-01", "2023-12-31"], ["2024-01-01", "2024-12-31"]
+    last = dates[-1]
+    year = int(str(last)[:4])
+    if not str(last).endswith("12-31"):
+        year -= 1
+    return [f"{year - 1}-01-01", f"{year - 1}-12-31"], [f"{year}-01-01", f"{year}-12-31"]
+
+
+def get_comparison(period_a, period_b, selection=None):
+    """
+    Period-over-period comparison for every PDQ x crime type pair
+
+    Args:
+        period_a, period_b: [start, end] dates (inclusive, ISO strings)
+        selection: Shared selection (restricts PDQs / crime type)
+
+    Returns:
+        DataFrame with one row per pair, biggest movers (|z|) first
+    """
+    daily = data_manager.get_daily_counts()
+    counts_a, days_a = daily.period_totals(*period_a)
+    counts_b, days_b = daily.period_totals(*period_b)
+    n_pdq, n_cat = len(daily.labels["pdq"]), len(daily.labels["category"])
+    # Sans la case « manquant » des deux axes
+    counts_a, counts_b = counts_a[:n_pdq, :n_cat], counts_b[:n_pdq, :n_cat]
+
+    if days_a == 0 or days_b == 0:
+        result = {key: np.zeros((n_pdq, n_cat)) for key in ("change", "pct_change", "z", "p_value")}
+        result["significant"] = np.zeros((n_pdq, n_cat), dtype=bool)
+    else:
+        result = compare_periods(counts_a, counts_b, days_a, days_b)
+
+    table = pd.DataFrame({
+        "pdq": np.repeat(daily.labels["pdq"], n_cat),
+        "category_code": np.tile(np.arange(n_cat), n_pdq),
+        "category": np.tile(daily.labels["category"], n_pdq),
+        "count_a": counts_a.ravel(),
+        "count_b": counts_b.ravel(),
+        "change": result["change"].ravel().astype(int),
+        "pct_change": np.round(result["pct_change"].ravel(), 1),
+        "z": np.round(result["z"].ravel(), 2),
+        "p_value": result["p_value"].ravel(),
+        "significant": result["significant"].ravel(),
+    })
+    table = table[(table["count_a"] + table["count_b"]) > 0]
+
+    selection = shared_selection.normalize_selection(selection)
+    pdqs = shared_selection.selected_pdqs(selection)
+    if pdqs is not None:
+        table = table[table["pdq"].isin(pdqs)]
+    if selection["category"] is not None:
+        table = table[table["category_code"] == selection["category"]]
+
+    order = np.argsort(-np.abs(table["z"].to_numpy()), kind="stable")
+    return table.iloc[order].reset_index(drop=True)
+
+
+def create_comparison_figure(table, period_a, period_b):
+    """PDQ x crime type matrix of the rate change, significant cells marked with *"""
+    matrix = table.pivot(index="pdq", columns="category", values="pct_change").sort_index()
+    significant = table.pivot(index="pdq", columns="category", values="significant") \
+        .reindex(index=matrix.index, columns=matrix.columns)
+    text = np.where(significant.fillna(False).to_numpy(dtype=bool), "*", "")
+
+    fig = go.Figure(go.Heatmap(
+        z=matrix.values,
+        x=list(matrix.columns),
+        y=[f"PDQ {p}" for p in matrix.index],
+        text=text,
+        texttemplate="%{text}",
+        colorscale="RdBu_r",
+        zmid=0,
+        zmin=-100,
+        zmax=100,
+        colorbar_title="Change (%)",
+        hoverongaps=False,
+        hovertemplate="<b>%{y}</b> – %{x}<br>Change: %{z:+.1f}%<extra></extra>"
+    ))
+    fig.update_layout(
+        title=f"Change from {period_a[0]} – {period_a[1]} to {period_b[0]} – {period_b[1]} "
+              f"(* significant, |z| ≥ 1.96)",
+        height=max(400, 22 * len(matrix.index) + 140),
+        yaxis=dict(autorange="reversed", type="category"),
+        margin=dict(l=80, r=20, t=60, b=40),
+    )
+    return fig
+
+
+def table_records(table):
+    """Rows for the DataTable (row id = "<pdq>-<category code>")"""
+    records = table.assign(
+        id=table["pdq"].astype(str) + "-" + table["category_code"].astype(str),
+        significant=np.where(table["significant"], "yes", ""),
+        p_value=table["p_value"].map(lambda p: float(f"{p:.3g}")),
+    ).drop(columns="category_code")
+    records["pct_change"] = records["pct_change"].astype(object).where(records["pct_change"].notna(), None)
+    return records.to_dict("records")
+
+
+def selection_from_cell(active_cell):
+    """Selection changes for a clicked table row (PDQ and crime type)"""
+    if not active_cell or not active_cell.get("row_id"):
+        return {}
+    pdq, category = str(active_cell["row_id"]).split("-")
+    return {"pdq": int(pdq), "category": int(category)}
+
+
+def update_comparison(period_a, period_b, selection=None):
+    table = get_comparison(period_a, period_b, selection)
+    return create_comparison_figure(table, period_a, period_b), table_records(table)
+
+
+def layout(selection=None):
+    period_a, period_b = default_periods()
+    daily = data_manager.get_daily_counts()
+    dates = daily.dates
+    min_date = str(dates[0]) if len(dates) else None
+    max_date = str(dates[-1]) if len(dates) else None
+
+    def period_picker(picker_id, label, period):
+        return html.Div([
+            html.Label(label),
+            dcc.DatePickerRange(
+                id=picker_id,
+                start_date=period[0],
+                end_date=period[1],
+                min_date_allowed=min_date,
+                max_date_allowed=max_date,
+                display_format="YYYY-MM-DD"
+            )
+        ], style={"width": "48%", "display": "inline-block"})
+
+    return html.Div([
+        html.Div([
+            period_picker("viz7-period-a", "Period A", period_a),
+            html.Div(style={"width": "4%", "display": "inline-block"}),
+            period_picker("viz7-period-b", "Period B", period_b),
+        ], style={"marginTop": 10}),
+
+        dcc.Loading(dcc.Graph(id="viz7-matrix"), type="circle"),
+
+        dash_table.DataTable(
+            id="viz7-table",
+            columns=COMPARISON_COLUMNS,
+            data=[],
+            page_size=COMPARISON_PAGE_SIZE,
+            sort_action="native",
+            sort_mode="multi",
+            style_table={"margin-top": "20px", "overflowX": "auto"},
+            style_header={"padding": "10px", "border": "1px solid #ddd", "backgroundColor": "#f2f2f2",
+                          "fontWeight": "bold"},
+            style_cell={"padding": "8px", "border": "1px solid #ddd", "textAlign": "left",
+                        "whiteSpace": "normal", "height": "auto"},
+            style_data_conditional=[
+                {"if": {"filter_query": "{significant} = yes && {change} > 0"}, "color": "#c0392b"},
+                {"if": {"filter_query": "{significant} = yes && {change} < 0"}, "color": "#2471a3"},
+            ]
+        )
+    ])